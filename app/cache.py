@@ -0,0 +1,144 @@
+"""
+Public page cache
+Anonymous pages (the batch catalogue, the homepage) are built once per worker
+and served from memory as ready-to-send bytes with an ETag, so traffic spikes
+never reach Postgres.
+
+Each entry is tagged with the tables it was built from. Writers call
+notify(cursor, tag) inside their transaction; Postgres delivers the
+notification to every worker's listener thread when the transaction commits,
+and the listener drops the entries carrying that tag. Entries also expire
+after MAX_AGE seconds in case a notification is missed while a listener is
+reconnecting.
+"""
+
+import os
+import gzip
+import time
+import select
+import hashlib
+import threading
+import logging
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'public_cache'
+MAX_AGE = int(os.getenv('PUBLIC_CACHE_MAX_AGE', '600'))
+BROWSER_MAX_AGE = int(os.getenv('PUBLIC_CACHE_BROWSER_MAX_AGE', '60'))
+RECONNECT_DELAY = 5
+
+_entries = {}
+_lock = threading.Lock()
+_listener = None
+
+class Entry:
+    """A built response body with its validators and, optionally, its gzip encoding"""
+
+    def __init__(self, body, content_type, tags, compress=False):
+        self.body = body
+        self.content_type = content_type
+        self.tags = frozenset(tags)
+        self.etag = hashlib.sha1(body).hexdigest()[:20]
+        self.gzipped = gzip.compress(body, compresslevel=9, mtime=0) if compress else None
+        self.built_at = time.monotonic()
+
+    @property
+    def fresh(self):
+        return time.monotonic() - self.built_at < MAX_AGE
+
+def get(key, build, tags, compress=False):
+    """
+    Get a cached entry, building it on a miss
+
+    Args:
+        key: cache key
+        build: function returning (body bytes, content type)
+        tags: tables the body depends on, used by invalidate()
+        compress: also keep a gzip copy of the body for clients that accept it
+
+    Returns:
+        Entry
+    """
+    _ensure_listener()
+    entry = _entries.get(key)
+    if entry and entry.fresh:
+        return entry
+
+    with _lock:
+        entry = _entries.get(key)
+        if entry and entry.fresh:
+            return entry
+        body, content_type = build()
+        entry = Entry(body, content_type, tags, compress)
+        _entries[key] = entry
+        return entry
+
+def invalidate(tag=None):
+    """Drop this worker's entries carrying a tag (every entry when tag is None)"""
+    with _lock:
+        for key in [k for k, entry in _entries.items() if tag is None or tag in entry.tags]:
+            del _entries[key]
+
+def notify(cursor, tag):
+    """Invalidate a tag in every worker once the current transaction commits"""
+    cursor.execute("SELECT pg_notify(%s, %s)", (CHANNEL, tag))
+
+def respond(entry, request):
+    """Build the response for an entry, 304 when the client already has it"""
+    from flask import make_response
+
+    if request.if_none_match.contains(entry.etag):
+        response = make_response('', 304)
+    elif entry.gzipped is not None and 'gzip' in request.accept_encodings:
+        response = make_response(entry.gzipped)
+        response.headers['Content-Type'] = entry.content_type
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = make_response(entry.body)
+        response.headers['Content-Type'] = entry.content_type
+    response.set_etag(entry.etag)
+    response.headers['Cache-Control'] = f'public, max-age={BROWSER_MAX_AGE}'
+    if entry.gzipped is not None:
+        response.vary.add('Accept-Encoding')
+    return response
+
+# ============================================================
+# LISTENER
+# ============================================================
+
+def _ensure_listener():
+    """Start the worker's notification listener on first use"""
+    global _listener
+    if _listener is not None or not os.getenv('DATABASE_URL'):
+        return
+    with _lock:
+        if _listener is None:
+            _listener = threading.Thread(target=_listen, name='public-cache-listener', daemon=True)
+            _listener.start()
+
+def _listen():
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(os.getenv('DATABASE_URL'))
+            conn.autocommit = True
+            conn.cursor().execute(f"LISTEN {CHANNEL}")
+            # Anything cached before LISTEN may have missed a notification
+            invalidate()
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    invalidate(conn.notifies.pop(0).payload)
+        except Exception as e:
+            logger.warning(f"Public cache listener reconnecting: {e}")
+            invalidate()
+            time.sleep(RECONNECT_DELAY)
+        finally:
+            if conn:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
@@ -0,0 +1,224 @@
+"""
+Pilgrim dossier PDFs
+One printable file per traveler: personal details, batch itinerary, payment
+history and the passport, photo and vaccine scans. Rows are loaded in the web
+worker; render_dossier runs in the render pool and only sees plain data.
+"""
+
+import os
+from datetime import date
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from app import images, render_pool, storage
+from app.pdf_text import plain_value, cell_text
+
+DOSSIER_VERSION = 2  # Bump when the layout changes to invalidate cached files
+
+SECTIONS = [
+    ('Personal Details', [
+        ('first_name', 'First Name'), ('last_name', 'Last Name'), ('gender', 'Gender'),
+        ('dob', 'Date of Birth'), ('place_of_birth', 'Place of Birth'), ('wheelchair', 'Wheelchair'),
+        ('vaccine_status', 'Vaccine Status'), ('medical_notes', 'Medical Notes')
+    ]),
+    ('Passport', [
+        ('passport_name', 'Name on Passport'), ('passport_no', 'Passport No'),
+        ('passport_issue_date', 'Issue Date'), ('passport_expiry_date', 'Expiry Date'),
+        ('place_of_issue', 'Place of Issue'), ('passport_status', 'Status'),
+        ('passport_address', 'Passport Address')
+    ]),
+    ('Identity', [
+        ('aadhaar', 'Aadhaar'), ('pan', 'PAN'), ('aadhaar_pan_linked', 'Aadhaar-PAN Linked')
+    ]),
+    ('Family', [
+        ('father_name', "Father's Name"), ('mother_name', "Mother's Name"), ('spouse_name', 'Spouse Name')
+    ]),
+    ('Contact', [
+        ('mobile', 'Mobile'), ('email', 'Email'), ('mailing_address', 'Mailing Address'),
+        ('emergency_contact', 'Emergency Contact'), ('emergency_phone', 'Emergency Phone')
+    ]),
+    ('Office', [
+        ('file_reference', 'File Reference'), ('expected_return_date', 'Expected Return'),
+        ('created_at', 'Registered On')
+    ])
+]
+
+SCANS = [('passport_scan', 'Passport'), ('photo', 'Photo'), ('vaccine_scan', 'Vaccine Certificate')]
+
+# Only printed columns are loaded, so credentials such as the login PIN never
+# reach the render payload or the cache key
+TRAVELER_COLUMNS = ['id'] + [column for _, fields in SECTIONS for column, _ in fields] + \
+    [column for column, _ in SCANS]
+
+def _file_checksum(path):
+    return storage.sha256_from_filename(os.path.basename(path)) or storage.hash_file(path)
+
+def _scan_source(upload_root, path):
+    """Pick the file to embed: the medium preview of an image if one exists"""
+    if not images.is_image(path):
+        return None
+    preview = images.derivative_path(upload_root, path, 'medium', 'jpg')
+    return preview if os.path.isfile(preview) else path
+
+def load_dossiers(cursor, upload_root, traveler_ids):
+    """
+    Load everything a dossier shows for a list of travelers
+
+    Returns:
+        list: (traveler_id, cache key, payload) in the order given
+    """
+    cursor.execute(f"""
+        SELECT {', '.join('t.' + column for column in TRAVELER_COLUMNS)},
+               b.batch_name, b.departure_date, b.return_date, b.status as batch_status,
+               b.price as batch_price, b.description as batch_description
+        FROM travelers t
+        LEFT JOIN batches b ON t.batch_id = b.id
+        WHERE t.id = ANY(%s)
+    """, (list(traveler_ids),))
+    travelers = {row['id']: row for row in cursor.fetchall()}
+
+    cursor.execute("""
+        SELECT traveler_id, payment_date, amount, payment_method, status, installment,
+               reference
+        FROM payments
+        WHERE traveler_id = ANY(%s)
+        ORDER BY payment_date, id
+    """, (list(traveler_ids),))
+    payments = {}
+    for row in cursor.fetchall():
+        payments.setdefault(row['traveler_id'], []).append(plain_value(dict(row)))
+
+    results = []
+    for traveler_id in traveler_ids:
+        row = travelers.get(traveler_id)
+        if not row:
+            continue
+        traveler = plain_value(dict(row))
+
+        scans = []
+        checksums = {}
+        for column, label in SCANS:
+            path = storage.find_document(upload_root, traveler_id, column, row[column])
+            if path:
+                checksums[column] = _file_checksum(path)
+            scans.append({
+                'label': label,
+                'filename': row[column],
+                'path': _scan_source(upload_root, path) if path else None,
+                'is_pdf': bool(path) and path.lower().endswith('.pdf'),
+                'missing': bool(row[column]) and not path
+            })
+
+        payload = {
+            'traveler': traveler,
+            'payments': payments.get(traveler_id, []),
+            'scans': scans,
+            'generated_on': date.today().isoformat()
+        }
+        key = render_pool.cache_key(
+            DOSSIER_VERSION, traveler, payload['payments'], checksums, [s['path'] for s in scans]
+        )
+        results.append((traveler_id, key, payload))
+    return results
+
+def submit_dossier(upload_root, traveler_id, key, payload):
+    """Get a Future resolving to the cached dossier PDF path"""
+    return render_pool.render_cached(upload_root, 'dossiers', f"traveler_{traveler_id}", key, render_dossier, payload)
+
+# ============================================================
+# RENDERING (runs in the render pool)
+# ============================================================
+
+def render_dossier(output_path, payload):
+    """Render one traveler dossier to output_path"""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import cm
+    from reportlab.lib.utils import ImageReader
+    from reportlab.platypus import (SimpleDocTemplate, Paragraph, Spacer, Table,
+                                    TableStyle, Image, PageBreak, KeepTogether)
+
+    styles = getSampleStyleSheet()
+    small = styles['BodyText'].clone('small', fontSize=8, leading=10)
+    traveler = payload['traveler']
+    story = []
+
+    name = f"{traveler.get('first_name') or ''} {traveler.get('last_name') or ''}".strip()
+    story.append(Paragraph(f"Pilgrim Dossier - {escape(name)}", styles['Title']))
+    story.append(Paragraph(
+        f"Passport {escape(cell_text(traveler.get('passport_no')))} &nbsp;|&nbsp; Batch {escape(cell_text(traveler.get('batch_name')))}"
+        f" &nbsp;|&nbsp; Generated {cell_text(payload['generated_on'])}", styles['Normal']))
+    story.append(Spacer(1, 0.4 * cm))
+
+    grid = TableStyle([
+        ('GRID', (0, 0), (-1, -1), 0.25, colors.grey),
+        ('BACKGROUND', (0, 0), (0, -1), colors.whitesmoke),
+        ('BACKGROUND', (2, 0), (2, -1), colors.whitesmoke),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('FONTSIZE', (0, 0), (-1, -1), 8)
+    ])
+
+    for title, fields in SECTIONS:
+        cells = [(label, Paragraph(escape(cell_text(traveler.get(column))), small)) for column, label in fields]
+        rows = []
+        for i in range(0, len(cells), 2):
+            pair = cells[i:i + 2] + [('', '')] * (2 - len(cells[i:i + 2]))
+            rows.append([pair[0][0], pair[0][1], pair[1][0], pair[1][1]])
+        table = Table(rows, colWidths=[3.2 * cm, 5.3 * cm, 3.2 * cm, 5.3 * cm])
+        table.setStyle(grid)
+        story.append(KeepTogether([Paragraph(title, styles['Heading3']), table]))
+
+    # Batch itinerary
+    story.append(Paragraph('Batch Itinerary', styles['Heading3']))
+    itinerary = Table([
+        ['Batch', cell_text(traveler.get('batch_name')), 'Status', cell_text(traveler.get('batch_status'))],
+        ['Departure', cell_text(traveler.get('departure_date')), 'Return', cell_text(traveler.get('return_date'))],
+        ['Package Price', f"Rs. {cell_text(traveler.get('batch_price'))}", '', ''],
+        ['Details', Paragraph(escape(cell_text(traveler.get('batch_description'))), small), '', '']
+    ], colWidths=[3.2 * cm, 5.3 * cm, 3.2 * cm, 5.3 * cm])
+    itinerary.setStyle(grid)
+    itinerary.setStyle(TableStyle([('SPAN', (1, 3), (3, 3))]))
+    story.append(itinerary)
+
+    # Payment history
+    story.append(Paragraph('Payment History', styles['Heading3']))
+    rows = [['Date', 'Installment', 'Method', 'Reference', 'Status', 'Amount (Rs.)']]
+    paid = Decimal('0')
+    for p in payload['payments']:
+        rows.append([cell_text(p.get('payment_date')), cell_text(p.get('installment')), cell_text(p.get('payment_method')),
+                     cell_text(p.get('reference')), cell_text(p.get('status')), f"{Decimal(p['amount'] or 0):,.2f}"])
+        if p.get('status') == 'completed':
+            paid += Decimal(p['amount'] or 0)
+    if len(rows) == 1:
+        rows.append(['No payments recorded', '', '', '', '', ''])
+    rows.append(['', '', '', '', 'Total Paid', f"{paid:,.2f}"])
+    payments = Table(rows, colWidths=[2.4 * cm, 3 * cm, 2.4 * cm, 3.8 * cm, 2.4 * cm, 3 * cm], repeatRows=1)
+    payments.setStyle(TableStyle([
+        ('GRID', (0, 0), (-1, -2), 0.25, colors.grey),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+        ('ALIGN', (-1, 0), (-1, -1), 'RIGHT'),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('FONTNAME', (-2, -1), (-1, -1), 'Helvetica-Bold')
+    ]))
+    story.append(payments)
+
+    # Scans, one per page
+    for scan in payload['scans']:
+        story.append(PageBreak())
+        story.append(Paragraph(scan['label'], styles['Heading2']))
+        if scan['path']:
+            width, height = ImageReader(scan['path']).getSize()
+            scale = min((17 * cm) / width, (22 * cm) / height)
+            story.append(Image(scan['path'], width=width * scale, height=height * scale))
+        elif scan['is_pdf']:
+            story.append(Paragraph(f"Stored as PDF ({escape(scan['filename'])}) - print separately.", styles['Normal']))
+        elif scan['missing']:
+            story.append(Paragraph(f"File missing ({escape(scan['filename'])}) - upload it again.", styles['Normal']))
+        else:
+            story.append(Paragraph('Not uploaded.', styles['Normal']))
+
+    doc = SimpleDocTemplate(output_path, pagesize=A4, leftMargin=2 * cm, rightMargin=2 * cm,
+                            topMargin=1.5 * cm, bottomMargin=1.5 * cm, title=f"Dossier {name}")
+    doc.build(story)
+    return output_path
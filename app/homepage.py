@@ -0,0 +1,232 @@
+"""
+Public homepage
+The homepage is rendered on the server from templates/index.html with the
+frontpage_settings row and the open batches embedded, so the first paint needs
+no API calls. The page only changes when settings or batches do, so it is
+built once per worker and kept in app.cache as a gzip-compressed byte string,
+keyed by day because the alert banner has start and end dates.
+"""
+
+import re
+import json
+from urllib.parse import urlsplit
+from datetime import datetime, date
+from zoneinfo import ZoneInfo
+
+from app import templating, rollups
+from app.database import get_db, release_db
+from app.routes.batches import get_open_batches
+
+CACHE_TAGS = ('batches', 'frontpage_settings')
+
+# Editable frontpage_settings columns
+SETTINGS_FIELDS = [
+    'hero_heading', 'hero_subheading', 'hero_button_text', 'hero_button_link',
+    'hero_color1', 'hero_color2', 'packages_title',
+    'footer_text', 'footer_phone', 'footer_email',
+    'facebook_url', 'twitter_url', 'instagram_url',
+    'font_family', 'primary_color', 'secondary_color',
+    'alert_enabled', 'alert_message', 'alert_link', 'alert_color', 'alert_style',
+    'alert_start_date', 'alert_end_date',
+    'whatsapp_number', 'whatsapp_message', 'booking_email', 'email_subject',
+    'whatsapp_enabled', 'email_enabled', 'packages', 'features'
+]
+JSON_FIELDS = ('packages', 'features')
+DATE_FIELDS = ('alert_start_date', 'alert_end_date')
+COLOR_FIELDS = ('hero_color1', 'hero_color2', 'primary_color', 'secondary_color', 'alert_color')
+LINK_FIELDS = ('hero_button_link', 'alert_link', 'facebook_url', 'twitter_url', 'instagram_url')
+
+# What the page showed before settings were stored in the database
+DEFAULTS = {
+    'hero_heading': 'Your Journey to the Holy Land',
+    'hero_subheading': 'Experience the spiritual journey of a lifetime with our premium Haj and Umrah packages. Book early for best prices!',
+    'hero_button_text': 'View Packages',
+    'hero_button_link': '#packages',
+    'hero_color1': '#1e3c72',
+    'hero_color2': '#3498db',
+    'packages_title': 'Our Haj & Umrah Packages',
+    'footer_text': '© 2026 Alhudha Haj Travel System. All rights reserved.',
+    'footer_phone': '+91 98765 43210',
+    'footer_email': 'info@alhudha.com',
+    'whatsapp_number': '919876543210',
+    'booking_email': 'bookings@alhudha.com',
+    'primary_color': '#1e3c72',
+    'secondary_color': '#f1c40f',
+    'alert_color': '#f39c12',
+    'alert_style': 'pulse'
+}
+ALERT_STYLES = ('pulse', 'blink', 'static')
+COLOR_PATTERN = re.compile(r'^#[0-9a-fA-F]{3}([0-9a-fA-F]{3})?$')
+LINK_SCHEMES = ('http', 'https', 'mailto', 'tel')
+
+def is_safe_link(value):
+    """Check that a link is relative, a #fragment or uses an allowed scheme (no javascript:)"""
+    if not isinstance(value, str) or any(ord(ch) < 32 or ch == '\x7f' for ch in value):
+        return False
+    try:
+        scheme = urlsplit(value.strip()).scheme.lower()
+    except ValueError:
+        return False
+    return scheme == '' or scheme in LINK_SCHEMES
+
+def load_settings(cursor):
+    """The frontpage_settings row as a dict, empty when none has been saved"""
+    cursor.execute("SELECT * FROM frontpage_settings ORDER BY id LIMIT 1")
+    row = cursor.fetchone()
+    return dict(row) if row else {}
+
+def save_settings(cursor, data):
+    """
+    Write the editable fields present in data to the settings row
+
+    Returns:
+        dict: the saved row
+
+    Raises:
+        ValueError: for a malformed date, colour, alert style, link or list
+    """
+    values = {}
+    for field in SETTINGS_FIELDS:
+        if field not in data:
+            continue
+        value = data[field]
+        if field in DATE_FIELDS or field in COLOR_FIELDS or field in LINK_FIELDS or field == 'alert_style':
+            # Blank form inputs clear the setting
+            value = value.strip() if isinstance(value, str) else value
+            value = value or None
+        if field in DATE_FIELDS and value is not None:
+            try:
+                value = date.fromisoformat(str(value)[:10])
+            except ValueError:
+                raise ValueError(f'{field} must be a date (YYYY-MM-DD)')
+        elif field in COLOR_FIELDS and value is not None:
+            if not isinstance(value, str) or not COLOR_PATTERN.match(value):
+                raise ValueError(f'{field} must be a hex colour such as #1e3c72')
+        elif field in LINK_FIELDS and value is not None:
+            if not is_safe_link(value):
+                raise ValueError(f"{field} must be a relative link, a #section or a {'/'.join(LINK_SCHEMES)} URL")
+        elif field == 'alert_style' and value is not None and value not in ALERT_STYLES:
+            raise ValueError(f"alert_style must be one of {', '.join(ALERT_STYLES)}")
+        elif field in JSON_FIELDS:
+            if isinstance(value, str):
+                try:
+                    value = json.loads(value or '[]')
+                except ValueError:
+                    raise ValueError(f'{field} must be a JSON list')
+            if not isinstance(value, list):
+                raise ValueError(f'{field} must be a list')
+            value = json.dumps(value)
+        values[field] = value
+    if not values:
+        raise ValueError('No frontpage settings given')
+
+    cursor.execute("SELECT id FROM frontpage_settings ORDER BY id LIMIT 1 FOR UPDATE")
+    row = cursor.fetchone()
+    columns = list(values)
+    params = [values[column] for column in columns]
+    if row:
+        assignments = ', '.join(f"{column} = %s" for column in columns)
+        cursor.execute(f"""
+            UPDATE frontpage_settings SET {assignments}, updated_at = CURRENT_TIMESTAMP
+            WHERE id = %s RETURNING *
+        """, params + [row['id']])
+    else:
+        cursor.execute(f"""
+            INSERT INTO frontpage_settings ({', '.join(columns)}, updated_at)
+            VALUES ({', '.join(['%s'] * len(columns))}, CURRENT_TIMESTAMP)
+            RETURNING *
+        """, params)
+    return dict(cursor.fetchone())
+
+def _color(value, default):
+    return value if value and COLOR_PATTERN.match(value) else default
+
+def _link(value, default='#'):
+    return value if value and is_safe_link(value) else default
+
+def page_config(settings, batches, today):
+    """The config object the homepage script renders from"""
+    merged = dict(DEFAULTS)
+    merged.update({key: value for key, value in settings.items() if value not in (None, '')})
+
+    alert_on = bool(merged.get('alert_enabled')) and bool(merged.get('alert_message'))
+    if alert_on and merged.get('alert_start_date') and today < merged['alert_start_date']:
+        alert_on = False
+    if alert_on and merged.get('alert_end_date') and today > merged['alert_end_date']:
+        alert_on = False
+
+    if batches:
+        packages = [
+            {
+                'id': batch['id'],
+                'name': batch['batch_name'],
+                'description': batch['description'] or 'Complete Haj/Umrah package',
+                'price': batch['price'] or 0,
+                'icon': 'fa-mosque',
+                'departure_date': batch['departure_date'],
+                'duration': f"{batch['duration']} days" if batch['duration'] else None
+            }
+            for batch in batches
+        ]
+    else:
+        packages = merged.get('packages') or []
+
+    return {
+        'hero': {
+            'heading': merged['hero_heading'],
+            'subheading': merged['hero_subheading'],
+            'button': merged['hero_button_text'],
+            'link': _link(merged['hero_button_link'], DEFAULTS['hero_button_link']),
+            'color1': _color(merged['hero_color1'], DEFAULTS['hero_color1']),
+            'color2': _color(merged['hero_color2'], DEFAULTS['hero_color2'])
+        },
+        'packagesTitle': merged['packages_title'],
+        'packages': packages,
+        'features': merged.get('features') or [],
+        'contact': {
+            'whatsapp': re.sub(r'\D', '', merged['whatsapp_number']) if merged.get('whatsapp_enabled', True) else '',
+            'email': merged['booking_email'],
+            'phone': merged['footer_phone'],
+            'facebook': _link(merged.get('facebook_url')),
+            'twitter': _link(merged.get('twitter_url')),
+            'instagram': _link(merged.get('instagram_url'))
+        },
+        'footer': {
+            'text': merged['footer_text'],
+            'email': merged['footer_email']
+        },
+        'alert': {
+            'enabled': alert_on,
+            'message': merged.get('alert_message') or '',
+            'link': _link(merged.get('alert_link')),
+            'color': _color(merged['alert_color'], DEFAULTS['alert_color']),
+            'style': merged['alert_style'] if merged['alert_style'] in ALERT_STYLES else 'pulse'
+        },
+        'primaryColor': _color(merged['primary_color'], DEFAULTS['primary_color']),
+        'secondaryColor': _color(merged['secondary_color'], DEFAULTS['secondary_color'])
+    }
+
+def local_today():
+    """Today in the business timezone, which alert dates are entered in"""
+    return datetime.now(ZoneInfo(rollups.BUSINESS_TIMEZONE)).date()
+
+def render(cursor, today=None):
+    """Render the homepage HTML from the database"""
+    today = today or local_today()
+    config = page_config(load_settings(cursor), get_open_batches(cursor), today)
+    return templating.render('index.html', config=config)
+
+def build():
+    """Build the homepage body for the cache"""
+    conn, cursor = get_db()
+    if not conn:
+        raise RuntimeError('Database connection failed')
+    try:
+        html = render(cursor)
+    finally:
+        release_db(conn, cursor)
+    return html.encode('utf-8'), 'text/html; charset=utf-8'
+
+def cache_key():
+    """Cache key of today's page"""
+    return f"homepage:{local_today().isoformat()}"
@@ -0,0 +1,192 @@
+"""
+Idempotency keys for create endpoints
+A client that sends an Idempotency-Key header can safely retry a POST: the
+first response is stored with a hash of the request, and a retry with the
+same key gets that response back without the endpoint running again.
+Concurrent duplicates wait on an advisory lock for the first to finish.
+
+The key is checked and stored on a connection of its own, separate from the
+one the endpoint writes with, so a keyed request holds two connections while
+the endpoint runs. The key's connection sits idle outside any transaction
+meanwhile; only the session-level lock stays held, and closing the
+connection releases it. If the endpoint commits and the key insert then
+fails, a retry runs the endpoint again, as it would with no key.
+"""
+
+import os
+import json
+import hashlib
+from functools import wraps
+from flask import request, session, jsonify, make_response
+from app.database import get_db, release_db
+from app import jobs
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+TTL_HOURS = int(os.getenv('IDEMPOTENCY_TTL_HOURS', '24'))
+CLEANUP_INTERVAL = 3600
+
+# Auth failures and rate limits are not outcomes worth replaying
+UNSTORED_STATUSES = {401, 403, 429}
+
+# ============================================================
+# DATABASE MIGRATION - Create idempotency_keys table if not exists
+# ============================================================
+def migrate_idempotency_table():
+    """Create idempotency_keys table if it doesn't exist"""
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                owner VARCHAR(50) NOT NULL,
+                idempotency_key VARCHAR(255) NOT NULL,
+                endpoint TEXT NOT NULL,
+                request_hash CHAR(64) NOT NULL,
+                response_status INTEGER NOT NULL,
+                response_body BYTEA,
+                content_type TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                expires_at TIMESTAMP NOT NULL,
+                PRIMARY KEY (owner, idempotency_key)
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires ON idempotency_keys (expires_at)")
+        conn.commit()
+        print("✅ idempotency_keys table verified!")
+    except Exception as e:
+        print(f"⚠️ Migration error: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn:
+            release_db(conn, cursor)
+
+# Run migration on import
+try:
+    migrate_idempotency_table()
+except Exception as e:
+    print(f"⚠️ Migration failed: {e}")
+
+# ============================================================
+# DECORATOR
+# ============================================================
+
+def _owner():
+    if 'user_id' in session:
+        return f"user:{session['user_id']}"
+    if 'traveler_id' in session:
+        return f"traveler:{session['traveler_id']}"
+    return None
+
+def _request_hash():
+    digest = hashlib.sha256()
+    digest.update(f"{request.method} {request.path}\n".encode('utf-8'))
+    if request.mimetype == 'multipart/form-data':
+        # The boundary changes on every retry, so hash the parts instead of the raw body
+        for name, value in sorted(request.form.items(multi=True)):
+            digest.update(json.dumps([name, value]).encode('utf-8'))
+        for name, upload in sorted(request.files.items(multi=True), key=lambda item: item[0]):
+            digest.update(json.dumps([name, upload.filename]).encode('utf-8'))
+            digest.update(upload.read())
+            upload.seek(0)
+    else:
+        digest.update(request.get_data(cache=True))
+    return digest.hexdigest()
+
+def _replay(row):
+    response = make_response(bytes(row['response_body'] or b''), row['response_status'])
+    if row['content_type']:
+        response.headers['Content-Type'] = row['content_type']
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def idempotent(f):
+    """
+    Honour the Idempotency-Key header on a create endpoint
+
+    Requests without the header run as before. A key is scoped to the
+    logged-in user (or traveler); reusing it with a different request body
+    is rejected with 422.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        owner = _owner()
+        if not key or not owner:
+            return f(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({'success': False, 'error': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters'}), 400
+
+        request_hash = _request_hash()
+        conn, cursor = get_db()
+        if not conn:
+            return f(*args, **kwargs)
+        try:
+            # Held until the connection is released: a concurrent duplicate
+            # waits here, then replays. The read is committed straight away so
+            # no transaction stays open while the endpoint runs
+            cursor.execute("SELECT pg_advisory_lock(%s)", (jobs.lock_key(f"idempotency:{owner}:{key}"),))
+            cursor.execute("""
+                SELECT endpoint, request_hash, response_status, response_body, content_type
+                FROM idempotency_keys
+                WHERE owner = %s AND idempotency_key = %s AND expires_at > CURRENT_TIMESTAMP
+            """, (owner, key))
+            stored = cursor.fetchone()
+            conn.commit()
+            if stored:
+                if stored['request_hash'] != request_hash:
+                    return jsonify({
+                        'success': False,
+                        'error': f'{HEADER} was already used for a different request'
+                    }), 422
+                return _replay(stored)
+
+            response = make_response(f(*args, **kwargs))
+            if response.status_code < 500 and response.status_code not in UNSTORED_STATUSES \
+                    and not response.is_streamed:
+                cursor.execute("""
+                    INSERT INTO idempotency_keys (
+                        owner, idempotency_key, endpoint, request_hash, response_status,
+                        response_body, content_type, created_at, expires_at
+                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP,
+                              CURRENT_TIMESTAMP + make_interval(hours => %s))
+                    ON CONFLICT (owner, idempotency_key) DO UPDATE SET
+                        endpoint = EXCLUDED.endpoint,
+                        request_hash = EXCLUDED.request_hash,
+                        response_status = EXCLUDED.response_status,
+                        response_body = EXCLUDED.response_body,
+                        content_type = EXCLUDED.content_type,
+                        created_at = EXCLUDED.created_at,
+                        expires_at = EXCLUDED.expires_at
+                """, (owner, key, request.path, request_hash, response.status_code,
+                      response.get_data(), response.headers.get('Content-Type'), TTL_HOURS))
+            conn.commit()
+            return response
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            release_db(conn, cursor)
+    return decorated
+
+# ============================================================
+# CLEANUP
+# ============================================================
+
+def purge_expired():
+    """Delete expired keys, returns the number removed"""
+    conn, cursor = get_db()
+    if not conn:
+        return 0
+    try:
+        cursor.execute("DELETE FROM idempotency_keys WHERE expires_at <= CURRENT_TIMESTAMP")
+        removed = cursor.rowcount
+        conn.commit()
+        return removed
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        release_db(conn, cursor)
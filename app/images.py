@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Image derivative pipeline
+Builds EXIF-corrected thumbnails and medium previews for uploaded photos and
+scans so list views never have to download the full-size originals.
+
+Derivatives live under uploads/derivatives/<same relative path>/ and are
+requested with ?size=thumb or ?size=medium on any upload URL.
+
+Backfill existing files with: python app/images.py backfill
+"""
+
+import os
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Bounding boxes (width, height) for each derivative size
+DERIVATIVE_SIZES = {
+    'thumb': (240, 240),
+    'medium': (1024, 1024)
+}
+
+# Output formats: extension -> (Pillow format, mimetype, save options)
+DERIVATIVE_FORMATS = {
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True})
+}
+
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+DERIVATIVES_DIR = 'derivatives'
+
+# Upload folders that hold traveler images (backups/documents are skipped)
+IMAGE_FOLDERS = ['passports', 'aadhaar', 'pan', 'vaccine', 'photos', 'company', 'travelers']
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    """Get the shared background pool used for derivative generation"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = int(os.getenv('IMAGE_WORKERS', '2'))
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='derivatives')
+        return _executor
+
+def is_image(filename):
+    """Check if a stored file is an image Pillow can resize"""
+    return bool(filename) and '.' in filename and filename.rsplit('.', 1)[1].lower() in IMAGE_EXTENSIONS
+
+def derivative_path(upload_root, source_path, size, fmt):
+    """Get the derivative file path for a stored upload"""
+    rel_path = os.path.relpath(source_path, upload_root)
+    return os.path.join(upload_root, DERIVATIVES_DIR, f"{rel_path}.{size}.{fmt}")
+
+def verify_image(stream):
+    """Check an uploaded image fully decodes, raises ValueError if not (stream is rewound)"""
+    start = stream.tell()
+    try:
+        with Image.open(stream) as img:
+            img.verify()
+        stream.seek(start)
+        # verify() only checks structure - decode the pixels too
+        with Image.open(stream) as img:
+            img.load()
+    except Exception as e:
+        raise ValueError(f"Image could not be decoded: {e}")
+    finally:
+        stream.seek(start)
+
+def _flatten(img):
+    """Convert any Pillow mode to RGB, placing transparency on white"""
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        return background
+    if img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
+
+def generate_derivatives(upload_root, source_path, force=False):
+    """Generate every size/format derivative for one image, returns paths written"""
+    if not is_image(source_path) or not os.path.isfile(source_path):
+        return []
+
+    targets = []
+    for size in DERIVATIVE_SIZES:
+        for fmt in DERIVATIVE_FORMATS:
+            path = derivative_path(upload_root, source_path, size, fmt)
+            if force or not os.path.exists(path):
+                targets.append((size, fmt, path))
+
+    if not targets:
+        return []
+
+    written = []
+    with Image.open(source_path) as original:
+        # Phone cameras store rotation in EXIF - bake it into the pixels
+        img = _flatten(ImageOps.exif_transpose(original))
+
+        for size, fmt, path in targets:
+            preview = img.copy()
+            preview.thumbnail(DERIVATIVE_SIZES[size], Image.LANCZOS)
+
+            pil_format, _, options = DERIVATIVE_FORMATS[fmt]
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            preview.save(tmp_path, pil_format, **options)
+            os.replace(tmp_path, path)
+            written.append(path)
+
+    return written
+
+def _generate_safely(upload_root, source_path):
+    try:
+        generate_derivatives(upload_root, source_path)
+    except Exception as e:
+        logger.warning(f"Derivative generation failed for {source_path}: {e}")
+
+def schedule_derivatives(upload_root, source_path):
+    """Queue derivative generation in the background pool (non-blocking)"""
+    if not is_image(source_path):
+        return None
+    return get_executor().submit(_generate_safely, upload_root, source_path)
+
+def find_derivative(upload_root, source_path, size, accept_webp=True):
+    """
+    Find a ready derivative for a stored upload
+
+    Returns:
+        tuple: (path, mimetype) or None if the original should be served.
+        Missing derivatives are queued so the next request gets one.
+    """
+    if size not in DERIVATIVE_SIZES or not is_image(source_path):
+        return None
+
+    formats = ['webp', 'jpg'] if accept_webp else ['jpg']
+    for fmt in formats:
+        path = derivative_path(upload_root, source_path, size, fmt)
+        if os.path.isfile(path):
+            return path, DERIVATIVE_FORMATS[fmt][1]
+
+    schedule_derivatives(upload_root, source_path)
+    return None
+
+def remove_derivatives(upload_root, source_path):
+    """Delete all derivatives of a stored upload"""
+    for size in DERIVATIVE_SIZES:
+        for fmt in DERIVATIVE_FORMATS:
+            path = derivative_path(upload_root, source_path, size, fmt)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+def remove_derivatives_tree(upload_root, source_dir):
+    """Delete the derivative directory mirroring a removed upload directory"""
+    import shutil
+    rel_dir = os.path.relpath(source_dir, upload_root)
+    shutil.rmtree(os.path.join(upload_root, DERIVATIVES_DIR, rel_dir), ignore_errors=True)
+
+def _iter_images(folder):
+    """Recursively yield image paths below a folder using scandir"""
+    try:
+        entries = list(os.scandir(folder))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from _iter_images(entry.path)
+        elif entry.is_file(follow_symlinks=False) and is_image(entry.name):
+            yield entry.path
+
+def backfill(upload_root, folders=None, force=False):
+    """Generate derivatives for every existing image, returns (processed, failed)"""
+    processed = 0
+    failed = 0
+    futures = []
+    executor = get_executor()
+
+    for folder in folders or IMAGE_FOLDERS:
+        for path in _iter_images(os.path.join(upload_root, folder)):
+            futures.append((path, executor.submit(generate_derivatives, upload_root, path, force)))
+
+    for path, future in futures:
+        try:
+            future.result()
+            processed += 1
+        except Exception as e:
+            failed += 1
+            print(f"⚠️ {path}: {e}")
+
+    return processed, failed
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Image derivative tools')
+    parser.add_argument('command', choices=['backfill'])
+    parser.add_argument('--upload-dir', default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'uploads'))
+    parser.add_argument('--folder', action='append', help='Limit to an upload folder (repeatable)')
+    parser.add_argument('--force', action='store_true', help='Regenerate existing derivatives')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"🖼️ Generating derivatives in {args.upload_dir}")
+    print("=" * 60)
+    processed, failed = backfill(args.upload_dir, args.folder, args.force)
+    print(f"✅ Processed {processed} images, {failed} failed")
@@ -0,0 +1,206 @@
+"""
+Installment schedules
+A plan splits a batch price into installments, for example 25/50/25, each
+with a fixed due date or a number of days before departure. Generating a
+plan writes one pending payment per installment and traveler, carrying the
+installment label and due date, so collection runs through the normal
+payment flow.
+
+The overdue scanner reads pending payments with a due date through a partial
+index that holds only those rows, so the daily worklist costs the same however
+many settled payments the table has.
+"""
+
+from datetime import date, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+CENTS = Decimal('0.01')
+MAX_INSTALLMENTS = 12
+WORKLIST_LIMIT = 500
+WORKLIST_MAX_LIMIT = 5000
+
+def parse_plan(plan, departure_date=None):
+    """
+    Validate a plan and resolve its due dates
+
+    Args:
+        plan: list of {percent, due_date} or {percent, days_before_departure}
+        departure_date: the batch departure, needed for relative due dates
+
+    Returns:
+        list: (percent Decimal, due date) in due date order
+
+    Raises:
+        ValueError: when the plan is malformed
+    """
+    if not isinstance(plan, list) or not plan:
+        raise ValueError('plan must be a non-empty list of installments')
+    if len(plan) > MAX_INSTALLMENTS:
+        raise ValueError(f'plan can have at most {MAX_INSTALLMENTS} installments')
+
+    steps = []
+    for index, item in enumerate(plan, start=1):
+        if not isinstance(item, dict):
+            raise ValueError(f'installment {index} must be an object')
+        try:
+            percent = Decimal(str(item.get('percent')))
+        except Exception:
+            raise ValueError(f'installment {index}: percent is required')
+        if percent <= 0:
+            raise ValueError(f'installment {index}: percent must be greater than 0')
+
+        if item.get('due_date'):
+            try:
+                due = date.fromisoformat(str(item['due_date'])[:10])
+            except ValueError:
+                raise ValueError(f'installment {index}: invalid due_date (use YYYY-MM-DD)')
+        elif item.get('days_before_departure') is not None:
+            if not departure_date:
+                raise ValueError(f'installment {index}: batch has no departure date')
+            due = departure_date - timedelta(days=int(item['days_before_departure']))
+        else:
+            raise ValueError(f'installment {index}: due_date or days_before_departure is required')
+        steps.append((percent, due))
+
+    if sum(percent for percent, _ in steps) != 100:
+        raise ValueError('installment percents must add up to 100')
+    return sorted(steps, key=lambda step: step[1])
+
+def split_amount(total, steps):
+    """
+    Split a price by the plan percents, rounding to paise
+
+    The last installment takes the rounding remainder so the parts always add
+    up to the price.
+    """
+    total = Decimal(str(total)).quantize(CENTS, rounding=ROUND_HALF_UP)
+    amounts = [(total * percent / 100).quantize(CENTS, rounding=ROUND_HALF_UP) for percent, _ in steps[:-1]]
+    amounts.append(total - sum(amounts, Decimal('0')))
+    return amounts
+
+def build_schedule(total, steps):
+    """Installments as dicts of number, label, percent, amount and due_date"""
+    count = len(steps)
+    return [
+        {
+            'number': number,
+            'label': f"Installment {number} of {count} ({percent.normalize():f}%)",
+            'percent': float(percent),
+            'amount': amount,
+            'due_date': due
+        }
+        for number, ((percent, due), amount) in enumerate(zip(steps, split_amount(total, steps)), start=1)
+    ]
+
+def generate(cursor, batch_id, schedule, traveler_ids=None, skip_existing=True, payment_method=None):
+    """
+    Write the schedule as pending payments for a batch's travelers
+
+    One INSERT ... SELECT crosses the travelers with the installments.
+    Travelers who already have a scheduled (due-dated, not reversed) payment
+    in the batch are skipped when skip_existing is set.
+
+    Returns:
+        tuple: (list of created payment rows, list of skipped traveler ids)
+    """
+    cursor.execute("""
+        WITH plan AS (
+            SELECT * FROM unnest(%(labels)s::text[], %(amounts)s::numeric[], %(dues)s::date[])
+                AS s (installment, amount, due_date)
+        ),
+        members AS (
+            SELECT t.id AS traveler_id,
+                   %(skip)s AND EXISTS (
+                       SELECT 1 FROM payments p
+                       WHERE p.traveler_id = t.id AND p.batch_id = %(batch_id)s
+                         AND p.due_date IS NOT NULL AND p.status <> 'reversed'
+                   ) AS scheduled
+            FROM travelers t
+            WHERE t.batch_id = %(batch_id)s
+              AND (%(traveler_ids)s::int[] IS NULL OR t.id = ANY(%(traveler_ids)s::int[]))
+        ),
+        created AS (
+            INSERT INTO payments (
+                traveler_id, batch_id, installment, amount, payment_date, due_date,
+                payment_method, status, notes, created_at
+            )
+            SELECT m.traveler_id, %(batch_id)s, plan.installment, plan.amount, plan.due_date, plan.due_date,
+                   %(method)s, 'pending', 'Scheduled installment', CURRENT_TIMESTAMP
+            FROM members m CROSS JOIN plan
+            WHERE NOT m.scheduled
+            ORDER BY m.traveler_id, plan.due_date
+            RETURNING id, traveler_id, installment, amount, due_date
+        )
+        SELECT 'created' AS kind, id, traveler_id, installment, amount, due_date FROM created
+        UNION ALL
+        SELECT 'skipped', NULL, traveler_id, NULL, NULL, NULL FROM members WHERE scheduled
+    """, {
+        'labels': [step['label'] for step in schedule],
+        'amounts': [step['amount'] for step in schedule],
+        'dues': [step['due_date'] for step in schedule],
+        'skip': bool(skip_existing),
+        'batch_id': batch_id,
+        'traveler_ids': [int(t) for t in traveler_ids] if traveler_ids else None,
+        'method': payment_method
+    })
+    rows = cursor.fetchall()
+    created = [row for row in rows if row['kind'] == 'created']
+    skipped = sorted(row['traveler_id'] for row in rows if row['kind'] == 'skipped')
+    return created, skipped
+
+def overdue_worklist(cursor, as_of, within_days=0, batch_id=None, limit=WORKLIST_LIMIT):
+    """
+    Pending installments due on or before as_of + within_days
+
+    The page walks idx_payments_due_pending in due date order and stops after
+    limit rows. The summary is a separate aggregate over the same index range,
+    so its cost grows with the whole worklist rather than the page.
+
+    Returns:
+        tuple: (rows, summary dict)
+    """
+    params = {
+        'as_of': as_of,
+        'within': int(within_days),
+        'batch_id': batch_id,
+        'limit': limit
+    }
+    where = """
+        p.status = 'pending' AND p.due_date IS NOT NULL
+        AND p.due_date <= %(as_of)s::date + %(within)s
+        AND (%(batch_id)s::int IS NULL OR p.batch_id = %(batch_id)s::int)
+    """
+    cursor.execute(f"""
+        SELECT
+            p.id AS payment_id, p.traveler_id, p.batch_id, p.installment,
+            p.amount::float8 AS amount, p.due_date,
+            (%(as_of)s::date - p.due_date) AS days_overdue,
+            t.first_name, t.last_name, t.passport_no, t.mobile, t.email,
+            b.batch_name
+        FROM payments p
+        JOIN travelers t ON t.id = p.traveler_id
+        LEFT JOIN batches b ON b.id = p.batch_id
+        WHERE {where}
+        ORDER BY p.due_date, p.id
+        LIMIT %(limit)s
+    """, params)
+    rows = [dict(row) for row in cursor.fetchall()]
+
+    # traveler_id is a foreign key, so a set one always joins like the page
+    cursor.execute(f"""
+        SELECT
+            COUNT(*) AS count,
+            COUNT(*) FILTER (WHERE p.due_date < %(as_of)s::date) AS overdue_count,
+            COALESCE(SUM(p.amount), 0)::float8 AS total_amount
+        FROM payments p
+        WHERE {where} AND p.traveler_id IS NOT NULL
+    """, params)
+    totals = cursor.fetchone()
+    summary = {
+        'count': totals['count'],
+        'overdue_count': totals['overdue_count'],
+        'due_soon_count': totals['count'] - totals['overdue_count'],
+        'total_amount': totals['total_amount'],
+        'as_of': as_of
+    }
+    return rows, summary
@@ -0,0 +1,265 @@
+"""
+Tax invoice PDFs
+GST tax invoices for tour packages (SAC/HSN 9985) with the company header,
+GSTIN, GST/TCS breakdown and bank details. Rows are loaded in the web worker;
+render_invoice runs in the render pool and only sees plain data. Cached files
+are keyed by the invoice contents and a version hash of the company settings,
+so editing either re-renders on the next download.
+"""
+
+import os
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from app import images, render_pool, storage
+from app.pdf_text import plain_value, cell_text
+
+INVOICE_PDF_VERSION = 1  # Bump when the layout changes to invalidate cached files
+
+HSN_CODE = '9985'  # Support services: tour operator / travel arrangement
+
+# Normalised company field -> settings columns to try (the table carries both
+# the original and the settings-page column names)
+COMPANY_FIELDS = {
+    'name': ('company_name', 'legal_name', 'display_name'),
+    'address': ('address',),
+    'phone': ('phone', 'mobile'),
+    'email': ('email',),
+    'website': ('website',),
+    'gstin': ('gst', 'gstin'),
+    'pan': ('pan',),
+    'bank_name': ('bank_name',),
+    'bank_branch': ('bank_branch',),
+    'account_name': ('account_name',),
+    'account_no': ('bank_account', 'account_no'),
+    'ifsc': ('bank_ifsc', 'ifsc_code'),
+    'upi_id': ('upi_id',),
+    'terms': ('terms_conditions',),
+    'footer': ('footer_text',)
+}
+
+def _first(row, columns):
+    for column in columns:
+        value = row.get(column)
+        if value not in (None, ''):
+            return value
+    return ''
+
+def load_company(cursor, upload_root):
+    """
+    Load the company block printed on every invoice
+
+    Returns:
+        tuple: (company dict, settings version hash)
+    """
+    cursor.execute("SELECT * FROM company_settings ORDER BY id LIMIT 1")
+    row = dict(cursor.fetchone() or {})
+
+    company = {field: plain_value(_first(row, columns)) for field, columns in COMPANY_FIELDS.items()}
+    if not company['name']:
+        company['name'] = 'Alhudha Haj Travel'
+    if not company['address']:
+        parts = [row.get('address_line1'), row.get('address_line2'), row.get('city'),
+                 row.get('state'), row.get('pin_code')]
+        company['address'] = ', '.join(p for p in parts if p)
+
+    # Logo is embedded when it is a raster image reportlab can draw
+    logo_path = None
+    logo_checksum = None
+    if row.get('logo'):
+        path = os.path.join(upload_root, 'company', os.path.basename(row['logo']))
+        if os.path.isfile(path) and images.is_image(path):
+            logo_path = path
+            logo_checksum = storage.sha256_from_filename(os.path.basename(path)) or storage.hash_file(path)
+    company['logo_path'] = logo_path
+
+    version = render_pool.cache_key(company, logo_checksum)
+    return company, version
+
+def load_invoices(cursor, upload_root, invoice_ids):
+    """
+    Load everything an invoice PDF shows for a list of invoices
+
+    Returns:
+        list: (invoice_id, cache key, payload) in the order given
+    """
+    company, settings_version = load_company(cursor, upload_root)
+
+    cursor.execute("""
+        SELECT i.*, t.first_name, t.last_name, t.passport_no, t.mobile, t.email,
+               t.mailing_address, t.pan as traveler_pan, b.batch_name, b.departure_date, b.return_date
+        FROM invoices i
+        LEFT JOIN travelers t ON i.traveler_id = t.id
+        LEFT JOIN batches b ON i.batch_id = b.id
+        WHERE i.id = ANY(%s)
+    """, (list(invoice_ids),))
+    invoices = {row['id']: row for row in cursor.fetchall()}
+
+    results = []
+    for invoice_id in invoice_ids:
+        row = invoices.get(invoice_id)
+        if not row:
+            continue
+        invoice = plain_value(dict(row))
+        payload = {'invoice': invoice, 'company': company}
+        key = render_pool.cache_key(INVOICE_PDF_VERSION, invoice, settings_version)
+        results.append((invoice_id, key, payload))
+    return results
+
+def submit_invoice(upload_root, invoice_id, key, payload):
+    """Get a Future resolving to the cached invoice PDF path"""
+    return render_pool.render_cached(upload_root, 'invoices', f"invoice_{invoice_id}", key, render_invoice, payload)
+
+# ============================================================
+# RENDERING (runs in the render pool)
+# ============================================================
+
+def _money(value):
+    return f"{Decimal(str(value or 0)):,.2f}"
+
+def _breakdown(invoice):
+    """Work out the tax lines, falling back to the items JSON of older rows"""
+    items = invoice.get('items') if isinstance(invoice.get('items'), dict) else {}
+    total = Decimal(str(invoice.get('amount') or items.get('total_amount') or 0))
+    base = Decimal(str(invoice.get('base_amount') or items.get('base_amount') or 0))
+    gst_percent = Decimal(str(invoice.get('gst_percent') or items.get('gst_percent') or 0))
+    gst_amount = Decimal(str(invoice.get('gst_amount') or items.get('gst_amount') or 0))
+    tcs_percent = Decimal(str(invoice.get('tcs_percent') or items.get('tcs_percent') or 0))
+    tcs_amount = Decimal(str(invoice.get('tcs_amount') or items.get('tcs_amount') or 0))
+    if not base:
+        base = total - gst_amount - tcs_amount
+    return {
+        'base': base, 'gst_percent': gst_percent, 'gst_amount': gst_amount,
+        'subtotal': base + gst_amount, 'tcs_percent': tcs_percent, 'tcs_amount': tcs_amount,
+        'total': total or base + gst_amount + tcs_amount
+    }
+
+def render_invoice(output_path, payload):
+    """Render one tax invoice to output_path"""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import cm
+    from reportlab.lib.utils import ImageReader
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
+
+    styles = getSampleStyleSheet()
+    small = styles['BodyText'].clone('small', fontSize=8, leading=10)
+    company = payload['company']
+    invoice = payload['invoice']
+    amounts = _breakdown(invoice)
+    story = []
+
+    # Company header
+    lines = [f"<b>{escape(company['name'])}</b>"]
+    if company['address']:
+        lines.append(escape(str(company['address'])))
+    contact = ' | '.join(escape(str(company[f])) for f in ('phone', 'email', 'website') if company[f])
+    if contact:
+        lines.append(contact)
+    ids = [f"GSTIN: {escape(str(company['gstin']))}" if company['gstin'] else '',
+           f"PAN: {escape(str(company['pan']))}" if company['pan'] else '']
+    if any(ids):
+        lines.append(' &nbsp;|&nbsp; '.join(i for i in ids if i))
+    header = Paragraph('<br/>'.join(lines), styles['Normal'])
+
+    if company.get('logo_path'):
+        width, height = ImageReader(company['logo_path']).getSize()
+        scale = min((3.5 * cm) / width, (2.5 * cm) / height)
+        top = Table([[Image(company['logo_path'], width=width * scale, height=height * scale), header]],
+                    colWidths=[4 * cm, 13 * cm])
+        top.setStyle(TableStyle([('VALIGN', (0, 0), (-1, -1), 'MIDDLE')]))
+        story.append(top)
+    else:
+        story.append(header)
+    story.append(Spacer(1, 0.3 * cm))
+    story.append(Paragraph('TAX INVOICE', styles['Title']))
+
+    # Invoice meta and bill-to
+    name = f"{invoice.get('first_name') or ''} {invoice.get('last_name') or ''}".strip()
+    bill_to = [f"<b>{escape(name or '-')}</b>"]
+    for label, column in (('Passport', 'passport_no'), ('Mobile', 'mobile'), ('Email', 'email'), ('PAN', 'traveler_pan')):
+        if invoice.get(column):
+            bill_to.append(f"{label}: {escape(str(invoice[column]))}")
+    if invoice.get('mailing_address'):
+        bill_to.append(escape(str(invoice['mailing_address'])))
+
+    meta = Table([
+        ['Invoice No', cell_text(invoice.get('invoice_number')), 'Bill To', Paragraph('<br/>'.join(bill_to), small)],
+        ['Invoice Date', cell_text(invoice.get('invoice_date')), '', ''],
+        ['Due Date', cell_text(invoice.get('due_date')), '', ''],
+        ['Batch', Paragraph(escape(cell_text(invoice.get('batch_name'))), small), '', ''],
+        ['Status', cell_text(invoice.get('status')).title(), '', '']
+    ], colWidths=[2.6 * cm, 5.4 * cm, 2 * cm, 7 * cm])
+    meta.setStyle(TableStyle([
+        ('GRID', (0, 0), (1, -1), 0.25, colors.grey),
+        ('BOX', (2, 0), (3, -1), 0.25, colors.grey),
+        ('SPAN', (2, 0), (2, -1)),
+        ('SPAN', (3, 0), (3, -1)),
+        ('BACKGROUND', (0, 0), (0, -1), colors.whitesmoke),
+        ('BACKGROUND', (2, 0), (2, -1), colors.whitesmoke),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('FONTSIZE', (0, 0), (-1, -1), 8)
+    ]))
+    story.append(meta)
+    story.append(Spacer(1, 0.5 * cm))
+
+    # Line item and tax breakdown
+    description = invoice.get('description') or 'Travel Package'
+    if invoice.get('departure_date'):
+        description += f" (departure {cell_text(invoice['departure_date'])})"
+    rows = [
+        ['#', 'Description', 'HSN/SAC', 'Amount (Rs.)'],
+        ['1', Paragraph(escape(description), small), HSN_CODE, _money(amounts['base'])],
+        ['', '', 'Taxable Value', _money(amounts['base'])],
+        ['', '', f"GST @ {amounts['gst_percent']:g}%", _money(amounts['gst_amount'])],
+        ['', '', 'Subtotal', _money(amounts['subtotal'])],
+        ['', '', f"TCS @ {amounts['tcs_percent']:g}%", _money(amounts['tcs_amount'])],
+        ['', '', 'Total', _money(amounts['total'])]
+    ]
+    lines = Table(rows, colWidths=[1 * cm, 9.5 * cm, 3 * cm, 3.5 * cm])
+    lines.setStyle(TableStyle([
+        ('GRID', (0, 0), (-1, 1), 0.25, colors.grey),
+        ('LINEBELOW', (2, 2), (-1, -1), 0.25, colors.grey),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+        ('ALIGN', (-1, 0), (-1, -1), 'RIGHT'),
+        ('ALIGN', (2, 2), (2, -1), 'RIGHT'),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('FONTNAME', (2, -1), (-1, -1), 'Helvetica-Bold'),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP')
+    ]))
+    story.append(lines)
+    story.append(Spacer(1, 0.5 * cm))
+
+    # Bank details
+    bank = [(label, company[field]) for label, field in (
+        ('Account Name', 'account_name'), ('Bank', 'bank_name'), ('Branch', 'bank_branch'),
+        ('Account No', 'account_no'), ('IFSC', 'ifsc'), ('UPI', 'upi_id')
+    ) if company[field]]
+    if bank:
+        story.append(Paragraph('Bank Details', styles['Heading4']))
+        table = Table([[label, str(value)] for label, value in bank], colWidths=[3 * cm, 8 * cm])
+        table.setStyle(TableStyle([
+            ('GRID', (0, 0), (-1, -1), 0.25, colors.grey),
+            ('BACKGROUND', (0, 0), (0, -1), colors.whitesmoke),
+            ('FONTSIZE', (0, 0), (-1, -1), 8)
+        ]))
+        story.append(table)
+
+    if invoice.get('notes'):
+        story.append(Paragraph('Notes', styles['Heading4']))
+        story.append(Paragraph(escape(str(invoice['notes'])), small))
+    if company['terms']:
+        story.append(Paragraph('Terms &amp; Conditions', styles['Heading4']))
+        story.append(Paragraph(escape(str(company['terms'])).replace('\n', '<br/>'), small))
+
+    story.append(Spacer(1, 0.8 * cm))
+    story.append(Paragraph('This is a computer generated invoice.', small))
+    if company['footer']:
+        story.append(Paragraph(escape(str(company['footer'])), small))
+
+    doc = SimpleDocTemplate(output_path, pagesize=A4, leftMargin=2 * cm, rightMargin=2 * cm,
+                            topMargin=1.5 * cm, bottomMargin=1.5 * cm,
+                            title=f"Invoice {invoice.get('invoice_number') or ''}")
+    doc.build(story)
+    return output_path
@@ -0,0 +1,92 @@
+"""
+Background jobs
+Maintenance work (storage scans, reconciliation, rollup refreshes) runs on
+daemon threads inside the web workers. Every job takes a PostgreSQL advisory
+lock named after it, so only one worker runs a given job at a time.
+"""
+
+import os
+import time
+import threading
+import zlib
+import logging
+from app.database import get_db, release_db
+
+logger = logging.getLogger(__name__)
+
+_scheduled = set()
+_scheduled_lock = threading.Lock()
+
+def lock_key(name):
+    """Get the advisory lock key for a job name"""
+    return zlib.crc32(name.encode('utf-8'))
+
+def try_lock(cursor, name):
+    """Take the session-level advisory lock of a job, False if another worker holds it"""
+    cursor.execute("SELECT pg_try_advisory_lock(%s) AS locked", (lock_key(name),))
+    row = cursor.fetchone()
+    return bool(row and row['locked'])
+
+def unlock(cursor, name):
+    """Release the advisory lock of a job"""
+    cursor.execute("SELECT pg_advisory_unlock(%s)", (lock_key(name),))
+
+def _run_safely(name, target, args, kwargs):
+    try:
+        target(*args, **kwargs)
+    except Exception as e:
+        logger.error(f"Background job {name} failed: {e}")
+        print(f"❌ Background job {name} failed: {e}")
+
+def start(name, target, *args, **kwargs):
+    """Run a function once on a daemon thread"""
+    thread = threading.Thread(
+        target=_run_safely,
+        args=(name, target, args, kwargs),
+        name=f"job-{name}",
+        daemon=True
+    )
+    thread.start()
+    return thread
+
+def run_locked(name, target, *args, **kwargs):
+    """Run a job only if no other worker holds its lock, returns False when skipped"""
+    conn, cursor = get_db()
+    if not conn:
+        return False
+    try:
+        if not try_lock(cursor, name):
+            return False
+        try:
+            target(*args, **kwargs)
+        finally:
+            unlock(cursor, name)
+        return True
+    finally:
+        release_db(conn, cursor)
+
+def schedule(name, interval_seconds, target, *args, initial_delay=None):
+    """
+    Run a job every interval_seconds on a daemon thread
+
+    Each worker schedules the job but the advisory lock lets only one of them
+    run it at a time. Scheduling the same name twice in a process is a no-op.
+    """
+    with _scheduled_lock:
+        if name in _scheduled:
+            return None
+        _scheduled.add(name)
+
+    def loop():
+        time.sleep(interval_seconds if initial_delay is None else initial_delay)
+        while True:
+            _run_safely(name, run_locked, (name, target) + args, {})
+            time.sleep(interval_seconds)
+
+    thread = threading.Thread(target=loop, name=f"job-{name}", daemon=True)
+    thread.start()
+    return thread
+
+def jobs_enabled():
+    """Check if periodic jobs should run in this process"""
+    return bool(os.getenv('DATABASE_URL')) and os.getenv('DISABLE_BACKGROUND_JOBS', 'false').lower() != 'true'
@@ -0,0 +1,350 @@
+"""
+Batch manifests
+Airline PNR manifests, hotel rooming lists and visa submission lists built
+from a batch's travelers. Rows are read through a server-side cursor a chunk
+at a time; each chunk is formatted with pandas column operations (names,
+titles, ages, dates) and written straight to the CSV or XLSX output, so memory
+stays flat however large the batch is.
+
+Every template has a default column list; callers can pass their own list of
+fields and headers (for example an airline's own layout) instead.
+"""
+
+import io
+import csv
+import tempfile
+from datetime import date
+
+from app.database import get_db, release_db
+
+CHUNK_ROWS = 500
+READ_CHUNK = 64 * 1024
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+FORMATS = ('xlsx', 'csv')
+MAX_DATE_FORMAT_LENGTH = 20
+
+# Spreadsheet apps run CSV cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+# Traveler columns read from the table, and the ones holding dates
+SOURCE_COLUMNS = [
+    'id', 'first_name', 'last_name', 'passport_name', 'passport_no',
+    'passport_issue_date', 'passport_expiry_date', 'gender', 'dob',
+    'mobile', 'email', 'father_name', 'mother_name', 'spouse_name',
+    'place_of_birth', 'place_of_issue', 'passport_address',
+    'vaccine_status', 'wheelchair', 'emergency_contact', 'emergency_phone',
+    'file_reference', 'medical_notes'
+]
+DATE_COLUMNS = ('dob', 'passport_issue_date', 'passport_expiry_date')
+# Columns joined from the batch's room plan (see app.rooms)
+ROOM_COLUMNS = {'room_no': 'r.room_no', 'room_type': 'r.room_type'}
+
+# Default header of every field a manifest can show
+FIELD_LABELS = {
+    'serial': 'S.No',
+    'room_no': 'Room',
+    'room_type': 'Room Type',
+    'id': 'Traveler ID',
+    'first_name': 'First Name',
+    'last_name': 'Last Name',
+    'full_name': 'Name',
+    'surname': 'Surname',
+    'given_name': 'Given Name',
+    'passport_name': 'Name as in Passport',
+    'pnr_name': 'PNR Name',
+    'title': 'Title',
+    'gender': 'Gender',
+    'gender_code': 'Gender',
+    'dob': 'Date of Birth',
+    'age': 'Age',
+    'passport_no': 'Passport No',
+    'passport_issue_date': 'Passport Issue Date',
+    'passport_expiry_date': 'Passport Expiry Date',
+    'place_of_birth': 'Place of Birth',
+    'place_of_issue': 'Place of Issue',
+    'passport_address': 'Address',
+    'father_name': 'Father Name',
+    'mother_name': 'Mother Name',
+    'spouse_name': 'Spouse Name',
+    'mobile': 'Mobile',
+    'email': 'Email',
+    'vaccine_status': 'Vaccination',
+    'wheelchair': 'Wheelchair',
+    'wheelchair_code': 'SSR',
+    'emergency_contact': 'Emergency Contact',
+    'emergency_phone': 'Emergency Phone',
+    'file_reference': 'File Reference',
+    'medical_notes': 'Medical Notes'
+}
+
+TEMPLATES = {
+    'airline': {
+        'title': 'Airline PNR Manifest',
+        'order_by': 't.last_name, t.first_name, t.id',
+        'date_format': '%d%b%Y',
+        'uppercase': True,
+        'columns': [
+            'serial', 'pnr_name', 'surname', 'given_name', 'title', 'gender_code',
+            'dob', 'passport_no', 'passport_expiry_date', 'mobile', 'wheelchair_code'
+        ]
+    },
+    'rooming': {
+        'title': 'Hotel Rooming List',
+        'order_by': 'r.room_no NULLS LAST, t.gender, t.last_name, t.first_name, t.id',
+        'date_format': '%d-%m-%Y',
+        'uppercase': False,
+        'columns': [
+            'serial', 'room_no', 'room_type', 'full_name', 'gender', 'age', 'spouse_name', 'father_name',
+            'wheelchair', 'mobile', 'medical_notes'
+        ]
+    },
+    'visa': {
+        'title': 'Visa Submission List',
+        'order_by': 't.passport_no, t.id',
+        'date_format': '%d/%m/%Y',
+        'uppercase': True,
+        'columns': [
+            'serial', 'passport_name', 'surname', 'given_name', 'father_name', 'mother_name',
+            'gender', 'dob', 'place_of_birth', 'passport_no', 'passport_issue_date',
+            'passport_expiry_date', 'place_of_issue', 'passport_address', 'vaccine_status'
+        ]
+    }
+}
+
+def resolve_columns(kind, columns=None):
+    """
+    The (field, header) pairs of a manifest
+
+    Args:
+        kind: template name
+        columns: optional list of field names or {field, header} dicts
+            replacing the template's columns
+
+    Raises:
+        ValueError: for an unknown template or field
+    """
+    if kind not in TEMPLATES:
+        raise ValueError(f"Unknown manifest '{kind}' (use {', '.join(TEMPLATES)})")
+    resolved = []
+    for column in columns or TEMPLATES[kind]['columns']:
+        if isinstance(column, dict):
+            field, header = column.get('field'), column.get('header')
+        else:
+            field, header = column, None
+        if field not in FIELD_LABELS:
+            raise ValueError(f"Unknown manifest field '{field}'")
+        resolved.append((field, str(header) if header else FIELD_LABELS[field]))
+    if not resolved:
+        raise ValueError('A manifest needs at least one column')
+    return resolved
+
+def check_date_format(date_format):
+    """Validate a strftime pattern given by the caller"""
+    if not date_format or '%' not in date_format or len(date_format) > MAX_DATE_FORMAT_LENGTH:
+        raise ValueError('date_format must be a strftime pattern such as %d-%m-%Y')
+    date(2000, 1, 31).strftime(date_format)
+    return date_format
+
+# ============================================================
+# FORMATTING
+# ============================================================
+
+def _text(series):
+    return series.fillna('').astype(str).str.strip()
+
+def format_chunk(rows, fields, date_format, reference_date, first_serial, uppercase=False):
+    """
+    Format one chunk of traveler rows into manifest columns
+
+    Args:
+        rows: traveler dicts with SOURCE_COLUMNS and ROOM_COLUMNS
+        fields: field names in output order
+        date_format: strftime pattern for dates
+        reference_date: the day ages are computed at (the departure)
+        first_serial: serial number of the first row
+
+    Returns:
+        DataFrame of strings with one column per field
+    """
+    import numpy as np
+    import pandas as pd
+
+    df = pd.DataFrame.from_records(rows, columns=SOURCE_COLUMNS + list(ROOM_COLUMNS))
+    out = pd.DataFrame(index=df.index)
+
+    first = _text(df['first_name'])
+    last = _text(df['last_name'])
+    gender = _text(df['gender']).str.lower()
+    male = gender.str.startswith('m')
+    female = gender.str.startswith('f')
+    dob = pd.to_datetime(df['dob'], errors='coerce')
+
+    before_birthday = (dob.dt.month > reference_date.month) | (
+        (dob.dt.month == reference_date.month) & (dob.dt.day > reference_date.day))
+    age = reference_date.year - dob.dt.year - before_birthday.astype(int)
+    title = pd.Series(np.select(
+        [age < 2, (age < 12) & male, (age < 12) & female, male,
+         female & (_text(df['spouse_name']) != ''), female],
+        ['INF', 'MSTR', 'MISS', 'MR', 'MRS', 'MS'],
+        default=''
+    ), index=df.index)
+
+    derived = {
+        'serial': lambda: pd.Series(np.arange(first_serial, first_serial + len(df)), index=df.index).astype(str),
+        'full_name': lambda: (first + ' ' + last).str.strip().str.title(),
+        'surname': lambda: last.str.upper(),
+        'given_name': lambda: first.str.upper(),
+        'pnr_name': lambda: (last.str.upper().str.replace(' ', '', regex=False) + '/' +
+                             first.str.upper().str.replace(' ', '', regex=False) + ' ' + title).str.strip(),
+        'title': lambda: title,
+        'gender_code': lambda: np.where(male, 'M', np.where(female, 'F', '')),
+        'age': lambda: age.astype('Int64').astype(str).replace('<NA>', ''),
+        'room_no': lambda: pd.to_numeric(df['room_no']).astype('Int64').astype(str).replace('<NA>', ''),
+        'wheelchair_code': lambda: np.where(
+            _text(df['wheelchair']).str.lower().isin(['yes', 'y', 'true', '1']), 'WCHR', ''),
+        'passport_name': lambda: _text(df['passport_name']).where(
+            _text(df['passport_name']) != '', (first + ' ' + last).str.strip())
+    }
+
+    for field in fields:
+        if field in derived:
+            out[field] = derived[field]()
+        elif field in DATE_COLUMNS:
+            out[field] = pd.to_datetime(df[field], errors='coerce').dt.strftime(date_format).fillna('')
+        else:
+            out[field] = _text(df[field])
+
+    if uppercase:
+        out = out.apply(lambda column: column.astype(str).str.upper())
+    return out.astype(str)
+
+# ============================================================
+# STREAMING
+# ============================================================
+
+def iter_chunks(batch_id, kind, fields, date_format, reference_date):
+    """Yield formatted DataFrames of CHUNK_ROWS travelers from a server-side cursor"""
+    template = TEMPLATES[kind]
+    conn, cursor = get_db()
+    if not conn:
+        raise RuntimeError('Database connection failed')
+    stream = conn.cursor(name=f"manifest_{kind}_{batch_id}")
+    stream.itersize = CHUNK_ROWS
+    try:
+        stream.execute(f"""
+            SELECT {', '.join('t.' + column for column in SOURCE_COLUMNS)},
+                   {', '.join(f'{source} AS {column}' for column, source in ROOM_COLUMNS.items())}
+            FROM travelers t
+            LEFT JOIN room_assignments ra ON ra.traveler_id = t.id
+            LEFT JOIN rooms r ON r.id = ra.room_id AND r.batch_id = t.batch_id
+            WHERE t.batch_id = %s
+            ORDER BY {template['order_by']}
+        """, (batch_id,))
+        serial = 1
+        while True:
+            rows = stream.fetchmany(CHUNK_ROWS)
+            if not rows:
+                break
+            yield format_chunk(rows, fields, date_format, reference_date, serial, template['uppercase'])
+            serial += len(rows)
+    finally:
+        stream.close()
+        release_db(conn, cursor)
+
+def escape_formula(value):
+    """Quote a CSV value that a spreadsheet would otherwise run as a formula"""
+    value = str(value)
+    return "'" + value if value.startswith(FORMULA_PREFIXES) else value
+
+def escape_formulas(frame):
+    """escape_formula over every column of a formatted chunk"""
+    return frame.apply(lambda column: column.where(~column.str.startswith(FORMULA_PREFIXES), "'" + column))
+
+def stream_csv(chunks, headers):
+    """Yield CSV bytes (UTF-8 with BOM so Excel opens it correctly) chunk by chunk"""
+    output = io.StringIO()
+    csv.writer(output).writerow([escape_formula(header) for header in headers])
+    yield ('\ufeff' + output.getvalue()).encode('utf-8')
+    for frame in chunks:
+        yield escape_formulas(frame).to_csv(index=False, header=False, lineterminator='\r\n').encode('utf-8')
+
+def stream_xlsx(chunks, headers, title, subtitle=None):
+    """
+    Yield an XLSX workbook
+
+    The write-only workbook keeps rows in a temporary file rather than in
+    memory; the finished file is then sent in READ_CHUNK pieces. openpyxl
+    stores strings starting with '=' as formulas, so those are written as
+    explicit string cells.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title[:31])
+    bold = Font(bold=True)
+
+    def text(value):
+        cell = WriteOnlyCell(sheet, value=value)
+        cell.data_type = 's'
+        return cell
+
+    def styled(values):
+        cells = []
+        for value in values:
+            cell = text(value)
+            cell.font = bold
+            cells.append(cell)
+        return cells
+
+    if subtitle:
+        sheet.append(styled([subtitle]))
+        sheet.append([])
+    sheet.append(styled(headers))
+    for frame in chunks:
+        for values in frame.itertuples(index=False, name=None):
+            sheet.append([text(value) if value.startswith('=') else value for value in values])
+
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as output:
+        workbook.save(output)
+        output.seek(0)
+        while True:
+            data = output.read(READ_CHUNK)
+            if not data:
+                break
+            yield data
+
+def generate(batch, kind, file_format='xlsx', columns=None, date_format=None):
+    """
+    Build a manifest generator for a batch
+
+    Args:
+        batch: dict with id, batch_name and departure_date
+        kind: 'airline', 'rooming' or 'visa'
+        file_format: 'xlsx' or 'csv'
+        columns: optional column mapping, see resolve_columns()
+        date_format: optional strftime pattern replacing the template's
+
+    Returns:
+        tuple: (byte generator, mimetype, file extension)
+
+    Raises:
+        ValueError: for an unknown template, format, field or date pattern
+    """
+    if file_format not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    mapping = resolve_columns(kind, columns)
+    template = TEMPLATES[kind]
+    date_format = check_date_format(date_format) if date_format else template['date_format']
+    fields = [field for field, _ in mapping]
+    headers = [header for _, header in mapping]
+    reference_date = batch.get('departure_date') or date.today()
+
+    chunks = iter_chunks(batch['id'], kind, fields, date_format, reference_date)
+    if file_format == 'csv':
+        return stream_csv(chunks, headers), 'text/csv', 'csv'
+    subtitle = f"{template['title']} - {batch.get('batch_name') or ''}".strip(' -')
+    if batch.get('departure_date'):
+        subtitle += f" - Departure {batch['departure_date'].strftime('%d %b %Y')}"
+    return stream_xlsx(chunks, headers, template['title'], subtitle), XLSX_MIMETYPE, 'xlsx'
@@ -0,0 +1,370 @@
+"""
+Orphaned upload scanner
+Walks every storage tree (including uploads/travelers/<id>/) with os.scandir
+and compares it against the files referenced by travelers and company
+settings, which are streamed from a server-side cursor. Scans run as a
+background job, report progress in orphan_scans and persist their findings in
+orphan_scan_files; deletion only ever acts on those persisted rows.
+"""
+
+import os
+import time
+from datetime import datetime
+from psycopg2.extras import execute_values
+from app.database import get_db, release_db
+from app import images, jobs, storage, upload_stats
+
+JOB_NAME = 'orphan_scan'
+DOC_COLUMNS = ['passport_scan', 'aadhaar_scan', 'pan_scan', 'vaccine_scan', 'photo']
+TRAVELER_FOLDER = 'travelers'
+
+# Trees that are not document storage (generated files, partial uploads, backups)
+SKIP_FOLDERS = {images.DERIVATIVES_DIR, 'tmp', 'cache', 'backups'}
+
+FLUSH_EVERY = 500
+STALE_MINUTES = 10  # A running scan without progress for this long is considered dead
+
+# ============================================================
+# DATABASE MIGRATION - Create orphan scan tables if not exists
+# ============================================================
+def migrate_orphan_tables():
+    """Create orphan_scans and orphan_scan_files tables if they don't exist"""
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS orphan_scans (
+                id SERIAL PRIMARY KEY,
+                status VARCHAR(20) DEFAULT 'running',
+                grace_minutes INTEGER DEFAULT 60,
+                started_by INTEGER,
+                current_folder TEXT,
+                referenced_count INTEGER DEFAULT 0,
+                scanned_files INTEGER DEFAULT 0,
+                scanned_bytes BIGINT DEFAULT 0,
+                orphan_count INTEGER DEFAULT 0,
+                orphan_bytes BIGINT DEFAULT 0,
+                error TEXT,
+                started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                finished_at TIMESTAMP
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS orphan_scan_files (
+                id SERIAL PRIMARY KEY,
+                scan_id INTEGER NOT NULL REFERENCES orphan_scans(id) ON DELETE CASCADE,
+                folder TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                size_bytes BIGINT DEFAULT 0,
+                modified_at TIMESTAMP,
+                deleted_at TIMESTAMP
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_orphan_scan_files_scan ON orphan_scan_files (scan_id, folder)")
+        conn.commit()
+        print("✅ orphan scan tables verified!")
+
+    except Exception as e:
+        print(f"⚠️ Migration error: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn:
+            release_db(conn, cursor)
+
+# ============================================================
+# REFERENCES
+# ============================================================
+
+def load_references(conn, scan_id):
+    """
+    Stream every referenced upload from a server-side cursor
+
+    Returns:
+        tuple: (names referenced anywhere, {(traveler_id, name)} for traveler trees)
+    """
+    names = set()
+    traveler_files = set()
+
+    stream = conn.cursor(name=f"orphan_refs_{scan_id}")
+    stream.itersize = 2000
+    try:
+        stream.execute(f"SELECT id, {', '.join(DOC_COLUMNS)} FROM travelers")
+        for row in stream:
+            for column in DOC_COLUMNS:
+                value = row[column]
+                if value:
+                    name = os.path.basename(value)
+                    names.add(name)
+                    traveler_files.add((row['id'], name))
+    finally:
+        stream.close()
+
+    cursor = conn.cursor()
+    cursor.execute("SELECT logo FROM company_settings WHERE logo IS NOT NULL")
+    for row in cursor.fetchall():
+        names.add(os.path.basename(row['logo']))
+    cursor.close()
+
+    return names, traveler_files
+
+def is_referenced(folder, filename, names, traveler_files):
+    """Check a stored file against the reference sets"""
+    parts = folder.split('/')
+    if parts[0] == TRAVELER_FOLDER:
+        if len(parts) < 2 or not parts[1].isdigit():
+            return False
+        return (int(parts[1]), filename) in traveler_files
+    return filename in names
+
+# ============================================================
+# SCAN
+# ============================================================
+
+def iter_storage(upload_root):
+    """Yield (folder, DirEntry) for every stored file below the upload root"""
+    def walk(path, folder):
+        try:
+            entries = os.scandir(path)
+        except (FileNotFoundError, NotADirectoryError):
+            return
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from walk(entry.path, f"{folder}/{entry.name}")
+                elif entry.is_file(follow_symlinks=False) and not entry.name.startswith('.'):
+                    yield folder, entry
+
+    with os.scandir(upload_root) as top:
+        folders = sorted(e.name for e in top if e.is_dir(follow_symlinks=False) and e.name not in SKIP_FOLDERS)
+    for name in folders:
+        yield from walk(os.path.join(upload_root, name), name)
+
+def start_scan(upload_root, user_id=None, grace_minutes=60):
+    """
+    Start a background scan unless one is already running
+
+    Returns:
+        tuple: (scan_id, started) - started is False when an active scan was reused
+    """
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        cursor.execute("""
+            SELECT id FROM orphan_scans
+            WHERE status = 'running'
+              AND updated_at > CURRENT_TIMESTAMP - make_interval(mins => %s)
+            ORDER BY id DESC LIMIT 1
+        """, (STALE_MINUTES,))
+        active = cursor.fetchone()
+        if active:
+            return active['id'], False
+
+        cursor.execute("""
+            INSERT INTO orphan_scans (status, grace_minutes, started_by, started_at, updated_at)
+            VALUES ('running', %s, %s, %s, %s)
+            RETURNING id
+        """, (grace_minutes, user_id, datetime.now(), datetime.now()))
+        scan_id = cursor.fetchone()['id']
+        conn.commit()
+    finally:
+        if conn:
+            release_db(conn, cursor)
+
+    jobs.start(JOB_NAME, run_scan, upload_root, scan_id)
+    return scan_id, True
+
+def run_scan(upload_root, scan_id):
+    """Walk the upload tree and persist orphaned files for one scan row"""
+    conn, cursor = get_db()
+    locked = False
+    try:
+        locked = jobs.try_lock(cursor, JOB_NAME)
+        if not locked:
+            cursor.execute("UPDATE orphan_scans SET status = 'failed', error = %s, finished_at = %s WHERE id = %s",
+                           ('Another scan is already running', datetime.now(), scan_id))
+            conn.commit()
+            return
+
+        # Scans left behind by a restarted worker
+        cursor.execute("""
+            UPDATE orphan_scans SET status = 'failed', error = 'Interrupted', finished_at = %s
+            WHERE status = 'running' AND id <> %s
+        """, (datetime.now(), scan_id))
+
+        cursor.execute("SELECT grace_minutes FROM orphan_scans WHERE id = %s", (scan_id,))
+        cutoff = time.time() - cursor.fetchone()['grace_minutes'] * 60
+
+        names, traveler_files = load_references(conn, scan_id)
+        cursor.execute("UPDATE orphan_scans SET referenced_count = %s, updated_at = %s WHERE id = %s",
+                       (len(names), datetime.now(), scan_id))
+        conn.commit()
+
+        progress = {'files': 0, 'bytes': 0, 'orphans': 0, 'orphan_bytes': 0}
+        pending = []
+        folder = None
+
+        def flush():
+            if pending:
+                execute_values(cursor, """
+                    INSERT INTO orphan_scan_files (scan_id, folder, filename, size_bytes, modified_at)
+                    VALUES %s
+                """, pending)
+                pending.clear()
+            cursor.execute("""
+                UPDATE orphan_scans
+                SET scanned_files = %s, scanned_bytes = %s, orphan_count = %s, orphan_bytes = %s,
+                    current_folder = %s, updated_at = %s
+                WHERE id = %s
+            """, (progress['files'], progress['bytes'], progress['orphans'], progress['orphan_bytes'],
+                  folder, datetime.now(), scan_id))
+            conn.commit()
+
+        for folder, entry in iter_storage(upload_root):
+            stat = entry.stat(follow_symlinks=False)
+            progress['files'] += 1
+            progress['bytes'] += stat.st_size
+
+            # Fresh uploads may not be attached to a traveler yet
+            if stat.st_mtime < cutoff and not is_referenced(folder, entry.name, names, traveler_files):
+                pending.append((scan_id, folder, entry.name, stat.st_size, datetime.fromtimestamp(stat.st_mtime)))
+                progress['orphans'] += 1
+                progress['orphan_bytes'] += stat.st_size
+
+            if progress['files'] % FLUSH_EVERY == 0:
+                flush()
+
+        flush()
+        cursor.execute("UPDATE orphan_scans SET status = 'complete', current_folder = NULL, finished_at = %s WHERE id = %s",
+                       (datetime.now(), scan_id))
+        conn.commit()
+        print(f"✅ Orphan scan {scan_id}: {progress['orphans']} orphans in {progress['files']} files")
+
+    except Exception as e:
+        conn.rollback()
+        cursor.execute("UPDATE orphan_scans SET status = 'failed', error = %s, finished_at = %s WHERE id = %s",
+                       (str(e), datetime.now(), scan_id))
+        conn.commit()
+        raise
+    finally:
+        if locked:
+            jobs.unlock(cursor, JOB_NAME)
+        release_db(conn, cursor)
+
+# ============================================================
+# RESULTS & DELETION
+# ============================================================
+
+def get_scan(cursor, scan_id=None):
+    """Get a scan row (the latest when scan_id is None)"""
+    if scan_id is None:
+        cursor.execute("SELECT * FROM orphan_scans ORDER BY id DESC LIMIT 1")
+    else:
+        cursor.execute("SELECT * FROM orphan_scans WHERE id = %s", (scan_id,))
+    return cursor.fetchone()
+
+def get_scan_files(cursor, scan_id, limit=50, offset=0):
+    """Get the undeleted orphans of a scan plus a per-folder summary"""
+    cursor.execute("""
+        SELECT folder, COUNT(*) as count, COALESCE(SUM(size_bytes), 0) as size_bytes
+        FROM orphan_scan_files
+        WHERE scan_id = %s AND deleted_at IS NULL
+        GROUP BY folder ORDER BY folder
+    """, (scan_id,))
+    by_folder = cursor.fetchall()
+
+    cursor.execute("""
+        SELECT id, folder, filename, size_bytes, modified_at
+        FROM orphan_scan_files
+        WHERE scan_id = %s AND deleted_at IS NULL
+        ORDER BY folder, filename
+        LIMIT %s OFFSET %s
+    """, (scan_id, limit, offset))
+    return by_folder, cursor.fetchall()
+
+def delete_scan_orphans(upload_root, scan_id, file_ids=None):
+    """
+    Delete the orphans recorded by a completed scan
+
+    Paths are rebuilt from the persisted rows and must resolve inside the
+    upload root; files referenced since the scan ran are kept.
+
+    Returns:
+        tuple: (deleted list, error list, bytes freed)
+    """
+    root = os.path.realpath(upload_root)
+    deleted = []
+    errors = []
+    total_size = 0
+
+    conn, cursor = get_db()
+    try:
+        scan = get_scan(cursor, scan_id)
+        if not scan:
+            raise ValueError('Scan not found')
+        if scan['status'] != 'complete':
+            raise ValueError(f"Scan is {scan['status']}")
+
+        query = "SELECT id, folder, filename, size_bytes FROM orphan_scan_files WHERE scan_id = %s AND deleted_at IS NULL"
+        params = [scan_id]
+        if file_ids:
+            query += " AND id = ANY(%s)"
+            params.append([int(file_id) for file_id in file_ids])
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+
+        # Re-check the candidates in case they were attached after the scan
+        candidates = list({row['filename'] for row in rows})
+        conditions = ' OR '.join(f"{column} = ANY(%s)" for column in DOC_COLUMNS)
+        cursor.execute(f"SELECT id, {', '.join(DOC_COLUMNS)} FROM travelers WHERE {conditions}",
+                       [candidates] * len(DOC_COLUMNS))
+        names = set()
+        traveler_files = set()
+        for row in cursor.fetchall():
+            for column in DOC_COLUMNS:
+                if row[column] in candidates:
+                    names.add(row[column])
+                    traveler_files.add((row['id'], row[column]))
+        cursor.execute("SELECT logo FROM company_settings WHERE logo = ANY(%s)", (candidates,))
+        names.update(row['logo'] for row in cursor.fetchall())
+
+        for row in rows:
+            path = os.path.realpath(os.path.join(root, row['folder'], row['filename']))
+            top = row['folder'].split('/')[0]
+            if os.path.commonpath([root, path]) != root or top in SKIP_FOLDERS:
+                errors.append(f"Refusing to delete outside storage: {row['folder']}/{row['filename']}")
+                continue
+            if is_referenced(row['folder'], row['filename'], names, traveler_files):
+                errors.append(f"Now referenced, kept: {row['folder']}/{row['filename']}")
+                continue
+
+            try:
+                if os.path.isfile(path):
+                    size = os.path.getsize(path)
+                    os.remove(path)
+                    upload_stats.record_removed(cursor, row['folder'], row['filename'], size)
+                images.remove_derivatives(root, path)
+                storage.forget_blob(cursor, row['folder'], row['filename'])
+                cursor.execute("UPDATE orphan_scan_files SET deleted_at = %s WHERE id = %s", (datetime.now(), row['id']))
+                deleted.append({
+                    'id': row['id'],
+                    'path': f"{row['folder']}/{row['filename']}",
+                    'filename': row['filename'],
+                    'size': row['size_bytes']
+                })
+                total_size += row['size_bytes'] or 0
+            except OSError as e:
+                errors.append(f"Error deleting {row['folder']}/{row['filename']}: {str(e)}")
+
+        conn.commit()
+        return deleted, errors, total_size
+
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        release_db(conn, cursor)
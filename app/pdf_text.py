@@ -0,0 +1,34 @@
+"""
+PDF payload helpers
+Shared by the dossier, invoice and receipt PDFs: rows are turned into plain
+values before they cross into the render pool, and plain values are turned
+into the text printed in a table cell.
+"""
+
+from datetime import date, datetime
+from decimal import Decimal
+
+def plain_value(value):
+    """Convert DB values to picklable, hash-stable primitives"""
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {k: plain_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [plain_value(v) for v in value]
+    return value
+
+def cell_text(value):
+    """Printable text of a plain value: '-' when empty, ISO dates as 01 Jan 2026"""
+    if value is None or value == '':
+        return '-'
+    text = str(value)
+    # ISO timestamps read better as dates
+    if len(text) >= 10 and text[4:5] == '-' and text[7:8] == '-' and (len(text) == 10 or text[10:11] == 'T'):
+        try:
+            return datetime.fromisoformat(text).strftime('%d %b %Y')
+        except ValueError:
+            pass
+    return text
@@ -0,0 +1,153 @@
+"""
+Printable payment receipts
+Receipts are loaded with the company branding from company_settings and
+printed either as HTML (templates/receipts.html, one receipt per page) or as
+a single reportlab PDF rendered in the render pool.
+"""
+
+import os
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from app import invoice_pdf, render_pool
+from app.pdf_text import plain_value, cell_text
+
+RECEIPT_PDF_VERSION = 1  # Bump when the layout changes to invalidate cached files
+
+RECEIPT_SELECT = """
+    SELECT
+        r.id, r.receipt_number, r.traveler_id, r.payment_id, r.amount, r.receipt_date,
+        r.remarks, r.created_at,
+        COALESCE(r.payment_method, p.payment_method) AS payment_method,
+        COALESCE(r.transaction_id, p.reference) AS reference,
+        COALESCE(r.installment_info, p.installment) AS installment,
+        t.first_name, t.last_name, t.passport_no,
+        COALESCE(p.batch_id, t.batch_id) AS batch_id, b.batch_name
+    FROM receipts r
+    JOIN travelers t ON r.traveler_id = t.id
+    LEFT JOIN payments p ON r.payment_id = p.id
+    LEFT JOIN batches b ON b.id = COALESCE(p.batch_id, t.batch_id)
+"""
+
+def load_branding(cursor, upload_root):
+    """
+    Load the company block printed on receipts
+
+    Returns:
+        tuple: (company dict with logo_url, settings version hash)
+    """
+    company, version = invoice_pdf.load_company(cursor, upload_root)
+    company = dict(company)
+    company['logo_url'] = f"/uploads/company/{os.path.basename(company['logo_path'])}" if company['logo_path'] else None
+    return company, version
+
+def load_receipts(cursor, receipt_id=None, start_date=None, end_date=None, batch_id=None):
+    """Load receipts with traveler, payment and batch details, oldest first"""
+    conditions = []
+    params = []
+    if receipt_id:
+        conditions.append("r.id = %s")
+        params.append(receipt_id)
+    if start_date:
+        conditions.append("r.receipt_date >= %s")
+        params.append(start_date)
+    if end_date:
+        conditions.append("r.receipt_date < %s::date + 1")
+        params.append(end_date)
+    if batch_id:
+        conditions.append("COALESCE(p.batch_id, t.batch_id) = %s")
+        params.append(batch_id)
+
+    query = RECEIPT_SELECT
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY r.receipt_date, r.receipt_number, r.id"
+    cursor.execute(query, params)
+    return [plain_value(dict(row)) for row in cursor.fetchall()]
+
+def submit_receipts_pdf(upload_root, name, company, settings_version, receipts):
+    """Get a Future resolving to the cached PDF of a set of receipts"""
+    payload = {'company': company, 'receipts': receipts}
+    key = render_pool.cache_key(RECEIPT_PDF_VERSION, settings_version, receipts)
+    return key, render_pool.render_cached(upload_root, 'receipts', name, key, render_receipts_pdf, payload)
+
+# ============================================================
+# RENDERING (runs in the render pool)
+# ============================================================
+
+def render_receipts_pdf(output_path, payload):
+    """Render receipts to one PDF, one receipt per page"""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import cm
+    from reportlab.lib.utils import ImageReader
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image, PageBreak
+
+    styles = getSampleStyleSheet()
+    company = payload['company']
+
+    lines = [f"<b>{escape(company['name'])}</b>"]
+    if company['address']:
+        lines.append(escape(str(company['address'])))
+    if company['gstin']:
+        lines.append(f"GSTIN: {escape(str(company['gstin']))}")
+    header_text = '<br/>'.join(lines)
+
+    logo = None
+    if company.get('logo_path'):
+        width, height = ImageReader(company['logo_path']).getSize()
+        scale = min((3 * cm) / width, (2 * cm) / height)
+        logo = (company['logo_path'], width * scale, height * scale)
+
+    grid = TableStyle([
+        ('GRID', (0, 0), (-1, -1), 0.25, colors.grey),
+        ('BACKGROUND', (0, 0), (0, -1), colors.whitesmoke),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP')
+    ])
+
+    story = []
+    for index, receipt in enumerate(payload['receipts']):
+        if index:
+            story.append(PageBreak())
+        header = Paragraph(header_text, styles['Normal'])
+        if logo:
+            top = Table([[Image(logo[0], width=logo[1], height=logo[2]), header]], colWidths=[3.5 * cm, 13.5 * cm])
+            top.setStyle(TableStyle([('VALIGN', (0, 0), (-1, -1), 'MIDDLE')]))
+            story.append(top)
+        else:
+            story.append(header)
+        story.append(Spacer(1, 0.4 * cm))
+        story.append(Paragraph('PAYMENT RECEIPT', styles['Title']))
+
+        name = f"{receipt.get('first_name') or ''} {receipt.get('last_name') or ''}".strip()
+        rows = [
+            ['Receipt No', cell_text(receipt.get('receipt_number'))],
+            ['Date', cell_text(receipt.get('receipt_date'))],
+            ['Received From', Paragraph(escape(name or '-'), styles['Normal'])],
+            ['Passport', cell_text(receipt.get('passport_no'))],
+            ['Batch', Paragraph(escape(cell_text(receipt.get('batch_name'))), styles['Normal'])],
+            ['Amount', f"Rs. {Decimal(str(receipt.get('amount') or 0)):,.2f}"],
+            ['Payment Method', cell_text(receipt.get('payment_method'))],
+            ['Reference', cell_text(receipt.get('reference'))]
+        ]
+        if receipt.get('installment'):
+            rows.append(['Installment', cell_text(receipt['installment'])])
+        if receipt.get('remarks'):
+            rows.append(['Remarks', Paragraph(escape(str(receipt['remarks'])), styles['Normal'])])
+        table = Table(rows, colWidths=[4 * cm, 13 * cm])
+        table.setStyle(grid)
+        story.append(table)
+        story.append(Spacer(1, 1.5 * cm))
+        story.append(Paragraph(escape(company['footer'] or 'Thank you for your payment.'), styles['Normal']))
+        story.append(Spacer(1, 1 * cm))
+        story.append(Paragraph('Authorised Signatory', styles['Normal']))
+
+    if not story:
+        story.append(Paragraph('No receipts found.', styles['Normal']))
+
+    doc = SimpleDocTemplate(output_path, pagesize=A4, leftMargin=2 * cm, rightMargin=2 * cm,
+                            topMargin=1.5 * cm, bottomMargin=1.5 * cm, title='Receipts')
+    doc.build(story)
+    return output_path
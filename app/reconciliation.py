@@ -0,0 +1,340 @@
+"""
+Bank statement reconciliation
+Credits from a bank statement (CSV or XLSX) are matched to payments in two
+passes. The first is a hash join on normalized references: the statement
+reference and any UTR-like token in the narration, against the payment's
+reference. The second takes the lines still unmatched and joins them
+on amount, keeping payments within a few days of the credit as fuzzy
+candidates.
+
+Each statement line ends up as one of:
+    matched          exact reference, same amount
+    amount_mismatch  exact reference, different amount
+    probable         one payment of the same amount within the date window
+    ambiguous        several payments fit
+    duplicate        the credit repeats an earlier line or an already claimed payment
+    unmatched        nothing fits
+"""
+
+import io
+import os
+from datetime import datetime
+
+DATE_WINDOW_DAYS = int(os.getenv('RECONCILE_DATE_WINDOW_DAYS', '3'))
+MIN_REFERENCE_LENGTH = 6
+HEADER_SCAN_ROWS = 50
+
+# Indian statements write the day first; spreadsheet cells come through as ISO
+DATE_FORMATS = ['%d/%m/%Y', '%d/%m/%y', '%d-%m-%Y', '%d-%m-%y', '%d-%b-%Y', '%d-%b-%y', '%d %b %Y',
+                '%d.%m.%Y', '%Y-%m-%d', '%Y-%m-%d %H:%M:%S', '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M']
+
+# Lower-cased statement headers that hold each field, first found wins
+COLUMN_ALIASES = {
+    'date': ['txn date', 'transaction date', 'value date', 'date', 'posting date', 'tran date'],
+    'reference': ['utr', 'utr no', 'utr number', 'reference', 'reference no', 'ref no', 'ref no./cheque no.',
+                  'chq/ref no', 'chq./ref.no.', 'cheque/ref no', 'transaction id', 'txn id'],
+    'narration': ['narration', 'description', 'particulars', 'remarks', 'transaction remarks', 'details'],
+    'credit': ['credit', 'credit amount', 'deposit', 'deposits', 'deposit amt', 'deposit amt.', 'cr amount',
+               'amount (cr)', 'credit amt'],
+    'amount': ['amount', 'transaction amount', 'txn amount']
+}
+
+# Rail prefixes banks put in front of the same UTR
+_REFERENCE_PREFIXES = r'^(?:UTR|NEFT|IMPS|RTGS|UPI|REF|TXN|INB|MB)+'
+
+# Payments in these states can still be claimed by a credit
+OPEN_PAYMENT_STATUSES = ('pending', 'completed')
+
+# ============================================================
+# STATEMENT INGEST
+# ============================================================
+
+def normalize_references(series):
+    """Upper-case, drop punctuation, rail prefixes and leading zeros from a Series of references"""
+    return (series.fillna('').astype(str).str.upper()
+            .str.replace(r'[^A-Z0-9]', '', regex=True)
+            .str.replace(_REFERENCE_PREFIXES, '', regex=True)
+            .str.lstrip('0'))
+
+def _parse_amounts(series):
+    import pandas as pd
+    cleaned = series.fillna('').astype(str).str.replace(r'[^0-9.\-]', '', regex=True)
+    return pd.to_numeric(cleaned, errors='coerce').round(2)
+
+def _parse_dates(series):
+    """Parse statement dates with the format that fits most of them (day-first formats tried first)"""
+    import pandas as pd
+    values = series.fillna('').astype(str).str.strip()
+    best, best_count = None, 0
+    for fmt in DATE_FORMATS:
+        parsed = pd.to_datetime(values, format=fmt, errors='coerce')
+        count = int(parsed.notna().sum())
+        if count > best_count:
+            best, best_count = parsed, count
+        if count == int((values != '').sum()):
+            break
+    if best is None:
+        best = pd.to_datetime(values, format='mixed', dayfirst=True, errors='coerce')
+    return best.dt.date
+
+def _find_header(rows):
+    """Index of the first row that names a date and an amount column (statements start with a preamble)"""
+    amount_names = set(COLUMN_ALIASES['credit']) | set(COLUMN_ALIASES['amount'])
+    for index, row in enumerate(rows[:HEADER_SCAN_ROWS]):
+        names = {str(cell).strip().lower() for cell in row if cell is not None}
+        if names & set(COLUMN_ALIASES['date']) and names & amount_names:
+            return index
+    raise ValueError('Could not find the statement header row (need a date and a credit/amount column)')
+
+def _pick(columns, field):
+    lowered = {str(c).strip().lower(): c for c in columns}
+    for alias in COLUMN_ALIASES[field]:
+        if alias in lowered:
+            return lowered[alias]
+    return None
+
+def read_statement(stream, filename):
+    """
+    Read the credit lines of a bank statement
+
+    Args:
+        stream: file object with the statement
+        filename: used to tell CSV from XLSX
+
+    Returns:
+        DataFrame: line, date, reference, narration, amount, ref_key
+    """
+    import pandas as pd
+
+    ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if ext in ('xlsx', 'xls'):
+        raw = pd.read_excel(stream, header=None, dtype=str)
+        header = _find_header(raw.head(HEADER_SCAN_ROWS).values.tolist())
+        frame = raw.iloc[header + 1:].copy()
+        frame.columns = [str(c).strip() for c in raw.iloc[header]]
+    elif ext in ('csv', 'txt'):
+        text = stream.read()
+        if isinstance(text, bytes):
+            text = text.decode('utf-8-sig', errors='replace')
+        import csv
+        preview = list(csv.reader(io.StringIO('\n'.join(text.splitlines()[:HEADER_SCAN_ROWS]))))
+        header = _find_header(preview)
+        frame = pd.read_csv(io.StringIO(text), skiprows=header, dtype=str, skipinitialspace=True,
+                            on_bad_lines='skip')
+        frame.columns = [str(c).strip() for c in frame.columns]
+    else:
+        raise ValueError('Statement must be a CSV or XLSX file')
+
+    frame['line'] = range(header + 2, header + 2 + len(frame))
+    date_col = _pick(frame.columns, 'date')
+    credit_col = _pick(frame.columns, 'credit') or _pick(frame.columns, 'amount')
+    reference_col = _pick(frame.columns, 'reference')
+    narration_col = _pick(frame.columns, 'narration')
+
+    lines = pd.DataFrame({
+        'line': frame['line'],
+        'date': _parse_dates(frame[date_col]),
+        'reference': frame[reference_col].fillna('').astype(str).str.strip() if reference_col else '',
+        'narration': frame[narration_col].fillna('').astype(str).str.strip() if narration_col else '',
+        'amount': _parse_amounts(frame[credit_col])
+    })
+    # Only credits: debit lines have no credit amount, totals rows have no date
+    lines = lines[(lines['amount'] > 0) & lines['date'].notna()].reset_index(drop=True)
+    lines['ref_key'] = normalize_references(lines['reference'])
+    return lines
+
+# ============================================================
+# MATCHING
+# ============================================================
+
+def load_payments(cursor, lines, window_days=DATE_WINDOW_DAYS):
+    """Load payments that could match the statement: any with a reference, plus the date range"""
+    import pandas as pd
+
+    start = min(lines['date']) if len(lines) else None
+    end = max(lines['date']) if len(lines) else None
+    cursor.execute("""
+        SELECT
+            p.id AS payment_id, p.traveler_id, p.batch_id, p.amount::float8 AS payment_amount,
+            p.payment_date::date AS payment_date, p.status, p.reference AS payment_reference,
+            t.first_name, t.last_name
+        FROM payments p
+        LEFT JOIN travelers t ON t.id = p.traveler_id
+        WHERE p.status = ANY(%s)
+          AND (COALESCE(p.reference, '') <> ''
+               OR (p.payment_date >= %s::date - %s AND p.payment_date < %s::date + %s + 1))
+    """, (list(OPEN_PAYMENT_STATUSES), start, window_days, end, window_days))
+    columns = ['payment_id', 'traveler_id', 'batch_id', 'payment_amount', 'payment_date', 'status',
+               'payment_reference', 'first_name', 'last_name']
+    return pd.DataFrame([dict(row) for row in cursor.fetchall()], columns=columns)
+
+def _statement_keys(lines):
+    """One row per (line, key): the reference plus UTR-like tokens of the narration"""
+    import pandas as pd
+    tokens = (lines['narration'].str.upper()
+              .str.findall(r'[A-Z0-9]*\d[A-Z0-9]{%d,}' % (MIN_REFERENCE_LENGTH - 2)))
+    keys = pd.concat([
+        lines[['line', 'ref_key']].rename(columns={'ref_key': 'key'}),
+        pd.DataFrame({'line': lines['line'], 'key': tokens}).explode('key')
+    ])
+    keys['key'] = normalize_references(keys['key'])
+    keys = keys[keys['key'].str.len() >= MIN_REFERENCE_LENGTH]
+    return keys.drop_duplicates()
+
+def _payment_keys(payments):
+    import pandas as pd
+    keys = pd.DataFrame({'payment_id': payments['payment_id'], 'key': payments['payment_reference']})
+    keys['key'] = normalize_references(keys['key'])
+    keys = keys[keys['key'].str.len() >= MIN_REFERENCE_LENGTH]
+    return keys.drop_duplicates()
+
+def _set(result, frame, **values):
+    """Assign columns of result for the lines in frame (result is indexed by line)"""
+    for column, value in values.items():
+        result.loc[frame['line'].values, column] = value if not hasattr(value, 'values') else value.values
+
+def _candidate_lists(frame):
+    return frame.groupby('line', sort=False)['payment_id'].agg(lambda ids: [int(i) for i in ids])
+
+def reconcile(lines, payments, window_days=DATE_WINDOW_DAYS):
+    """
+    Match statement lines to payments
+
+    Returns:
+        DataFrame: one row per statement line with status, payment_id and
+        candidates (payment ids for probable/ambiguous/duplicate lines)
+    """
+    import pandas as pd
+
+    result = lines.copy()
+    result['status'] = 'unmatched'
+    result['payment_id'] = pd.Series([None] * len(result), dtype=object)
+    result['candidates'] = pd.Series([[] for _ in range(len(result))], dtype=object)
+    if result.empty:
+        return result
+    result = result.set_index('line', drop=False)
+
+    # Same reference, amount and date twice on the statement: the later copies are duplicates
+    keyed = result[result['ref_key'] != '']
+    repeated = keyed.duplicated(['ref_key', 'amount', 'date'], keep='first')
+    result.loc[keyed.index[repeated], 'status'] = 'duplicate'
+
+    if payments.empty:
+        return result.reset_index(drop=True)
+    amounts = payments.set_index('payment_id')['payment_amount']
+    claimed = set()
+
+    # Pass 1: hash join on normalized references, preferring payments of the same amount
+    open_lines = result[result['status'] == 'unmatched']
+    exact = _statement_keys(open_lines).merge(_payment_keys(payments), on='key')
+    exact = exact[['line', 'payment_id']].drop_duplicates()
+    if not exact.empty:
+        exact['same_amount'] = (exact['line'].map(result['amount']) - exact['payment_id'].map(amounts)).abs() < 0.005
+        exact = exact[exact['same_amount'] | ~exact.groupby('line')['same_amount'].transform('any')]
+        exact = exact.sort_values(['line', 'payment_id'])
+        per_line = exact.groupby('line')['payment_id'].transform('size')
+
+        # One payment per line: the earliest line claims it, later ones are duplicates
+        single = exact[per_line == 1]
+        again = single.duplicated('payment_id', keep='first')
+        first = single[~again]
+        _set(result, first, payment_id=first['payment_id'].astype(object),
+             status=first['same_amount'].map({True: 'matched', False: 'amount_mismatch'}))
+        _set(result, single[again], status='duplicate')
+        claimed.update(int(pid) for pid in first['payment_id'])
+
+        # Several payments per line (shared references) are rare: decide them one by one
+        for line, ids in _candidate_lists(exact[per_line > 1]).items():
+            free = [pid for pid in ids if pid not in claimed]
+            result.at[line, 'status'] = 'ambiguous' if free else 'duplicate'
+            result.at[line, 'candidates'] = free or ids
+        duplicates = single[again]
+        if not duplicates.empty:
+            result.loc[duplicates['line'].values, 'candidates'] = pd.Series(
+                [[int(pid)] for pid in duplicates['payment_id']], index=duplicates['line'].values, dtype=object)
+
+    # Pass 2: amount join with a date window, for what is left on both sides
+    open_lines = result[result['status'] == 'unmatched']
+    open_payments = payments[~payments['payment_id'].isin(claimed)]
+    if not open_lines.empty and not open_payments.empty:
+        left = open_lines[['line', 'date', 'amount']].reset_index(drop=True)
+        left['cents'] = (left['amount'] * 100).round().astype('int64')
+        right = open_payments[['payment_id', 'payment_date', 'payment_amount']].copy()
+        right['cents'] = (right['payment_amount'] * 100).round().astype('int64')
+        fuzzy = left.merge(right, on='cents')
+        days_apart = (pd.to_datetime(fuzzy['date']) - pd.to_datetime(fuzzy['payment_date'])).dt.days.abs()
+        fuzzy = fuzzy[days_apart <= window_days].assign(days_apart=days_apart)
+        fuzzy = fuzzy.sort_values(['line', 'days_apart', 'payment_id'])
+
+        if not fuzzy.empty:
+            # A payment that fits several credits is not a safe match for any of them
+            per_line = fuzzy.groupby('line')['payment_id'].transform('size')
+            per_payment = fuzzy.groupby('payment_id')['line'].transform('nunique')
+            probable = fuzzy[(per_line == 1) & (per_payment == 1)]
+            _set(result, fuzzy, status='ambiguous')
+            _set(result, probable, status='probable', payment_id=probable['payment_id'].astype(object))
+            candidates = _candidate_lists(fuzzy)
+            result.loc[candidates.index, 'candidates'] = candidates
+
+    return result.reset_index(drop=True)
+
+def summarize(result):
+    """Line counts and amounts per status"""
+    summary = {}
+    for status, group in result.groupby('status'):
+        summary[status] = {'count': int(len(group)), 'amount': round(float(group['amount'].sum()), 2)}
+    return summary
+
+# ============================================================
+# APPLY
+# ============================================================
+
+def complete_matched(cursor, result, payments, include_probable=False):
+    """
+    Mark the pending payments of matched lines as completed
+
+    Runs as one UPDATE in the caller's transaction; payments that stopped
+    being pending meanwhile are left alone.
+
+    Returns:
+        list: rows of (payment_id, traveler_id, payment_date) that were completed
+    """
+    from psycopg2.extras import execute_values
+
+    statuses = ['matched', 'probable'] if include_probable else ['matched']
+    chosen = result[result['status'].isin(statuses) & result['payment_id'].notna()]
+    if chosen.empty or payments.empty:
+        return []
+    pending = set(payments.loc[payments['status'] == 'pending', 'payment_id'].astype(int))
+    stamp = datetime.now()
+    values = [
+        (int(row.payment_id), row.reference or row.ref_key or None,
+         f"Reconciled with bank statement line {row.line} ({row.date.isoformat()})")
+        for row in chosen.itertuples() if int(row.payment_id) in pending
+    ]
+    if not values:
+        return []
+    return execute_values(cursor, """
+        UPDATE payments p SET
+            status = 'completed',
+            reference = COALESCE(NULLIF(p.reference, ''), v.reference),
+            notes = CONCAT_WS(' | ', NULLIF(p.notes, ''), v.note),
+            updated_at = v.stamp
+        FROM (VALUES %s) AS v (id, reference, note, stamp)
+        WHERE p.id = v.id AND p.status = 'pending'
+        RETURNING p.id AS payment_id, p.traveler_id, p.payment_date
+    """, [value + (stamp,) for value in values], template='(%s::int, %s, %s, %s::timestamp)',
+        page_size=len(values), fetch=True)
+
+def serialize_line(row):
+    """JSON-friendly dict of one reconciled line"""
+    return {
+        'line': int(row['line']),
+        'date': row['date'].isoformat() if row['date'] else None,
+        'reference': row['reference'] or None,
+        'narration': row['narration'] or None,
+        'amount': float(row['amount']),
+        'status': row['status'],
+        'payment_id': int(row['payment_id']) if row['payment_id'] is not None else None,
+        'candidates': list(row['candidates'])
+    }
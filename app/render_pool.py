@@ -0,0 +1,106 @@
+"""
+PDF render pool
+CPU-heavy document rendering (reportlab) runs in a small process pool so it
+never blocks request threads or the GIL of a gunicorn worker. Rendered files
+are cached on disk under uploads/cache/<kind>/ and keyed by a hash of
+everything that went into them, so unchanged documents are never re-rendered.
+"""
+
+import os
+import json
+import glob
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+
+CACHE_DIR = 'cache'
+
+_pool = None
+_pool_lock = threading.Lock()
+_pending = {}
+_pending_lock = threading.Lock()
+
+def get_pool():
+    """Get the shared render pool (spawned processes, safe alongside threads)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            workers = int(os.getenv('RENDER_WORKERS', '2'))
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+def cache_key(*parts):
+    """Hash JSON-serialisable inputs into a cache key"""
+    payload = json.dumps(parts, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def cache_path(upload_root, kind, name, key, ext='pdf'):
+    """Get the cache file path of a rendered document"""
+    return os.path.join(upload_root, CACHE_DIR, kind, f"{name}-{key}.{ext}")
+
+def _prune(upload_root, kind, name, keep_path, ext):
+    """Drop older renders of the same document"""
+    pattern = os.path.join(upload_root, CACHE_DIR, kind, f"{glob.escape(name)}-*.{ext}")
+    for path in glob.glob(pattern):
+        if path != keep_path:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+def render_cached(upload_root, kind, name, key, func, *args, ext='pdf'):
+    """
+    Get a cached render or queue one in the pool
+
+    func(output_path, *args) runs in a worker process and must be a
+    module-level function taking picklable arguments.
+
+    Returns:
+        Future: resolves to the path of the rendered file
+    """
+    path = cache_path(upload_root, kind, name, key, ext)
+    if os.path.isfile(path):
+        done = Future()
+        done.set_result(path)
+        return done
+
+    with _pending_lock:
+        if path in _pending:
+            return _pending[path]
+        result = Future()
+        _pending[path] = result
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+
+    def finished(job):
+        try:
+            job.result()
+            os.replace(tmp_path, path)
+            _prune(upload_root, kind, name, path, ext)
+            result.set_result(path)
+        except Exception as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            result.set_exception(e)
+        finally:
+            with _pending_lock:
+                _pending.pop(path, None)
+
+    try:
+        try:
+            job = get_pool().submit(func, tmp_path, *args)
+        except BrokenProcessPool:
+            # A crashed worker poisons the pool - start a fresh one
+            global _pool
+            with _pool_lock:
+                _pool = None
+            job = get_pool().submit(func, tmp_path, *args)
+        job.add_done_callback(finished)
+    except Exception as e:
+        with _pending_lock:
+            _pending.pop(path, None)
+        result.set_exception(e)
+    return result
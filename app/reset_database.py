@@ -9,6 +9,7 @@ import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from app.database import get_db, init_db, release_db
+from app import rollups, seats, rooms
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -28,6 +29,9 @@ def reset_database():
         # Drop all tables in correct order (respect foreign keys)
         print("Dropping existing tables...")
         
+        cursor.execute("DROP TABLE IF EXISTS room_assignments CASCADE")
+        cursor.execute("DROP TABLE IF EXISTS rooms CASCADE")
+        cursor.execute("DROP TABLE IF EXISTS seat_holds CASCADE")
         cursor.execute("DROP TABLE IF EXISTS receipts CASCADE")
         cursor.execute("DROP TABLE IF EXISTS payments CASCADE")
         cursor.execute("DROP TABLE IF EXISTS invoices CASCADE")
@@ -51,6 +55,16 @@ def reset_database():
         init_db()
         print("✅ Tables created successfully")
         
+        # Seat holds live on the new batches table; the seeded travelers
+        # are not counted in booked_seats until reconciled
+        seats.migrate_seat_tables()
+        seats.reconcile(repair=True)
+        rooms.migrate_room_tables()
+        
+        # Summary tables outlive the drop, so recompute them from the fresh data
+        rollups.migrate_daily_rollup_tables()
+        rollups.rebuild_daily()
+        
         print("\n✅ Database reset complete!")
         return True
         
@@ -0,0 +1,603 @@
+"""
+Reporting rollups
+Summary tables that are kept current on every write, so finance reports read a
+handful of pre-aggregated rows instead of scanning invoices and payments.
+
+aging_rollup holds one row per traveler: invoiced, paid and outstanding
+amounts, with the outstanding part split into aging buckets. Completed
+payments are applied to the traveler's invoices oldest due date first.
+
+daily_payment_rollup and daily_registration_rollup hold counts and amounts per
+day, batch, payment method and status, with days in the business time zone
+(Asia/Kolkata). Writers recompute only the days they touched.
+"""
+
+import os
+from app.database import get_db, release_db
+from app import jobs
+
+AGING_BUCKETS = [
+    ('current_due', 'Current'),
+    ('days_1_30', '1-30 Days'),
+    ('days_31_60', '31-60 Days'),
+    ('days_61_90', '61-90 Days'),
+    ('days_90_plus', '90+ Days')
+]
+
+# Buckets move as days pass, so rows built before today are re-aged
+AGING_INTERVAL = int(os.getenv('AGING_ROLLUP_INTERVAL', '3600'))
+
+# Travelers re-aged per transaction by the rebuild job
+AGING_REBUILD_CHUNK = int(os.getenv('AGING_REBUILD_CHUNK', '500'))
+
+# Invoices in these states are not owed
+VOID_INVOICE_STATUSES = ('cancelled', 'void')
+
+# Day boundaries of the daily rollups
+BUSINESS_TIMEZONE = os.getenv('BUSINESS_TIMEZONE', 'Asia/Kolkata')
+
+# ============================================================
+# DATABASE MIGRATION - Create rollup tables if not exists
+# ============================================================
+def migrate_rollup_tables():
+    """Create aging_rollup table if it doesn't exist"""
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS aging_rollup (
+                traveler_id INTEGER PRIMARY KEY REFERENCES travelers(id) ON DELETE CASCADE,
+                as_of DATE NOT NULL DEFAULT CURRENT_DATE,
+                invoice_count INTEGER DEFAULT 0,
+                invoiced DECIMAL(12,2) DEFAULT 0,
+                paid DECIMAL(12,2) DEFAULT 0,
+                outstanding DECIMAL(12,2) DEFAULT 0,
+                unapplied DECIMAL(12,2) DEFAULT 0,
+                current_due DECIMAL(12,2) DEFAULT 0,
+                days_1_30 DECIMAL(12,2) DEFAULT 0,
+                days_31_60 DECIMAL(12,2) DEFAULT 0,
+                days_61_90 DECIMAL(12,2) DEFAULT 0,
+                days_90_plus DECIMAL(12,2) DEFAULT 0,
+                oldest_due_date DATE,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_aging_rollup_as_of ON aging_rollup (as_of)")
+        conn.commit()
+        print("✅ aging_rollup table verified!")
+
+    except Exception as e:
+        print(f"⚠️ Migration error: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn:
+            release_db(conn, cursor)
+
+def migrate_daily_rollup_tables():
+    """Create the daily rollup tables if they don't exist, backfilling them when new"""
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+
+        # batch 0 and '' stand in for missing values so they can be part of the key
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS daily_payment_rollup (
+                day DATE NOT NULL,
+                batch_id INTEGER NOT NULL DEFAULT 0,
+                payment_method VARCHAR(50) NOT NULL DEFAULT '',
+                status VARCHAR(50) NOT NULL DEFAULT '',
+                payment_count INTEGER DEFAULT 0,
+                amount DECIMAL(14,2) DEFAULT 0,
+                receipt_count INTEGER DEFAULT 0,
+                receipt_amount DECIMAL(14,2) DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (day, batch_id, payment_method, status)
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS daily_registration_rollup (
+                day DATE NOT NULL,
+                batch_id INTEGER NOT NULL DEFAULT 0,
+                status VARCHAR(50) NOT NULL DEFAULT '',
+                traveler_count INTEGER DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (day, batch_id, status)
+            )
+        """)
+        # Source indexes for recomputing a handful of days
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_receipts_receipt_date ON receipts (receipt_date)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_receipts_payment_id ON receipts (payment_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_travelers_created_at ON travelers (created_at)")
+        conn.commit()
+        print("✅ daily rollup tables verified!")
+
+        if daily_needs_backfill(cursor):
+            refresh_daily_payments(cursor)
+            refresh_daily_registrations(cursor)
+            conn.commit()
+            print("✅ daily rollups backfilled")
+
+    except Exception as e:
+        print(f"⚠️ Migration error: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn:
+            release_db(conn, cursor)
+
+# ============================================================
+# AGING ROLLUP
+# ============================================================
+
+_AGING_SQL = """
+    WITH scope AS (
+        SELECT t.id AS traveler_id FROM travelers t
+        WHERE t.id = ANY(%(traveler_ids)s::int[])
+    ),
+    inv AS (
+        SELECT
+            i.id, i.traveler_id,
+            COALESCE(i.amount, 0) AS amount,
+            COALESCE(i.due_date, i.invoice_date, i.created_at)::date AS due_date
+        FROM invoices i
+        JOIN scope s ON s.traveler_id = i.traveler_id
+        WHERE COALESCE(i.status, '') <> ALL(%(void)s)
+    ),
+    ordered AS (
+        SELECT inv.*,
+               SUM(amount) OVER (PARTITION BY traveler_id ORDER BY due_date, id) - amount AS before
+        FROM inv
+    ),
+    pay AS (
+        SELECT p.traveler_id, SUM(p.amount) AS paid
+        FROM payments p
+        JOIN scope s ON s.traveler_id = p.traveler_id
+        WHERE p.status = 'completed'
+        GROUP BY p.traveler_id
+    ),
+    applied AS (
+        SELECT o.traveler_id, o.amount, o.due_date,
+               o.amount - LEAST(o.amount, GREATEST(COALESCE(p.paid, 0) - o.before, 0)) AS open_amount
+        FROM ordered o
+        LEFT JOIN pay p ON p.traveler_id = o.traveler_id
+    ),
+    totals AS (
+        SELECT
+            traveler_id,
+            COUNT(*) AS invoice_count,
+            SUM(amount) AS invoiced,
+            SUM(open_amount) AS outstanding,
+            SUM(open_amount) FILTER (WHERE CURRENT_DATE - due_date <= 0) AS current_due,
+            SUM(open_amount) FILTER (WHERE CURRENT_DATE - due_date BETWEEN 1 AND 30) AS days_1_30,
+            SUM(open_amount) FILTER (WHERE CURRENT_DATE - due_date BETWEEN 31 AND 60) AS days_31_60,
+            SUM(open_amount) FILTER (WHERE CURRENT_DATE - due_date BETWEEN 61 AND 90) AS days_61_90,
+            SUM(open_amount) FILTER (WHERE CURRENT_DATE - due_date > 90) AS days_90_plus,
+            MIN(due_date) FILTER (WHERE open_amount > 0) AS oldest_due_date
+        FROM applied
+        GROUP BY traveler_id
+    ),
+    fresh AS (
+        SELECT
+            s.traveler_id,
+            COALESCE(t.invoice_count, 0) AS invoice_count,
+            COALESCE(t.invoiced, 0) AS invoiced,
+            COALESCE(p.paid, 0) AS paid,
+            COALESCE(t.outstanding, 0) AS outstanding,
+            GREATEST(COALESCE(p.paid, 0) - COALESCE(t.invoiced, 0), 0) AS unapplied,
+            COALESCE(t.current_due, 0) AS current_due,
+            COALESCE(t.days_1_30, 0) AS days_1_30,
+            COALESCE(t.days_31_60, 0) AS days_31_60,
+            COALESCE(t.days_61_90, 0) AS days_61_90,
+            COALESCE(t.days_90_plus, 0) AS days_90_plus,
+            t.oldest_due_date
+        FROM scope s
+        LEFT JOIN totals t ON t.traveler_id = s.traveler_id
+        LEFT JOIN pay p ON p.traveler_id = s.traveler_id
+        WHERE t.traveler_id IS NOT NULL OR p.traveler_id IS NOT NULL
+    ),
+    removed AS (
+        DELETE FROM aging_rollup r
+        WHERE r.traveler_id = ANY(%(traveler_ids)s::int[])
+          AND NOT EXISTS (SELECT 1 FROM fresh f WHERE f.traveler_id = r.traveler_id)
+        RETURNING r.traveler_id
+    )
+    INSERT INTO aging_rollup (
+        traveler_id, as_of, invoice_count, invoiced, paid, outstanding, unapplied,
+        current_due, days_1_30, days_31_60, days_61_90, days_90_plus, oldest_due_date, updated_at
+    )
+    SELECT
+        traveler_id, CURRENT_DATE, invoice_count, invoiced, paid, outstanding, unapplied,
+        current_due, days_1_30, days_31_60, days_61_90, days_90_plus, oldest_due_date, CURRENT_TIMESTAMP
+    FROM fresh
+    ON CONFLICT (traveler_id) DO UPDATE SET
+        as_of = EXCLUDED.as_of,
+        invoice_count = EXCLUDED.invoice_count,
+        invoiced = EXCLUDED.invoiced,
+        paid = EXCLUDED.paid,
+        outstanding = EXCLUDED.outstanding,
+        unapplied = EXCLUDED.unapplied,
+        current_due = EXCLUDED.current_due,
+        days_1_30 = EXCLUDED.days_1_30,
+        days_31_60 = EXCLUDED.days_31_60,
+        days_61_90 = EXCLUDED.days_61_90,
+        days_90_plus = EXCLUDED.days_90_plus,
+        oldest_due_date = EXCLUDED.oldest_due_date,
+        updated_at = EXCLUDED.updated_at
+"""
+
+def refresh_aging(cursor, traveler_ids):
+    """
+    Recompute the aging rows of some travelers
+
+    Call inside the transaction that wrote their invoices or payments. A
+    transaction lock per traveler, taken in key order, makes writers to the
+    same traveler refresh one after the other, so the last refresh always sees
+    every committed row; writers to other travelers are not held up.
+    """
+    traveler_ids = sorted({int(t) for t in traveler_ids if t})
+    if not traveler_ids:
+        return
+    for key in sorted({jobs.lock_key(f'aging_rollup:{t}') for t in traveler_ids}):
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", (key,))
+    cursor.execute(_AGING_SQL, {
+        'traveler_ids': traveler_ids,
+        'void': list(VOID_INVOICE_STATUSES)
+    })
+
+def aging_needs_refresh(cursor):
+    """Check if the rollup was never built or has rows aged before today"""
+    cursor.execute("""
+        SELECT
+            EXISTS (SELECT 1 FROM aging_rollup WHERE as_of < CURRENT_DATE) AS stale,
+            NOT EXISTS (SELECT 1 FROM aging_rollup)
+                AND (EXISTS (SELECT 1 FROM invoices) OR EXISTS (SELECT 1 FROM payments)) AS empty
+    """)
+    row = cursor.fetchone()
+    return bool(row['stale'] or row['empty'])
+
+def rebuild_aging():
+    """
+    Re-age every traveler (daily bucket shift and repair), returns the row count
+
+    Travelers are refreshed AGING_REBUILD_CHUNK at a time, each chunk in its
+    own transaction, so writers wait at most for one chunk.
+    """
+    conn, cursor = get_db()
+    if not conn:
+        return 0
+    try:
+        cursor.execute("SELECT id FROM travelers ORDER BY id")
+        traveler_ids = [row['id'] for row in cursor.fetchall()]
+        count = 0
+        for start in range(0, len(traveler_ids), AGING_REBUILD_CHUNK):
+            refresh_aging(cursor, traveler_ids[start:start + AGING_REBUILD_CHUNK])
+            count += cursor.rowcount
+            conn.commit()
+        print(f"✅ aging_rollup rebuilt ({count} travelers)")
+        return count
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        release_db(conn, cursor)
+
+def rebuild_aging_if_stale():
+    """Scheduled job: rebuild only when the rollup is out of date"""
+    conn, cursor = get_db()
+    if not conn:
+        return
+    try:
+        stale = aging_needs_refresh(cursor)
+    finally:
+        release_db(conn, cursor)
+    if stale:
+        rebuild_aging()
+
+def aging_freshness(cursor):
+    """
+    Describe how current the rollup is
+
+    Returns:
+        dict: as_of (oldest row date or None) and stale (the rebuild job has
+        not caught up yet)
+    """
+    cursor.execute("SELECT MIN(as_of) AS as_of FROM aging_rollup")
+    as_of = cursor.fetchone()['as_of']
+    return {'as_of': as_of, 'stale': aging_needs_refresh(cursor)}
+
+def get_aging(cursor, group_by='batch', batch_id=None):
+    """
+    Read the aging report from the rollup
+
+    Args:
+        group_by: 'batch' (one row per batch) or 'traveler'
+        batch_id: limit to one batch
+
+    Returns:
+        tuple: (rows, totals dict)
+    """
+    amounts = ['invoiced', 'paid', 'outstanding', 'unapplied'] + [column for column, _ in AGING_BUCKETS]
+    where = "WHERE t.batch_id = %s" if batch_id else ""
+    params = (batch_id,) if batch_id else ()
+
+    if group_by == 'traveler':
+        cursor.execute(f"""
+            SELECT
+                r.traveler_id, t.first_name, t.last_name, t.passport_no, t.mobile,
+                t.batch_id, b.batch_name, r.invoice_count, r.oldest_due_date, r.as_of,
+                {', '.join(f'r.{a}' for a in amounts)}
+            FROM aging_rollup r
+            JOIN travelers t ON t.id = r.traveler_id
+            LEFT JOIN batches b ON b.id = t.batch_id
+            {where}
+            ORDER BY r.outstanding DESC, r.traveler_id
+        """, params)
+    else:
+        cursor.execute(f"""
+            SELECT
+                t.batch_id, b.batch_name, COUNT(*) AS traveler_count,
+                SUM(r.invoice_count) AS invoice_count, MIN(r.oldest_due_date) AS oldest_due_date,
+                MIN(r.as_of) AS as_of,
+                {', '.join(f'SUM(r.{a}) AS {a}' for a in amounts)}
+            FROM aging_rollup r
+            JOIN travelers t ON t.id = r.traveler_id
+            LEFT JOIN batches b ON b.id = t.batch_id
+            {where}
+            GROUP BY t.batch_id, b.batch_name
+            ORDER BY SUM(r.outstanding) DESC, b.batch_name
+        """, params)
+    rows = cursor.fetchall()
+
+    totals = {a: sum((row[a] or 0) for row in rows) for a in amounts}
+    return rows, totals
+
+# ============================================================
+# DAILY ROLLUPS
+# ============================================================
+
+def _local_day(column):
+    """SQL for the business day of a timestamp stored in the server's time zone"""
+    return f"(({column} AT TIME ZONE current_setting('TimeZone')) AT TIME ZONE %(tz)s)::date"
+
+def _day_start(day):
+    """SQL for the server-time timestamp at which a business day starts"""
+    return f"(({day})::timestamp AT TIME ZONE %(tz)s) AT TIME ZONE current_setting('TimeZone')"
+
+LOCAL_TODAY_SQL = "(CURRENT_TIMESTAMP AT TIME ZONE %(tz)s)::date"
+
+# payment_date is entered as a business date (its time part is ignored);
+# receipts and registrations are server-time timestamps. Every source is
+# bounded by the first and last day so its index is used
+_DAILY_PAYMENT_SQL = f"""
+    WITH fresh AS (
+        SELECT day, batch_id, payment_method, status,
+               SUM(payment_count) AS payment_count, SUM(amount) AS amount,
+               SUM(receipt_count) AS receipt_count, SUM(receipt_amount) AS receipt_amount
+        FROM (
+            SELECT
+                p.payment_date::date AS day, COALESCE(p.batch_id, 0) AS batch_id,
+                COALESCE(p.payment_method, '') AS payment_method, COALESCE(p.status, '') AS status,
+                1 AS payment_count, COALESCE(p.amount, 0) AS amount,
+                0 AS receipt_count, 0 AS receipt_amount
+            FROM payments p
+            WHERE p.payment_date IS NOT NULL
+              AND (%(all)s OR (
+                  p.payment_date >= %(first_day)s::date AND p.payment_date < %(last_day)s::date + 1
+                  AND p.payment_date::date = ANY(%(days)s::date[])))
+            UNION ALL
+            SELECT
+                {_local_day('r.receipt_date')}, COALESCE(p.batch_id, t.batch_id, 0),
+                COALESCE(r.payment_method, p.payment_method, ''), 'completed',
+                0, 0, 1, COALESCE(r.amount, 0)
+            FROM receipts r
+            LEFT JOIN payments p ON p.id = r.payment_id
+            LEFT JOIN travelers t ON t.id = r.traveler_id
+            WHERE r.receipt_date IS NOT NULL
+              AND (%(all)s OR (
+                  r.receipt_date >= {_day_start('%(first_day)s::date')}
+                  AND r.receipt_date < {_day_start('%(last_day)s::date + 1')}
+                  AND {_local_day('r.receipt_date')} = ANY(%(days)s::date[])))
+        ) source
+        GROUP BY day, batch_id, payment_method, status
+    ),
+    removed AS (
+        DELETE FROM daily_payment_rollup r
+        WHERE (%(all)s OR r.day = ANY(%(days)s::date[]))
+          AND NOT EXISTS (
+              SELECT 1 FROM fresh f
+              WHERE f.day = r.day AND f.batch_id = r.batch_id
+                AND f.payment_method = r.payment_method AND f.status = r.status
+          )
+        RETURNING r.day
+    )
+    INSERT INTO daily_payment_rollup (
+        day, batch_id, payment_method, status,
+        payment_count, amount, receipt_count, receipt_amount, updated_at
+    )
+    SELECT day, batch_id, payment_method, status,
+           payment_count, amount, receipt_count, receipt_amount, CURRENT_TIMESTAMP
+    FROM fresh
+    ON CONFLICT (day, batch_id, payment_method, status) DO UPDATE SET
+        payment_count = EXCLUDED.payment_count,
+        amount = EXCLUDED.amount,
+        receipt_count = EXCLUDED.receipt_count,
+        receipt_amount = EXCLUDED.receipt_amount,
+        updated_at = EXCLUDED.updated_at
+"""
+
+_DAILY_REGISTRATION_SQL = f"""
+    WITH fresh AS (
+        SELECT
+            {_local_day('t.created_at')} AS day, COALESCE(t.batch_id, 0) AS batch_id,
+            COALESCE(t.passport_status, '') AS status, COUNT(*) AS traveler_count
+        FROM travelers t
+        WHERE t.created_at IS NOT NULL
+          AND (%(all)s OR (
+              t.created_at >= {_day_start('%(first_day)s::date')}
+              AND t.created_at < {_day_start('%(last_day)s::date + 1')}
+              AND {_local_day('t.created_at')} = ANY(%(days)s::date[])))
+        GROUP BY 1, 2, 3
+    ),
+    removed AS (
+        DELETE FROM daily_registration_rollup r
+        WHERE (%(all)s OR r.day = ANY(%(days)s::date[]))
+          AND NOT EXISTS (
+              SELECT 1 FROM fresh f
+              WHERE f.day = r.day AND f.batch_id = r.batch_id AND f.status = r.status
+          )
+        RETURNING r.day
+    )
+    INSERT INTO daily_registration_rollup (day, batch_id, status, traveler_count, updated_at)
+    SELECT day, batch_id, status, traveler_count, CURRENT_TIMESTAMP
+    FROM fresh
+    ON CONFLICT (day, batch_id, status) DO UPDATE SET
+        traveler_count = EXCLUDED.traveler_count,
+        updated_at = EXCLUDED.updated_at
+"""
+
+def _lock_daily(cursor, name, days):
+    """
+    Serialise recounts of the same days of one daily rollup
+
+    Writers share the rollup's lock and take each day's lock in key order, so
+    writes to different days run side by side; a full rebuild (days is None)
+    takes the rollup's lock exclusively and waits for all of them.
+    """
+    if days is None:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", (jobs.lock_key(name),))
+        return
+    cursor.execute("SELECT pg_advisory_xact_lock_shared(%s)", (jobs.lock_key(name),))
+    for key in sorted({jobs.lock_key(f'{name}:{day.isoformat()}') for day in days}):
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", (key,))
+
+def _refresh_daily(cursor, name, sql, days):
+    if days is not None:
+        days = sorted({d for d in days if d})
+        if not days:
+            return
+    _lock_daily(cursor, name, days)
+    cursor.execute(sql, {
+        'all': days is None,
+        'days': days or [],
+        'first_day': days[0] if days else None,
+        'last_day': days[-1] if days else None,
+        'tz': BUSINESS_TIMEZONE
+    })
+
+def refresh_daily_payments(cursor, days=None):
+    """
+    Recompute daily_payment_rollup for some days (all when days is None)
+
+    Call inside the writing transaction with the days from payment_days(),
+    taken before the write for rows that move or disappear and after it for
+    rows that appear.
+    """
+    _refresh_daily(cursor, 'daily_payment_rollup', _DAILY_PAYMENT_SQL, days)
+
+def refresh_daily_registrations(cursor, days=None):
+    """Recompute daily_registration_rollup for some days (all when days is None)"""
+    _refresh_daily(cursor, 'daily_registration_rollup', _DAILY_REGISTRATION_SQL, days)
+
+def payment_days(cursor, payment_ids=(), receipt_ids=(), traveler_ids=(), batch_id=None):
+    """
+    Days whose payment rollup rows depend on some payments, receipts, all rows
+    of some travelers, or (read from the rollup itself) a batch
+
+    Returns:
+        set: dates
+    """
+    cursor.execute(f"""
+        SELECT p.payment_date::date AS day FROM payments p
+        WHERE p.id = ANY(%(payment_ids)s::int[]) OR p.traveler_id = ANY(%(traveler_ids)s::int[])
+        UNION
+        SELECT {_local_day('r.receipt_date')} FROM receipts r
+        WHERE r.id = ANY(%(receipt_ids)s::int[]) OR r.payment_id = ANY(%(payment_ids)s::int[])
+           OR r.traveler_id = ANY(%(traveler_ids)s::int[])
+        UNION
+        SELECT d.day FROM daily_payment_rollup d WHERE d.batch_id = %(batch_id)s
+    """, {
+        'payment_ids': [int(i) for i in payment_ids if i],
+        'receipt_ids': [int(i) for i in receipt_ids if i],
+        'traveler_ids': [int(i) for i in traveler_ids if i],
+        'batch_id': batch_id,
+        'tz': BUSINESS_TIMEZONE
+    })
+    return {row['day'] for row in cursor.fetchall() if row['day']}
+
+def registration_days(cursor, traveler_ids):
+    """Days whose registration rollup rows depend on some travelers"""
+    cursor.execute(f"""
+        SELECT DISTINCT {_local_day('t.created_at')} AS day FROM travelers t
+        WHERE t.id = ANY(%(traveler_ids)s::int[])
+    """, {'traveler_ids': [int(i) for i in traveler_ids if i], 'tz': BUSINESS_TIMEZONE})
+    return {row['day'] for row in cursor.fetchall() if row['day']}
+
+def daily_needs_backfill(cursor):
+    """Check if either daily rollup is empty while its source has rows"""
+    cursor.execute("""
+        SELECT
+            NOT EXISTS (SELECT 1 FROM daily_payment_rollup)
+                AND (EXISTS (SELECT 1 FROM payments) OR EXISTS (SELECT 1 FROM receipts)) AS payments,
+            NOT EXISTS (SELECT 1 FROM daily_registration_rollup)
+                AND EXISTS (SELECT 1 FROM travelers) AS registrations
+    """)
+    row = cursor.fetchone()
+    return bool(row['payments'] or row['registrations'])
+
+def rebuild_daily(start_date=None, end_date=None):
+    """
+    Backfill or repair the daily rollups, optionally only a date range
+
+    Returns:
+        tuple: (payment rows, registration rows) written
+    """
+    conn, cursor = get_db()
+    if not conn:
+        return 0, 0
+    try:
+        days = None
+        if start_date or end_date:
+            cursor.execute(f"""
+                SELECT generate_series(
+                    COALESCE(
+                        %(start)s::date,
+                        LEAST((SELECT MIN(payment_date)::date FROM payments),
+                              (SELECT MIN(created_at)::date FROM travelers)),
+                        {LOCAL_TODAY_SQL}
+                    ),
+                    COALESCE(%(end)s::date, {LOCAL_TODAY_SQL}),
+                    interval '1 day'
+                )::date AS day
+            """, {'start': start_date, 'end': end_date, 'tz': BUSINESS_TIMEZONE})
+            days = [row['day'] for row in cursor.fetchall()]
+        refresh_daily_payments(cursor, days)
+        payment_rows = cursor.rowcount
+        refresh_daily_registrations(cursor, days)
+        registration_rows = cursor.rowcount
+        conn.commit()
+        print(f"✅ daily rollups rebuilt ({payment_rows} payment rows, {registration_rows} registration rows)")
+        return payment_rows, registration_rows
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        release_db(conn, cursor)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Reporting rollup tools')
+    parser.add_argument('command', choices=['daily', 'aging'])
+    parser.add_argument('--start-date', help='First day to repair (daily only)')
+    parser.add_argument('--end-date', help='Last day to repair (daily only)')
+    args = parser.parse_args()
+
+    if args.command == 'daily':
+        migrate_daily_rollup_tables()
+        rebuild_daily(args.start_date, args.end_date)
+    else:
+        rebuild_aging()
@@ -0,0 +1,499 @@
+"""
+Room allocation
+Travelers of a batch are grouped into families, the families packed into hotel
+rooms, and the plan stored in rooms/room_assignments so the office and the
+rooming list see the same thing.
+
+Families are found with union-find over the relationship fields: a traveler
+whose spouse_name or father_name names another traveler of the batch joins
+that traveler's family, and travelers with the same father_name and surname
+are siblings. A name matching more than one traveler links nobody, so two
+pilgrims with the same name never merge unrelated families.
+
+A family travelling with a married couple shares family rooms; everyone else
+is split by gender into single-gender rooms that unrelated travelers share.
+Units (a family, or its members of one gender) are packed best-fit
+decreasing, so relatives stay in one room whenever it fits. Units with a
+wheelchair user are placed first, in accessible rooms; other travelers may
+take the beds left in them.
+
+allocate() rebuilds a batch's plan. When travelers are added to a batch that
+has one, place_unassigned() puts them next to their relatives or into the
+best-fitting free beds without moving anyone already assigned.
+"""
+
+import os
+import re
+from collections import defaultdict
+
+from app.database import get_db, release_db
+from app import jobs
+
+ROOM_CAPACITY = int(os.getenv('ROOM_CAPACITY', '4'))
+MAX_ROOM_CAPACITY = 12
+FAMILY = 'Family'
+# Room types in the order rooms are numbered
+ROOM_TYPES = (FAMILY, 'Female', 'Male', 'Other')
+WHEELCHAIR_VALUES = ('yes', 'y', 'true', '1')
+
+# ============================================================
+# DATABASE MIGRATION - Create room tables if not exists
+# ============================================================
+def migrate_room_tables():
+    """Add the batch room capacities and create the rooms and room_assignments tables"""
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        cursor.execute("ALTER TABLE batches ADD COLUMN IF NOT EXISTS room_capacity INTEGER")
+        cursor.execute("ALTER TABLE batches ADD COLUMN IF NOT EXISTS accessible_room_capacity INTEGER")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS rooms (
+                id SERIAL PRIMARY KEY,
+                batch_id INTEGER NOT NULL REFERENCES batches(id) ON DELETE CASCADE,
+                room_no INTEGER NOT NULL,
+                room_type VARCHAR(20) NOT NULL,
+                accessible BOOLEAN NOT NULL DEFAULT FALSE,
+                capacity INTEGER NOT NULL CHECK (capacity > 0),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE (batch_id, room_no)
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS room_assignments (
+                traveler_id INTEGER PRIMARY KEY REFERENCES travelers(id) ON DELETE CASCADE,
+                room_id INTEGER NOT NULL REFERENCES rooms(id) ON DELETE CASCADE,
+                assigned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_room_assignments_room ON room_assignments (room_id)")
+        conn.commit()
+        print("✅ rooms tables verified!")
+    except Exception as e:
+        print(f"⚠️ Migration error: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn:
+            release_db(conn, cursor)
+
+# ============================================================
+# FAMILIES
+# ============================================================
+
+class _UnionFind:
+    """Disjoint sets of traveler ids, each represented by its smallest id"""
+
+    def __init__(self, ids):
+        self.parent = {i: i for i in ids}
+
+    def find(self, i):
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[i] != root:
+            self.parent[i], i = root, self.parent[i]
+        return root
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            self.parent[max(a, b)] = min(a, b)
+
+def _normalize(name):
+    return re.sub(r'[^a-z0-9]+', ' ', (name or '').lower()).strip()
+
+def find_families(travelers):
+    """
+    Group travelers into families from spouse_name and father_name
+
+    Args:
+        travelers: dicts with id, first_name, last_name, passport_name,
+            spouse_name and father_name
+
+    Returns:
+        tuple: ({traveler_id: family id}, set of family ids travelling with a married couple)
+    """
+    families = _UnionFind(t['id'] for t in travelers)
+    by_name = defaultdict(set)
+    for t in travelers:
+        for name in (f"{t['first_name'] or ''} {t['last_name'] or ''}", t['passport_name']):
+            key = _normalize(name)
+            if key:
+                by_name[key].add(t['id'])
+
+    def named(name):
+        matches = by_name.get(_normalize(name))
+        return next(iter(matches)) if matches and len(matches) == 1 else None
+
+    married = []
+    siblings = defaultdict(list)
+    for t in travelers:
+        spouse = named(t['spouse_name'])
+        if spouse and spouse != t['id']:
+            families.union(t['id'], spouse)
+            married.append(t['id'])
+        father = named(t['father_name'])
+        if father and father != t['id']:
+            families.union(t['id'], father)
+        if _normalize(t['father_name']):
+            siblings[(_normalize(t['father_name']), _normalize(t['last_name']))].append(t['id'])
+    for ids in siblings.values():
+        for other in ids[1:]:
+            families.union(ids[0], other)
+
+    family_of = {t['id']: families.find(t['id']) for t in travelers}
+    return family_of, {family_of[i] for i in married}
+
+# ============================================================
+# PACKING
+# ============================================================
+
+def _gender_type(gender):
+    gender = (gender or '').strip().lower()
+    if gender.startswith('f'):
+        return 'Female'
+    if gender.startswith('m'):
+        return 'Male'
+    return 'Other'
+
+def _needs_access(traveler):
+    return (traveler['wheelchair'] or '').strip().lower() in WHEELCHAIR_VALUES
+
+def _units(travelers, family_of, married, capacity, accessible_capacity):
+    """
+    Split travelers into units that must share a room
+
+    A unit bigger than a room is cut into room-sized pieces, wheelchair
+    users first so they end up together in the accessible pieces.
+    """
+    groups = defaultdict(list)
+    for t in travelers:
+        family = family_of[t['id']]
+        room_type = FAMILY if family in married else _gender_type(t['gender'])
+        groups[(family, room_type)].append(t)
+
+    units = []
+    for (family, room_type), members in groups.items():
+        members.sort(key=lambda t: not _needs_access(t))
+        start = 0
+        while start < len(members):
+            accessible = _needs_access(members[start])
+            size = accessible_capacity if accessible else capacity
+            units.append({
+                'family': family,
+                'room_type': room_type,
+                'accessible': accessible,
+                'members': members[start:start + size]
+            })
+            start += size
+    return units
+
+def _free(room):
+    return room['capacity'] - room['occupied']
+
+def _pack(units, rooms, capacity, accessible_capacity):
+    """
+    Place units into rooms, best fit decreasing
+
+    Rooms with free beds are bucketed by (type, accessible, free beds), so
+    finding the tightest room for a unit is at most MAX_ROOM_CAPACITY dict
+    lookups. Family rooms are never shared with another family.
+
+    Args:
+        units: see _units()
+        rooms: existing rooms (id, room_no, room_type, accessible, capacity,
+            occupied, families); new rooms are appended
+
+    Returns:
+        list: (traveler id, room) placements
+    """
+    buckets = defaultdict(dict)
+
+    def file(room):
+        if room['room_type'] != FAMILY and _free(room) > 0:
+            buckets[(room['room_type'], room['accessible'], _free(room))][room['room_no']] = room
+
+    def unfile(room):
+        buckets[(room['room_type'], room['accessible'], _free(room))].pop(room['room_no'], None)
+
+    def best_fit(room_type, accessible, size):
+        for free in range(size, MAX_ROOM_CAPACITY + 1):
+            bucket = buckets.get((room_type, accessible, free))
+            if bucket:
+                return next(iter(bucket.values()))
+        return None
+
+    def relatives_room(unit, size):
+        """A room already holding the unit's family (incremental placement)"""
+        for room in by_family.get(unit['family'], ()):
+            if _free(room) < size or (unit['accessible'] and not room['accessible']):
+                continue
+            if room['room_type'] == unit['room_type']:
+                return room
+            # A spouse joining a room only their family uses turns it into a family room
+            if unit['room_type'] == FAMILY and room['families'] == {unit['family']}:
+                unfile(room)
+                room['room_type'] = FAMILY
+                return room
+        return None
+
+    by_family = defaultdict(list)
+    for room in rooms:
+        file(room)
+        for family in room['families']:
+            by_family[family].append(room)
+    next_no = max((room['room_no'] for room in rooms), default=0) + 1
+
+    placements = []
+    units.sort(key=lambda unit: (not unit['accessible'], -len(unit['members'])))
+    for unit in units:
+        size = len(unit['members'])
+        room = relatives_room(unit, size)
+        if room is None and unit['room_type'] != FAMILY:
+            if unit['accessible']:
+                room = best_fit(unit['room_type'], True, size)
+            else:
+                room = best_fit(unit['room_type'], False, size) or best_fit(unit['room_type'], True, size)
+        if room is None:
+            room = {
+                'id': None,
+                'room_no': next_no,
+                'room_type': unit['room_type'],
+                'accessible': unit['accessible'],
+                'capacity': accessible_capacity if unit['accessible'] else capacity,
+                'occupied': 0,
+                'families': set()
+            }
+            next_no += 1
+            rooms.append(room)
+        else:
+            unfile(room)
+        room['occupied'] += size
+        if unit['family'] not in room['families']:
+            room['families'].add(unit['family'])
+            by_family[unit['family']].append(room)
+        placements.extend((t['id'], room) for t in unit['members'])
+        file(room)
+    return placements
+
+def plan(travelers, capacity=ROOM_CAPACITY, accessible_capacity=None):
+    """
+    Allocate rooms for a batch from scratch, without touching the database
+
+    Returns:
+        tuple: (rooms numbered from 1, [(traveler id, room)])
+    """
+    accessible_capacity = accessible_capacity or capacity
+    family_of, married = find_families(travelers)
+    rooms = []
+    placements = _pack(_units(travelers, family_of, married, capacity, accessible_capacity),
+                       rooms, capacity, accessible_capacity)
+    # Number family rooms first, then by gender, accessible (ground floor) rooms first in each
+    rooms.sort(key=lambda room: (ROOM_TYPES.index(room['room_type']), not room['accessible'], room['room_no']))
+    for number, room in enumerate(rooms, 1):
+        room['room_no'] = number
+    return rooms, placements
+
+# ============================================================
+# PERSISTENCE
+# ============================================================
+
+def check_capacity(value, name='capacity'):
+    """Validate a room capacity given by the caller"""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} must be an integer')
+    if not 1 <= value <= MAX_ROOM_CAPACITY:
+        raise ValueError(f'{name} must be between 1 and {MAX_ROOM_CAPACITY}')
+    return value
+
+def _lock(cursor, batch_id):
+    """Serialize plan changes of a batch until the transaction ends"""
+    cursor.execute("SELECT pg_advisory_xact_lock(%s)", (jobs.lock_key(f'rooms:{batch_id}'),))
+
+def _load_travelers(cursor, batch_id):
+    """Travelers of a batch with their current room (None when unassigned)"""
+    cursor.execute("""
+        SELECT t.id, t.first_name, t.last_name, t.passport_name, t.gender, t.wheelchair,
+               t.spouse_name, t.father_name, r.id AS room_id
+        FROM travelers t
+        LEFT JOIN room_assignments ra ON ra.traveler_id = t.id
+        LEFT JOIN rooms r ON r.id = ra.room_id AND r.batch_id = t.batch_id
+        WHERE t.batch_id = %s
+        ORDER BY t.id
+    """, (batch_id,))
+    return cursor.fetchall()
+
+def _save(cursor, batch_id, rooms, placements):
+    """Insert new rooms, update converted ones and upsert the placements"""
+    from psycopg2.extras import execute_values
+
+    new_rooms = [room for room in rooms if room['id'] is None]
+    if new_rooms:
+        created = execute_values(cursor, """
+            INSERT INTO rooms (batch_id, room_no, room_type, accessible, capacity)
+            VALUES %s RETURNING id, room_no
+        """, [(batch_id, room['room_no'], room['room_type'], room['accessible'], room['capacity'])
+              for room in new_rooms], page_size=len(new_rooms), fetch=True)
+        ids = {row['room_no']: row['id'] for row in created}
+        for room in new_rooms:
+            room['id'] = ids[room['room_no']]
+    converted = [room['id'] for room in rooms if room.get('loaded_type') not in (None, room['room_type'])]
+    if converted:
+        cursor.execute("UPDATE rooms SET room_type = %s WHERE id = ANY(%s)", (FAMILY, converted))
+    if placements:
+        execute_values(cursor, """
+            INSERT INTO room_assignments (traveler_id, room_id) VALUES %s
+            ON CONFLICT (traveler_id) DO UPDATE
+            SET room_id = EXCLUDED.room_id, assigned_at = CURRENT_TIMESTAMP
+        """, [(traveler_id, room['id']) for traveler_id, room in placements], page_size=1000)
+
+def _batch_capacities(cursor, batch_id):
+    cursor.execute("""
+        SELECT id, room_capacity, accessible_room_capacity FROM batches WHERE id = %s
+    """, (batch_id,))
+    batch = cursor.fetchone()
+    if not batch:
+        raise LookupError('Batch not found')
+    capacity = batch['room_capacity'] or ROOM_CAPACITY
+    return capacity, batch['accessible_room_capacity'] or capacity
+
+def allocate(cursor, batch_id, capacity=None, accessible_capacity=None):
+    """
+    Replace a batch's room plan with a fresh allocation of all its travelers
+
+    Args:
+        capacity: beds per room, kept on the batch for later placements
+            (default: the batch's last capacity or ROOM_CAPACITY)
+        accessible_capacity: beds per wheelchair-accessible room (default: capacity)
+
+    Returns:
+        dict: summary, see summarize()
+
+    Raises:
+        LookupError: when the batch does not exist
+        ValueError: for a capacity out of range
+    """
+    _lock(cursor, batch_id)
+    saved_capacity, saved_accessible = _batch_capacities(cursor, batch_id)
+    if accessible_capacity:
+        accessible_capacity = check_capacity(accessible_capacity, 'accessible_capacity')
+    if capacity:
+        capacity = check_capacity(capacity)
+        accessible_capacity = accessible_capacity or capacity
+    else:
+        capacity = saved_capacity
+        accessible_capacity = accessible_capacity or saved_accessible
+    cursor.execute("""
+        UPDATE batches SET room_capacity = %s, accessible_room_capacity = %s WHERE id = %s
+    """, (capacity, accessible_capacity, batch_id))
+
+    travelers = _load_travelers(cursor, batch_id)
+    rooms, placements = plan(travelers, capacity, accessible_capacity)
+    cursor.execute("DELETE FROM rooms WHERE batch_id = %s", (batch_id,))
+    _save(cursor, batch_id, rooms, placements)
+    return summarize(rooms, len(travelers), capacity, accessible_capacity)
+
+def place_unassigned(cursor, batch_id):
+    """
+    Place a batch's travelers that have no room yet, leaving everyone else where they are
+
+    Does nothing for a batch without a room plan.
+
+    Returns:
+        list: {traveler_id, room_no} of the travelers placed
+    """
+    cursor.execute("SELECT 1 FROM rooms WHERE batch_id = %s LIMIT 1", (batch_id,))
+    if not cursor.fetchone():
+        return []
+    _lock(cursor, batch_id)
+    capacity, accessible_capacity = _batch_capacities(cursor, batch_id)
+    travelers = _load_travelers(cursor, batch_id)
+    unassigned = [t for t in travelers if t['room_id'] is None]
+    if not unassigned:
+        return []
+
+    family_of, married = find_families(travelers)
+    cursor.execute("""
+        SELECT id, room_no, room_type, room_type AS loaded_type, accessible, capacity
+        FROM rooms WHERE batch_id = %s ORDER BY room_no
+    """, (batch_id,))
+    rooms = [dict(room, occupied=0, families=set()) for room in cursor.fetchall()]
+    by_id = {room['id']: room for room in rooms}
+    for t in travelers:
+        if t['room_id'] is not None:
+            room = by_id[t['room_id']]
+            room['occupied'] += 1
+            room['families'].add(family_of[t['id']])
+
+    placements = _pack(_units(unassigned, family_of, married, capacity, accessible_capacity),
+                       rooms, capacity, accessible_capacity)
+    _save(cursor, batch_id, rooms, placements)
+    return [{'traveler_id': traveler_id, 'room_no': room['room_no']} for traveler_id, room in placements]
+
+def unassign(cursor, traveler_ids):
+    """Take travelers out of their rooms (e.g. when they move to another batch)"""
+    cursor.execute("DELETE FROM room_assignments WHERE traveler_id = ANY(%s)", (list(traveler_ids),))
+
+def summarize(rooms, travelers, capacity, accessible_capacity):
+    """Room counts and bed use of a plan"""
+    by_type = defaultdict(int)
+    for room in rooms:
+        by_type[room['room_type']] += 1
+    beds = sum(room['capacity'] for room in rooms)
+    return {
+        'travelers': travelers,
+        'rooms': len(rooms),
+        'accessible_rooms': sum(1 for room in rooms if room['accessible']),
+        'rooms_by_type': {room_type: by_type[room_type] for room_type in ROOM_TYPES if by_type[room_type]},
+        'beds': beds,
+        'empty_beds': beds - sum(room['occupied'] for room in rooms),
+        'capacity': capacity,
+        'accessible_capacity': accessible_capacity
+    }
+
+def get_plan(cursor, batch_id):
+    """
+    A batch's rooms with their occupants, and the travelers without a room
+
+    Returns:
+        dict, or None when the batch does not exist
+    """
+    cursor.execute("""
+        SELECT id, room_capacity, accessible_room_capacity FROM batches WHERE id = %s
+    """, (batch_id,))
+    batch = cursor.fetchone()
+    if not batch:
+        return None
+    cursor.execute("""
+        SELECT r.room_no, r.room_type, r.accessible, r.capacity,
+               COALESCE(json_agg(json_build_object(
+                   'traveler_id', t.id,
+                   'name', TRIM(CONCAT(t.first_name, ' ', t.last_name)),
+                   'gender', t.gender,
+                   'wheelchair', t.wheelchair
+               ) ORDER BY t.id) FILTER (WHERE t.id IS NOT NULL), '[]') AS travelers
+        FROM rooms r
+        LEFT JOIN room_assignments ra ON ra.room_id = r.id
+        LEFT JOIN travelers t ON t.id = ra.traveler_id AND t.batch_id = r.batch_id
+        WHERE r.batch_id = %s
+        GROUP BY r.id
+        ORDER BY r.room_no
+    """, (batch_id,))
+    rooms = [dict(room, occupied=len(room['travelers'])) for room in cursor.fetchall()]
+    cursor.execute("""
+        SELECT t.id AS traveler_id, TRIM(CONCAT(t.first_name, ' ', t.last_name)) AS name
+        FROM travelers t
+        LEFT JOIN room_assignments ra ON ra.traveler_id = t.id
+        LEFT JOIN rooms r ON r.id = ra.room_id AND r.batch_id = t.batch_id
+        WHERE t.batch_id = %s AND r.id IS NULL
+        ORDER BY t.id
+    """, (batch_id,))
+    unassigned = [dict(row) for row in cursor.fetchall()]
+    capacity = batch['room_capacity'] or ROOM_CAPACITY
+    result = summarize(rooms, sum(room['occupied'] for room in rooms) + len(unassigned),
+                       capacity, batch['accessible_room_capacity'] or capacity)
+    result.update({'room_list': rooms, 'unassigned': unassigned})
+    return result
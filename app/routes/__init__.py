@@ -9,4 +9,5 @@ from . import reports
 from . import invoices
 from . import receipts
 from . import users
-from . import backup
\ No newline at end of file
+from . import backup
+from . import frontpage
@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify, session, send_file, current_app
 from app.database import get_db, release_db  # ✅ POOL COMPATIBLE
 from app.middleware import role_required, safe_db_operation, log_critical_action, get_client_ip  # ✅ FIXED IMPORTS
+from app.idempotency import idempotent
 from datetime import datetime, timedelta
 import json
 import os
@@ -118,6 +119,7 @@ def get_user(user_id):
 # ====== ➕ CREATE USER ======
 @bp.route('/users', methods=['POST'])
 @role_required(['super_admin', 'admin'])
+@idempotent
 def create_user():
     """Create new user"""
     try:
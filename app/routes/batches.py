@@ -1,7 +1,13 @@
-from flask import Blueprint, request, jsonify, session, current_app
+from flask import Blueprint, request, jsonify, session, current_app, Response, stream_with_context
 from app.database import get_db, release_db
+from app.idempotency import idempotent
+from app import storage, zipstream, dossier, rollups, seats, cache, manifests, rooms
 from datetime import datetime
+from werkzeug.utils import secure_filename
 import json
+import csv
+import io
+import os
 
 bp = Blueprint('batches', __name__, url_prefix='/api/batches')
 
@@ -44,6 +50,8 @@ def migrate_batches_table():
 # Run migration on import
 try:
     migrate_batches_table()
+    seats.migrate_seat_tables()
+    rooms.migrate_room_tables()
 except Exception as e:
     print(f"⚠️ Migration failed: {e}")
 
@@ -122,6 +130,51 @@ def get_batch(batch_id):
         if conn:
             release_db(conn, cursor)
 
+# Display fields of the open batches shown to anonymous visitors
+CATALOGUE_SQL = """
+    SELECT
+        id, batch_name, description, price, departure_date, return_date,
+        return_date - departure_date AS duration,
+        itinerary, inclusions, exclusions, hotel_details, transport_details, meal_plan
+    FROM batches
+    WHERE status = 'Open'
+      AND (departure_date IS NULL OR departure_date >= CURRENT_DATE)
+    ORDER BY departure_date NULLS LAST, id
+"""
+
+def get_open_batches(cursor):
+    """Open batches for the public catalogue and homepage"""
+    cursor.execute(CATALOGUE_SQL)
+    batches = []
+    for row in cursor.fetchall():
+        batch = dict(row)
+        batch['price'] = float(batch['price']) if batch['price'] is not None else None
+        for field in ('departure_date', 'return_date'):
+            batch[field] = batch[field].isoformat() if batch[field] else None
+        batches.append(batch)
+    return batches
+
+def build_catalogue():
+    """Serialize the catalogue once for the cache"""
+    conn, cursor = get_db()
+    if not conn:
+        raise RuntimeError('Database connection failed')
+    try:
+        batches = get_open_batches(cursor)
+    finally:
+        release_db(conn, cursor)
+    body = json.dumps({'success': True, 'batches': batches, 'count': len(batches)})
+    return body.encode('utf-8'), 'application/json'
+
+@bp.route('/catalogue', methods=['GET'])
+def get_batch_catalogue():
+    """Public list of open batches (no login), served from the worker's cache"""
+    try:
+        entry = cache.get('batch_catalogue', build_catalogue, tags=('batches',))
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    return cache.respond(entry, request)
+
 @bp.route('/for-traveler/<int:batch_id>', methods=['GET'])
 def get_batch_for_traveler(batch_id):
     """
@@ -160,6 +213,7 @@ def get_batch_for_traveler(batch_id):
             release_db(conn, cursor)
 
 @bp.route('', methods=['POST'])
+@idempotent
 def create_batch():
     """Create new batch with return_date"""
     if 'user_id' not in session:
@@ -207,6 +261,7 @@ def create_batch():
         
         result = cursor.fetchone()
         batch_id = result['id'] if result else None
+        cache.notify(cursor, 'batches')
         
         conn.commit()
         
@@ -278,6 +333,7 @@ def update_batch(batch_id):
         if update_fields:
             query = f"UPDATE batches SET {', '.join(update_fields)} WHERE id = %s"
             cursor.execute(query, params)
+        cache.notify(cursor, 'batches')
         
         conn.commit()
         
@@ -326,7 +382,11 @@ def delete_batch(batch_id):
                 'error': 'Cannot delete batch with associated travelers'
             }), 400
         
+        # Its payments cascade with it
+        days = rollups.payment_days(cursor, batch_id=batch_id)
         cursor.execute("DELETE FROM batches WHERE id = %s", (batch_id,))
+        rollups.refresh_daily_payments(cursor, days)
+        cache.notify(cursor, 'batches')
         conn.commit()
         
         return jsonify({'success': True, 'message': 'Batch deleted successfully'})
@@ -370,6 +430,416 @@ def get_batch_travelers(batch_id):
         if conn:
             release_db(conn, cursor)
 
+@bp.route('/<int:batch_id>/seats', methods=['GET'])
+def get_batch_seats(batch_id):
+    """Seat availability of a batch (booked, held and free seats)"""
+    if 'user_id' not in session and 'traveler_id' not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        inventory = seats.availability(cursor, batch_id)
+        if not inventory:
+            return jsonify({'success': False, 'error': 'Batch not found'}), 404
+        return jsonify({'success': True, 'seats': inventory})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        if conn:
+            release_db(conn, cursor)
+
+@bp.route('/seats/reconcile', methods=['GET', 'POST'])
+def reconcile_batch_seats():
+    """
+    Compare every batch's seat counters with its travelers and holds
+    
+    GET reports the drift; POST with {"repair": true} also writes the
+    recounted values back.
+    """
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    repair = request.method == 'POST' and bool((request.get_json(silent=True) or {}).get('repair', True))
+    try:
+        result = seats.reconcile(repair=repair)
+        if result is None:
+            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
+        return jsonify({'success': True, **result})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@bp.route('/<int:batch_id>/holds', methods=['POST'])
+@idempotent
+def create_seat_hold(batch_id):
+    """
+    Hold seats for a group, all or nothing
+    
+    Body: {seats, minutes (optional), reference (optional)}. Travelers
+    created with the returned hold_id take their seat from the hold; what is
+    left of it is released when it expires.
+    """
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    data = request.json or {}
+    try:
+        count = int(data.get('seats', 0))
+        minutes = int(data.get('minutes') or seats.HOLD_MINUTES)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'seats and minutes must be integers'}), 400
+    if count < 1:
+        return jsonify({'success': False, 'error': 'seats must be at least 1'}), 400
+    if not 1 <= minutes <= seats.MAX_HOLD_MINUTES:
+        return jsonify({'success': False, 'error': f'minutes must be between 1 and {seats.MAX_HOLD_MINUTES}'}), 400
+    
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        seat_hold = seats.hold(cursor, batch_id, count, minutes,
+                               reference=data.get('reference'), created_by=session['user_id'])
+        conn.commit()
+        return jsonify({'success': True, 'hold_id': seat_hold['id'], 'hold': seat_hold}), 201
+    except seats.SeatsUnavailable as e:
+        if conn:
+            conn.rollback()
+        return jsonify({'success': False, 'error': str(e), 'available_seats': e.available}), 409
+    except LookupError as e:
+        if conn:
+            conn.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 404
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        if conn:
+            release_db(conn, cursor)
+
+@bp.route('/<int:batch_id>/holds/<int:hold_id>', methods=['DELETE'])
+def cancel_seat_hold(batch_id, hold_id):
+    """Release what is left of a seat hold"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        released = seats.cancel_hold(cursor, hold_id, batch_id)
+        if released is None:
+            return jsonify({'success': False, 'error': 'Seat hold not found'}), 404
+        conn.commit()
+        return jsonify({'success': True, 'released_seats': released})
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        if conn:
+            release_db(conn, cursor)
+
+@bp.route('/<int:batch_id>/rooms', methods=['GET'])
+def get_batch_rooms(batch_id):
+    """A batch's room plan: rooms with their occupants and the travelers without a room"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        room_plan = rooms.get_plan(cursor, batch_id)
+        if room_plan is None:
+            return jsonify({'success': False, 'error': 'Batch not found'}), 404
+        return jsonify({'success': True, **room_plan})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        if conn:
+            release_db(conn, cursor)
+
+@bp.route('/<int:batch_id>/rooms', methods=['POST'])
+def allocate_batch_rooms(batch_id):
+    """
+    Allocate rooms for every traveler of a batch, replacing its current plan
+    
+    Body: {capacity (optional), accessible_capacity (optional)}. The
+    capacities are kept on the batch; travelers added later are placed into
+    the free beds automatically.
+    """
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        summary = rooms.allocate(cursor, batch_id, data.get('capacity'), data.get('accessible_capacity'))
+        conn.commit()
+        return jsonify({'success': True, 'message': f"{summary['travelers']} travelers allocated to {summary['rooms']} rooms", **summary})
+    except ValueError as e:
+        if conn:
+            conn.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except LookupError as e:
+        if conn:
+            conn.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 404
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        if conn:
+            release_db(conn, cursor)
+
+@bp.route('/<int:batch_id>/rooms/place', methods=['POST'])
+def place_batch_travelers(batch_id):
+    """Place travelers without a room into the batch's existing plan, moving nobody else"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        placed = rooms.place_unassigned(cursor, batch_id)
+        conn.commit()
+        return jsonify({'success': True, 'placed': placed})
+    except LookupError as e:
+        if conn:
+            conn.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 404
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        if conn:
+            release_db(conn, cursor)
+
+# Zip entry label of each traveler document column
+DOCUMENT_LABELS = {
+    'passport_scan': 'passport',
+    'photo': 'photo',
+    'vaccine_scan': 'vaccine',
+    'aadhaar_scan': 'aadhaar',
+    'pan_scan': 'pan'
+}
+
+@bp.route('/<int:batch_id>/documents.zip', methods=['GET'])
+def download_batch_documents(batch_id):
+    """Stream every traveler document of a batch as one ZIP with a manifest"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        cursor.execute('SELECT id, batch_name FROM batches WHERE id = %s', (batch_id,))
+        batch = cursor.fetchone()
+        if not batch:
+            return jsonify({'success': False, 'error': 'Batch not found'}), 404
+        
+        cursor.execute(f'''
+            SELECT id, first_name, last_name, passport_no, {', '.join(DOCUMENT_LABELS)}
+            FROM travelers
+            WHERE batch_id = %s
+            ORDER BY passport_no, id
+        ''', (batch_id,))
+        travelers = cursor.fetchall()
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        if conn:
+            release_db(conn, cursor)
+    
+    upload_root = current_app.config['UPLOAD_FOLDER']
+    manifest = []
+    
+    def entries():
+        seen = set()
+        for t in travelers:
+            # Folder per traveler named by passport number (unique within the zip)
+            folder = secure_filename((t['passport_no'] or '').upper()) or f"traveler_{t['id']}"
+            if folder in seen:
+                folder = f"{folder}_{t['id']}"
+            seen.add(folder)
+            
+            for column, label in DOCUMENT_LABELS.items():
+                filename = t[column]
+                path = storage.find_document(upload_root, t['id'], column, filename)
+                row = {
+                    'traveler_id': t['id'],
+                    'passport_no': t['passport_no'] or '',
+                    'name': f"{t['first_name'] or ''} {t['last_name'] or ''}".strip(),
+                    'doc_type': label,
+                    'entry': '',
+                    'stored_filename': filename or '',
+                    'size_bytes': '',
+                    'sha256': storage.sha256_from_filename(filename) or '',
+                    'status': 'not uploaded' if not filename else 'missing'
+                }
+                if path:
+                    ext = path.rsplit('.', 1)[1].lower() if '.' in os.path.basename(path) else 'bin'
+                    arcname = f"{folder}/{folder}_{label}.{ext}"
+                    row.update({'entry': arcname, 'size_bytes': os.path.getsize(path), 'status': 'included'})
+                    yield arcname, path
+                manifest.append(row)
+        
+        yield 'manifest.csv', build_manifest
+    
+    def build_manifest():
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=[
+            'traveler_id', 'passport_no', 'name', 'doc_type', 'entry',
+            'stored_filename', 'size_bytes', 'sha256', 'status'
+        ])
+        writer.writeheader()
+        writer.writerows(manifest)
+        return output.getvalue().encode('utf-8-sig')
+    
+    download_name = secure_filename(batch['batch_name'] or '') or f"batch_{batch_id}"
+    return Response(
+        stream_with_context(zipstream.stream_zip(entries())),
+        mimetype='application/zip',
+        headers={
+            'Content-Disposition': f'attachment; filename={download_name}_documents.zip',
+            'X-Accel-Buffering': 'no',
+            'Cache-Control': 'no-store'
+        }
+    )
+
+@bp.route('/<int:batch_id>/dossiers.zip', methods=['GET'])
+def download_batch_dossiers(batch_id):
+    """Stream the dossier PDF of every traveler in a batch as one ZIP"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    upload_root = current_app.config['UPLOAD_FOLDER']
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        cursor.execute('SELECT id, batch_name FROM batches WHERE id = %s', (batch_id,))
+        batch = cursor.fetchone()
+        if not batch:
+            return jsonify({'success': False, 'error': 'Batch not found'}), 404
+        
+        cursor.execute('SELECT id FROM travelers WHERE batch_id = %s ORDER BY passport_no, id', (batch_id,))
+        traveler_ids = [row['id'] for row in cursor.fetchall()]
+        dossiers = dossier.load_dossiers(cursor, upload_root, traveler_ids)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        if conn:
+            release_db(conn, cursor)
+    
+    # Queue every render up front so the pool works while earlier entries stream
+    jobs = [
+        (payload['traveler'], dossier.submit_dossier(upload_root, traveler_id, key, payload))
+        for traveler_id, key, payload in dossiers
+    ]
+    
+    def entries():
+        seen = set()
+        for traveler, future in jobs:
+            name = secure_filename((traveler.get('passport_no') or '').upper()) or f"traveler_{traveler['id']}"
+            if name in seen:
+                name = f"{name}_{traveler['id']}"
+            seen.add(name)
+            try:
+                yield f"dossier_{name}.pdf", future.result(timeout=300)
+            except Exception as e:
+                yield f"dossier_{name}.error.txt", f"Failed to render dossier: {e}".encode('utf-8')
+    
+    download_name = secure_filename(batch['batch_name'] or '') or f"batch_{batch_id}"
+    return Response(
+        stream_with_context(zipstream.stream_zip(entries())),
+        mimetype='application/zip',
+        headers={
+            'Content-Disposition': f'attachment; filename={download_name}_dossiers.zip',
+            'X-Accel-Buffering': 'no',
+            'Cache-Control': 'no-store'
+        }
+    )
+
+@bp.route('/manifests', methods=['GET'])
+def get_manifest_templates():
+    """List the manifest templates and the fields a column mapping can use"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    templates = {
+        kind: {
+            'title': template['title'],
+            'date_format': template['date_format'],
+            'columns': [{'field': field, 'header': header} for field, header in manifests.resolve_columns(kind)]
+        }
+        for kind, template in manifests.TEMPLATES.items()
+    }
+    return jsonify({
+        'success': True,
+        'templates': templates,
+        'fields': manifests.FIELD_LABELS,
+        'formats': list(manifests.FORMATS)
+    })
+
+@bp.route('/<int:batch_id>/manifests/<kind>', methods=['GET', 'POST'])
+def download_batch_manifest(batch_id, kind):
+    """
+    Stream a batch manifest (airline, rooming or visa) as XLSX or CSV
+    
+    Options come from the query string or, for POST, the JSON body:
+    format (xlsx/csv), date_format (strftime pattern) and columns (list of
+    field names or {field, header} objects; comma-separated fields in the
+    query string).
+    """
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    options = (request.get_json(silent=True) or {}) if request.method == 'POST' else {}
+    file_format = (options.get('format') or request.args.get('format') or 'xlsx').lower()
+    date_format = options.get('date_format') or request.args.get('date_format')
+    columns = options.get('columns')
+    if columns is None and request.args.get('columns'):
+        columns = [field.strip() for field in request.args['columns'].split(',') if field.strip()]
+    
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        cursor.execute('SELECT id, batch_name, departure_date FROM batches WHERE id = %s', (batch_id,))
+        batch = cursor.fetchone()
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        if conn:
+            release_db(conn, cursor)
+    if not batch:
+        return jsonify({'success': False, 'error': 'Batch not found'}), 404
+    
+    try:
+        body, mimetype, extension = manifests.generate(dict(batch), kind, file_format, columns, date_format)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    download_name = secure_filename(batch['batch_name'] or '') or f"batch_{batch_id}"
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': f'attachment; filename={download_name}_{kind}_manifest.{extension}',
+            'X-Accel-Buffering': 'no',
+            'Cache-Control': 'no-store'
+        }
+    )
+
 @bp.route('/summary', methods=['GET'])
 def get_batches_summary():
     """Get summary of all batches including return date stats"""
@@ -1,5 +1,6 @@
 from flask import Blueprint, request, jsonify, session, current_app
 from app.database import get_db, release_db
+from app import storage, upload_stats
 from datetime import datetime
 import json
 import os
@@ -141,16 +142,12 @@ def upload_logo():
     if '.' not in file.filename or file.filename.rsplit('.', 1)[1].lower() not in allowed_extensions:
         return jsonify({'success': False, 'error': 'Invalid file type. Allowed: PNG, JPG, JPEG, SVG, GIF'}), 400
     
-    # Generate unique filename
-    import uuid
+    # Save file under its content hash
     ext = file.filename.rsplit('.', 1)[1].lower()
-    filename = f"logo_{uuid.uuid4().hex}.{ext}"
-    
-    # Save file
     upload_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'company')
-    os.makedirs(upload_folder, exist_ok=True)
-    file_path = os.path.join(upload_folder, filename)
-    file.save(file_path)
+    stored = storage.store_upload(file, upload_folder, ext)
+    filename = stored['filename']
+    file_path = stored['path']
     
     # Update database with logo path
     conn = None
@@ -165,14 +162,21 @@ def upload_logo():
         if existing:
             cursor.execute("UPDATE company_settings SET logo = %s, updated_at = %s WHERE id = %s",
                           (filename, datetime.now(), existing['id']))
+            settings_id = existing['id']
         else:
             # Create settings with logo
             fields = ['logo', 'created_at', 'updated_at']
             placeholders = ['%s', '%s', '%s']
             values = [filename, datetime.now(), datetime.now()]
             
-            query = f"INSERT INTO company_settings ({', '.join(fields)}) VALUES ({', '.join(placeholders)})"
+            query = f"INSERT INTO company_settings ({', '.join(fields)}) VALUES ({', '.join(placeholders)}) RETURNING id"
             cursor.execute(query, values)
+            settings_id = cursor.fetchone()['id']
+        
+        storage.register_blob(cursor, 'company', filename, stored['size'])
+        if stored['created']:
+            upload_stats.record_added(cursor, 'company', filename, stored['size'])
+        storage.track_reference(cursor, 'company_settings', 'logo', settings_id, filename, 'company')
         
         conn.commit()
         
@@ -184,8 +188,8 @@ def upload_logo():
     except Exception as e:
         if conn:
             conn.rollback()
-        # Delete uploaded file if database update fails
-        if os.path.exists(file_path):
+        # Delete uploaded file if database update fails (unless it was already stored)
+        if stored['created'] and os.path.exists(file_path):
             os.remove(file_path)
         return jsonify({'success': False, 'error': str(e)}), 500
     finally:
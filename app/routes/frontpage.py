@@ -0,0 +1,60 @@
+from flask import Blueprint, request, jsonify, session
+from app.database import get_db, release_db
+from app import homepage, cache
+
+bp = Blueprint('frontpage', __name__, url_prefix='/api/frontpage')
+
+@bp.route('', methods=['GET'])
+def get_frontpage_settings():
+    """Get the homepage settings (defaults filled in for unset fields)"""
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        settings = {**homepage.DEFAULTS, **{
+            key: value for key, value in homepage.load_settings(cursor).items() if value is not None
+        }}
+        return jsonify({'success': True, 'settings': settings})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        if conn:
+            release_db(conn, cursor)
+
+@bp.route('', methods=['PUT', 'POST'])
+def save_frontpage_settings():
+    """Save homepage settings; every worker rebuilds its cached homepage on the next visit"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    return _save(request.get_json(silent=True) or {}, required=True)
+
+@bp.route('/publish', methods=['POST'])
+def publish_frontpage():
+    """Save the settings sent (if any) and drop every worker's cached homepage"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    return _save(request.get_json(silent=True) or {}, required=False)
+
+def _save(data, required):
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        if data or required:
+            settings = homepage.save_settings(cursor, data)
+        else:
+            settings = homepage.load_settings(cursor)
+        cache.notify(cursor, 'frontpage_settings')
+        conn.commit()
+        return jsonify({'success': True, 'message': 'Front page settings saved', 'settings': settings})
+    except ValueError as e:
+        if conn:
+            conn.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        if conn:
+            release_db(conn, cursor)
@@ -1,6 +1,10 @@
-from flask import Blueprint, request, jsonify, session, current_app, send_file
+from flask import Blueprint, request, jsonify, session, current_app, send_file, Response, stream_with_context
 from app.database import get_db, release_db
+from app.idempotency import idempotent
+from app import invoice_pdf, zipstream, jobs, rollups
+from werkzeug.utils import secure_filename
 from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
 import json
 import traceback
 import io
@@ -23,9 +27,9 @@ def migrate_invoices_table():
             SELECT EXISTS (
                 SELECT FROM information_schema.tables 
                 WHERE table_name = 'invoices'
-            )
+            ) AS table_exists
         """)
-        table_exists = cursor.fetchone()[0]
+        table_exists = cursor.fetchone()['table_exists']
         
         if not table_exists:
             print("🔄 Creating invoices table...")
@@ -60,9 +64,10 @@ def migrate_invoices_table():
                 FROM information_schema.columns 
                 WHERE table_name = 'invoices'
             """)
-            existing_columns = [row[0] for row in cursor.fetchall()]
+            existing_columns = [row['column_name'] for row in cursor.fetchall()]
             
             columns_to_add = {
+                'amount': 'DECIMAL(10,2)',
                 'base_amount': 'DECIMAL(10,2) DEFAULT 0',
                 'gst_percent': 'DECIMAL(5,2) DEFAULT 5',
                 'gst_amount': 'DECIMAL(10,2) DEFAULT 0',
@@ -70,6 +75,7 @@ def migrate_invoices_table():
                 'tcs_amount': 'DECIMAL(10,2) DEFAULT 0',
                 'items': 'JSONB',
                 'description': 'TEXT',
+                'notes': 'TEXT',
                 'invoice_date': 'DATE DEFAULT CURRENT_DATE'
             }
             
@@ -80,6 +86,13 @@ def migrate_invoices_table():
                     conn.commit()
                     print(f"✅ Column {col_name} added!")
             
+            # Tables created by init_db keep the total in total_amount; the
+            # routes and reports read and write amount
+            if 'total_amount' in existing_columns:
+                cursor.execute("UPDATE invoices SET amount = total_amount WHERE amount IS NULL")
+                cursor.execute("ALTER TABLE invoices ALTER COLUMN total_amount DROP NOT NULL")
+                conn.commit()
+            
             print("✅ invoices table verified!")
             
     except Exception as e:
@@ -90,12 +103,69 @@ def migrate_invoices_table():
         if conn:
             release_db(conn, cursor)
 
+# ============================================================
+# DATABASE MIGRATION - Create invoice number sequence if not exists
+# ============================================================
+def migrate_invoice_number_sequence():
+    """Create the sequence invoice numbers are allocated from (concurrent creates never collide)"""
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        cursor.execute("CREATE SEQUENCE IF NOT EXISTS invoice_number_seq")
+        conn.commit()
+        print("✅ invoice_number_seq verified!")
+    except Exception as e:
+        print(f"⚠️ Migration error: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn:
+            release_db(conn, cursor)
+
 # Run migration on import
 try:
     migrate_invoices_table()
+    migrate_invoice_number_sequence()
+    rollups.migrate_rollup_tables()
 except Exception as e:
     print(f"⚠️ Migration failed: {e}")
 
+# ============================================================
+# HELPERS
+# ============================================================
+
+CENTS = Decimal('0.01')
+
+# Same format for single and bulk creates: INV-<yyyymmdd>-<6 digit sequence>
+INVOICE_NUMBER_SQL = "'INV-' || to_char(CURRENT_DATE, 'YYYYMMDD') || '-' || lpad(nextval('invoice_number_seq')::text, 6, '0')"
+
+def calculate_invoice_amounts(amount, gst_percent, tcs_percent):
+    """
+    Compute GST on the base amount and TCS on base + GST, rounded to paise
+
+    Uses half-up rounding, the same as ROUND(numeric, 2) in the bulk insert.
+    """
+    base = Decimal(str(amount)).quantize(CENTS, rounding=ROUND_HALF_UP)
+    gst_percent = Decimal(str(gst_percent))
+    tcs_percent = Decimal(str(tcs_percent))
+    gst_amount = (base * gst_percent / 100).quantize(CENTS, rounding=ROUND_HALF_UP)
+    subtotal = base + gst_amount
+    tcs_amount = (subtotal * tcs_percent / 100).quantize(CENTS, rounding=ROUND_HALF_UP)
+    return {
+        'base_amount': base,
+        'gst_percent': gst_percent,
+        'gst_amount': gst_amount,
+        'tcs_percent': tcs_percent,
+        'tcs_amount': tcs_amount,
+        'total_amount': subtotal + tcs_amount
+    }
+
+def next_invoice_number(cursor):
+    """Allocate the next invoice number from invoice_number_seq"""
+    cursor.execute(f"SELECT {INVOICE_NUMBER_SQL} AS invoice_number")
+    return cursor.fetchone()['invoice_number']
+
 # ============================================================
 # ROUTES
 # ============================================================
@@ -195,7 +265,128 @@ def get_invoice_stats():
         if conn:
             release_db(conn, cursor)
 
+def load_aging_report(group_by, batch_id):
+    """
+    Read the aging report from the rollup as it stands
+
+    Re-aging is left to the scheduled aging_rollup job; the freshness dict
+    tells the caller whether the rows are behind.
+    """
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        rows, totals = rollups.get_aging(cursor, group_by, batch_id)
+        return rows, totals, rollups.aging_freshness(cursor)
+    finally:
+        if conn:
+            release_db(conn, cursor)
+
+def serialize_aging_row(row):
+    row_dict = dict(row)
+    for key, value in row_dict.items():
+        if isinstance(value, Decimal):
+            row_dict[key] = float(value)
+        elif hasattr(value, 'isoformat'):
+            row_dict[key] = value.isoformat()
+    return row_dict
+
+@bp.route('/aging', methods=['GET'])
+def get_aging_report():
+    """Get invoice aging (current, 1-30, 31-60, 61-90, 90+ days) per batch or per traveler"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+
+    group_by = request.args.get('group_by', 'batch')
+    if group_by not in ('batch', 'traveler'):
+        return jsonify({'success': False, 'error': 'group_by must be batch or traveler'}), 400
+    
+    try:
+        rows, totals, freshness = load_aging_report(group_by, request.args.get('batch_id', type=int))
+        return jsonify({
+            'success': True,
+            'group_by': group_by,
+            'as_of': freshness['as_of'].isoformat() if freshness['as_of'] else None,
+            'stale': freshness['stale'],
+            'buckets': [{'key': key, 'label': label} for key, label in rollups.AGING_BUCKETS],
+            'rows': [serialize_aging_row(row) for row in rows],
+            'totals': {key: float(value) for key, value in totals.items()}
+        })
+    except Exception as e:
+        print(f"❌ Error in get_aging_report: {str(e)}")
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@bp.route('/aging/export', methods=['GET'])
+def export_aging_report():
+    """Export the aging report to CSV or XLSX"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+
+    group_by = request.args.get('group_by', 'batch')
+    file_format = request.args.get('format', 'csv').lower()
+    if group_by not in ('batch', 'traveler'):
+        return jsonify({'success': False, 'error': 'group_by must be batch or traveler'}), 400
+    if file_format not in ('csv', 'xlsx'):
+        return jsonify({'success': False, 'error': 'format must be csv or xlsx'}), 400
+    
+    try:
+        rows, totals, _ = load_aging_report(group_by, request.args.get('batch_id', type=int))
+    except Exception as e:
+        print(f"❌ Error exporting aging report: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    
+    amount_columns = [('invoiced', 'Invoiced'), ('paid', 'Paid'), ('outstanding', 'Outstanding')] + \
+        rollups.AGING_BUCKETS + [('unapplied', 'Unapplied Credit')]
+    if group_by == 'traveler':
+        header = ['Traveler', 'Passport', 'Mobile', 'Batch', 'Invoices', 'Oldest Due']
+        lead = lambda r: [f"{r['first_name'] or ''} {r['last_name'] or ''}".strip(), r['passport_no'] or '',
+                          r['mobile'] or '', r['batch_name'] or '', r['invoice_count'], r['oldest_due_date']]
+    else:
+        header = ['Batch', 'Travelers', 'Invoices', 'Oldest Due']
+        lead = lambda r: [r['batch_name'] or 'No Batch', r['traveler_count'], r['invoice_count'], r['oldest_due_date']]
+    header += [label for _, label in amount_columns]
+    
+    table = [lead(row) + [float(row[key] or 0) for key, _ in amount_columns] for row in rows]
+    total_row = ['Total'] + [''] * (len(header) - len(amount_columns) - 1) + \
+        [float(totals[key]) for key, _ in amount_columns]
+    
+    filename = f'invoice_aging_{group_by}_{datetime.now().strftime("%Y%m%d_%H%M%S")}'
+    if file_format == 'xlsx':
+        from openpyxl import Workbook
+        
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet('Aging')
+        sheet.append(header)
+        for values in table:
+            sheet.append(values)
+        sheet.append(total_row)
+        output = io.BytesIO()
+        workbook.save(output)
+        output.seek(0)
+        return send_file(
+            output,
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            as_attachment=True,
+            download_name=f'{filename}.xlsx'
+        )
+    
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(header)
+    for values in table:
+        writer.writerow([v.isoformat() if hasattr(v, 'isoformat') else v for v in values])
+    writer.writerow(total_row)
+    
+    return send_file(
+        io.BytesIO(output.getvalue().encode('utf-8-sig')),
+        mimetype='text/csv',
+        as_attachment=True,
+        download_name=f'{filename}.csv'
+    )
+
 @bp.route('', methods=['POST'])
+@idempotent
 def create_invoice():
     """Create new invoice with GST/TCS calculation"""
     if 'user_id' not in session:
@@ -209,40 +400,39 @@ def create_invoice():
         return jsonify({'success': False, 'error': 'traveler_id is required'}), 400
     
     # Get amount (this could be base amount or total)
-    amount = float(data.get('amount', 0))
+    try:
+        amount = Decimal(str(data.get('amount', 0)))
+        gst_percent = Decimal(str(data.get('gst_percent', 5)))
+        tcs_percent = Decimal(str(data.get('tcs_percent', 1)))
+    except InvalidOperation:
+        return jsonify({'success': False, 'error': 'Valid amount is required'}), 400
     if amount <= 0:
         return jsonify({'success': False, 'error': 'Valid amount is required'}), 400
 
-    # Get or calculate GST and TCS
-    gst_percent = float(data.get('gst_percent', 5))
-    tcs_percent = float(data.get('tcs_percent', 1))
-    
     # Calculate taxes
-    gst_amount = amount * (gst_percent / 100)
-    subtotal = amount + gst_amount
-    tcs_amount = subtotal * (tcs_percent / 100)
-    total_amount = subtotal + tcs_amount
+    amounts = calculate_invoice_amounts(amount, gst_percent, tcs_percent)
+    amount = amounts['base_amount']
+    gst_amount = amounts['gst_amount']
+    tcs_amount = amounts['tcs_amount']
+    total_amount = amounts['total_amount']
     
     # Store all tax details in items JSON
     items_data = {
-        'base_amount': amount,
-        'gst_percent': gst_percent,
-        'gst_amount': gst_amount,
-        'tcs_percent': tcs_percent,
-        'tcs_amount': tcs_amount,
-        'total_amount': total_amount,
+        'base_amount': float(amount),
+        'gst_percent': float(gst_percent),
+        'gst_amount': float(gst_amount),
+        'tcs_percent': float(tcs_percent),
+        'tcs_amount': float(tcs_amount),
+        'total_amount': float(total_amount),
         'description': data.get('description', 'Travel Package'),
         'notes': data.get('notes', '')
     }
     
-    # Generate invoice number
-    timestamp = int(datetime.now().timestamp()) % 10000
-    invoice_number = f"INV-{datetime.now().strftime('%Y%m%d')}-{data['traveler_id']}-{timestamp}"
-    
     conn = None
     cursor = None
     try:
         conn, cursor = get_db()
+        invoice_number = next_invoice_number(cursor)
         
         cursor.execute("""
             INSERT INTO invoices (
@@ -274,13 +464,14 @@ def create_invoice():
         
         result = cursor.fetchone()
         invoice_id = result['id'] if result else None
+        rollups.refresh_aging(cursor, [data['traveler_id']])
         conn.commit()
         
         return jsonify({
             'success': True,
             'invoice_id': invoice_id,
             'invoice_number': invoice_number,
-            'total_amount': total_amount,
+            'total_amount': float(total_amount),
             'message': 'Invoice created successfully'
         })
     except Exception as e:
@@ -293,6 +484,164 @@ def create_invoice():
         if conn:
             release_db(conn, cursor)
 
+@bp.route('/bulk', methods=['POST'])
+@idempotent
+def create_invoices_bulk():
+    """
+    Invoice a whole batch or a list of travelers in one statement
+    
+    Body: batch_id or traveler_ids (both: only those travelers of the batch),
+    plus optional amount (defaults to each traveler's batch price),
+    gst_percent, tcs_percent, due_date, status,
+    description, notes and skip_existing (default true: travelers who already
+    have an invoice for the batch are skipped).
+    """
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+
+    data = request.json or {}
+    batch_id = data.get('batch_id')
+    traveler_ids = data.get('traveler_ids') or []
+    if not batch_id and not traveler_ids:
+        return jsonify({'success': False, 'error': 'batch_id or traveler_ids is required'}), 400
+    
+    try:
+        traveler_ids = [int(t) for t in traveler_ids]
+        amount = Decimal(str(data['amount'])) if data.get('amount') not in (None, '') else None
+        gst_percent = Decimal(str(data.get('gst_percent', 5)))
+        tcs_percent = Decimal(str(data.get('tcs_percent', 1)))
+    except (InvalidOperation, TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'Invalid traveler_ids, amount or tax rates'}), 400
+    if amount is not None and amount <= 0:
+        return jsonify({'success': False, 'error': 'Valid amount is required'}), 400
+    
+    skip_existing = data.get('skip_existing', True)
+    if isinstance(skip_existing, str):
+        skip_existing = {'true': True, '1': True, 'yes': True,
+                         'false': False, '0': False, 'no': False}.get(skip_existing.strip().lower())
+    elif isinstance(skip_existing, int) and skip_existing in (0, 1):
+        skip_existing = bool(skip_existing)
+    if not isinstance(skip_existing, bool):
+        return jsonify({'success': False, 'error': 'skip_existing must be true or false'}), 400
+    
+    description = data.get('description', 'Travel Package')
+    notes = data.get('notes', '')
+    
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        # Serialise bulk runs so skip_existing holds when two are started together
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", (jobs.lock_key('invoices_bulk'),))
+        
+        # Taxes are computed set-wise with numeric ROUND (half-up, same as
+        # calculate_invoice_amounts) and every row goes in with one INSERT
+        cursor.execute(f"""
+            WITH selected AS (
+                SELECT
+                    t.id AS traveler_id,
+                    COALESCE(%(batch_id)s, t.batch_id) AS batch_id,
+                    ROUND(COALESCE(%(amount)s::numeric, b.price), 2) AS base_amount,
+                    EXISTS (
+                        SELECT 1 FROM invoices i
+                        WHERE i.traveler_id = t.id AND i.batch_id IS NOT DISTINCT FROM COALESCE(%(batch_id)s, t.batch_id)
+                    ) AS has_invoice
+                FROM travelers t
+                LEFT JOIN batches b ON b.id = COALESCE(%(batch_id)s, t.batch_id)
+                WHERE (%(batch_id)s::int IS NULL OR t.batch_id = %(batch_id)s)
+                  AND (cardinality(%(traveler_ids)s::int[]) = 0 OR t.id = ANY(%(traveler_ids)s::int[]))
+            ),
+            taxed AS (
+                SELECT s.*, ROUND(s.base_amount * %(gst_percent)s / 100, 2) AS gst_amount
+                FROM selected s
+                WHERE s.base_amount > 0 AND NOT (%(skip_existing)s AND s.has_invoice)
+            ),
+            totals AS (
+                SELECT t.*, ROUND((t.base_amount + t.gst_amount) * %(tcs_percent)s / 100, 2) AS tcs_amount
+                FROM taxed t
+            ),
+            inserted AS (
+                INSERT INTO invoices (
+                    invoice_number, traveler_id, batch_id, amount,
+                    base_amount, gst_percent, gst_amount, tcs_percent, tcs_amount,
+                    due_date, status, items, invoice_date, description, notes,
+                    created_at, updated_at
+                )
+                SELECT
+                    {INVOICE_NUMBER_SQL}, traveler_id, batch_id, base_amount + gst_amount + tcs_amount,
+                    base_amount, %(gst_percent)s, gst_amount, %(tcs_percent)s, tcs_amount,
+                    %(due_date)s, %(status)s,
+                    jsonb_build_object(
+                        'base_amount', base_amount, 'gst_percent', %(gst_percent)s, 'gst_amount', gst_amount,
+                        'tcs_percent', %(tcs_percent)s, 'tcs_amount', tcs_amount,
+                        'total_amount', base_amount + gst_amount + tcs_amount,
+                        'description', %(description)s::text, 'notes', %(notes)s::text
+                    ),
+                    COALESCE(%(invoice_date)s::date, CURRENT_DATE), %(description)s, %(notes)s,
+                    CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
+                FROM totals
+                ORDER BY traveler_id
+                RETURNING id, invoice_number, traveler_id, amount
+            )
+            SELECT
+                s.traveler_id, s.base_amount, s.has_invoice,
+                i.id AS invoice_id, i.invoice_number, i.amount AS total_amount
+            FROM selected s
+            LEFT JOIN inserted i ON i.traveler_id = s.traveler_id
+            ORDER BY s.traveler_id
+        """, {
+            'batch_id': batch_id,
+            'traveler_ids': traveler_ids,
+            'amount': amount,
+            'gst_percent': gst_percent,
+            'tcs_percent': tcs_percent,
+            'skip_existing': skip_existing,
+            'due_date': data.get('due_date'),
+            'status': data.get('status', 'pending'),
+            'invoice_date': data.get('invoice_date'),
+            'description': description,
+            'notes': notes
+        })
+        rows = cursor.fetchall()
+        rollups.refresh_aging(cursor, [row['traveler_id'] for row in rows if row['invoice_id']])
+        conn.commit()
+        
+        created = []
+        skipped = []
+        for row in rows:
+            if row['invoice_id']:
+                created.append({
+                    'invoice_id': row['invoice_id'],
+                    'invoice_number': row['invoice_number'],
+                    'traveler_id': row['traveler_id'],
+                    'total_amount': float(row['total_amount'])
+                })
+            else:
+                reason = 'Already invoiced' if row['has_invoice'] else 'No amount (batch has no price)'
+                skipped.append({'traveler_id': row['traveler_id'], 'reason': reason})
+        
+        found = {row['traveler_id'] for row in rows}
+        missing = 'Traveler not in this batch' if batch_id else 'Traveler not found'
+        skipped.extend({'traveler_id': t, 'reason': missing} for t in traveler_ids if t not in found)
+        
+        return jsonify({
+            'success': True,
+            'created_count': len(created),
+            'skipped_count': len(skipped),
+            'total_amount': float(sum((row['total_amount'] for row in rows if row['invoice_id']), Decimal('0'))),
+            'invoices': created,
+            'skipped': skipped
+        })
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        print(f"❌ Error creating bulk invoices: {str(e)}")
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    finally:
+        if conn:
+            release_db(conn, cursor)
+
 @bp.route('/<int:invoice_id>', methods=['GET'])
 def get_invoice(invoice_id):
     """Get single invoice details"""
@@ -358,8 +707,9 @@ def update_invoice(invoice_id):
     try:
         conn, cursor = get_db()
         
-        cursor.execute('SELECT id FROM invoices WHERE id = %s', (invoice_id,))
-        if not cursor.fetchone():
+        cursor.execute('SELECT id, traveler_id FROM invoices WHERE id = %s', (invoice_id,))
+        invoice = cursor.fetchone()
+        if not invoice:
             return jsonify({'success': False, 'error': 'Invoice not found'}), 404
         
         update_fields = []
@@ -387,6 +737,7 @@ def update_invoice(invoice_id):
         
         query = f"UPDATE invoices SET {', '.join(update_fields)} WHERE id = %s"
         cursor.execute(query, params)
+        rollups.refresh_aging(cursor, [invoice['traveler_id']])
         conn.commit()
         
         return jsonify({'success': True, 'message': 'Invoice updated successfully'})
@@ -409,8 +760,10 @@ def delete_invoice(invoice_id):
     cursor = None
     try:
         conn, cursor = get_db()
-        cursor.execute('DELETE FROM invoices WHERE id = %s RETURNING id', (invoice_id,))
+        cursor.execute('DELETE FROM invoices WHERE id = %s RETURNING id, traveler_id', (invoice_id,))
         result = cursor.fetchone()
+        if result:
+            rollups.refresh_aging(cursor, [result['traveler_id']])
         conn.commit()
         
         if result:
@@ -500,6 +853,98 @@ def get_batch_invoices(batch_id):
         if conn:
             release_db(conn, cursor)
 
+@bp.route('/<int:invoice_id>/pdf', methods=['GET'])
+def download_invoice_pdf(invoice_id):
+    """Download the tax invoice PDF (cached until the invoice or company settings change)"""
+    if 'user_id' not in session and 'traveler_id' not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    upload_root = current_app.config['UPLOAD_FOLDER']
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        invoices = invoice_pdf.load_invoices(cursor, upload_root, [invoice_id])
+    except Exception as e:
+        print(f"❌ Error loading invoice PDF: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        if conn:
+            release_db(conn, cursor)
+    
+    if not invoices:
+        return jsonify({'success': False, 'error': 'Invoice not found'}), 404
+    
+    _, key, payload = invoices[0]
+    # Travelers can only download their own invoices
+    if 'user_id' not in session and payload['invoice'].get('traveler_id') != session['traveler_id']:
+        return jsonify({'success': False, 'error': 'Access denied'}), 403
+    
+    if request.headers.get('If-None-Match') == f'"{key}"':
+        return '', 304
+    
+    try:
+        path = invoice_pdf.submit_invoice(upload_root, invoice_id, key, payload).result(timeout=120)
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Failed to render invoice: {str(e)}'}), 500
+    
+    invoice_number = secure_filename(payload['invoice'].get('invoice_number') or '') or str(invoice_id)
+    response = send_file(path, mimetype='application/pdf', as_attachment=True,
+                         download_name=f"{invoice_number}.pdf")
+    response.headers['ETag'] = f'"{key}"'
+    return response
+
+@bp.route('/batch/<int:batch_id>/pdf.zip', methods=['GET'])
+def download_batch_invoice_pdfs(batch_id):
+    """Render every invoice of a batch in the render pool and stream the PDFs as one ZIP"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    upload_root = current_app.config['UPLOAD_FOLDER']
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        cursor.execute('SELECT id, batch_name FROM batches WHERE id = %s', (batch_id,))
+        batch = cursor.fetchone()
+        if not batch:
+            return jsonify({'success': False, 'error': 'Batch not found'}), 404
+        
+        cursor.execute('SELECT id FROM invoices WHERE batch_id = %s ORDER BY invoice_number, id', (batch_id,))
+        invoice_ids = [row['id'] for row in cursor.fetchall()]
+        invoices = invoice_pdf.load_invoices(cursor, upload_root, invoice_ids)
+    except Exception as e:
+        print(f"❌ Error loading batch invoices: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        if conn:
+            release_db(conn, cursor)
+    
+    # Queue every render up front so the pool works while earlier entries stream
+    render_jobs = [
+        (payload['invoice'], invoice_pdf.submit_invoice(upload_root, invoice_id, key, payload))
+        for invoice_id, key, payload in invoices
+    ]
+    
+    def entries():
+        for invoice, future in render_jobs:
+            name = secure_filename(invoice.get('invoice_number') or '') or f"invoice_{invoice['id']}"
+            try:
+                yield f"{name}.pdf", future.result(timeout=300)
+            except Exception as e:
+                yield f"{name}.error.txt", f"Failed to render invoice: {e}".encode('utf-8')
+    
+    download_name = secure_filename(batch['batch_name'] or '') or f"batch_{batch_id}"
+    return Response(
+        stream_with_context(zipstream.stream_zip(entries())),
+        mimetype='application/zip',
+        headers={
+            'Content-Disposition': f'attachment; filename={download_name}_invoices.zip',
+            'X-Accel-Buffering': 'no',
+            'Cache-Control': 'no-store'
+        }
+    )
+
 @bp.route('/export', methods=['GET'])
 def export_invoices():
     """Export invoices to CSV"""
@@ -1,6 +1,13 @@
 from flask import Blueprint, request, jsonify, session, current_app, send_file
+from itsdangerous import URLSafeSerializer
 from app.database import get_db, release_db
-from datetime import datetime, timedelta
+from app.idempotency import idempotent
+from app import rollups, reconciliation, installments
+from app.routes.receipts import RECEIPT_NUMBER_SQL
+from psycopg2.extras import execute_values
+from datetime import datetime, timedelta, date
+from zoneinfo import ZoneInfo
+import hashlib
 import json
 import traceback
 import io
@@ -8,6 +15,236 @@ import csv
 
 bp = Blueprint('payments', __name__, url_prefix='/api/payments')
 
+# ============================================================
+# DATABASE MIGRATION - Create ledger index if not exists
+# ============================================================
+def migrate_payments_indexes():
+    """Create the ledger and overdue scanner indexes if they don't exist"""
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_payments_date_id ON payments (payment_date, id)")
+        # Partial index for the overdue scanner: only pending rows with a due date
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_payments_due_pending ON payments (due_date, id)
+            WHERE status = 'pending' AND due_date IS NOT NULL
+        """)
+        conn.commit()
+        print("✅ payments indexes verified!")
+    except Exception as e:
+        print(f"⚠️ Migration error: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn:
+            release_db(conn, cursor)
+
+# Run migration on import
+try:
+    migrate_payments_indexes()
+    rollups.migrate_daily_rollup_tables()
+except Exception as e:
+    print(f"⚠️ Migration failed: {e}")
+
+# ============================================================
+# HELPERS
+# ============================================================
+
+PAYMENT_COLUMNS = [
+    'traveler_id', 'batch_id', 'amount', 'payment_date', 'payment_method',
+    'status', 'reference', 'notes', 'installment', 'due_date'
+]
+
+# Payment ids are drawn up front so each receipt can point at its payment
+# and every result row can be matched back to its input position
+INSERT_PAYMENTS_SQL = """
+    WITH rows AS MATERIALIZED (
+        SELECT v.*, nextval(pg_get_serial_sequence('payments', 'id')) AS payment_id
+        FROM (VALUES %s) AS v (idx, {columns})
+    ),
+    payment AS (
+        INSERT INTO payments (id, {columns}, created_at)
+        SELECT payment_id, {columns}, CURRENT_TIMESTAMP
+        FROM rows
+        RETURNING id
+    ),
+    receipt AS (
+        INSERT INTO receipts (
+            receipt_number, traveler_id, payment_id, amount, receipt_date,
+            payment_method, transaction_id, installment_info, remarks, created_at
+        )
+        SELECT
+            {receipt_number}, traveler_id, payment_id, amount, payment_date,
+            payment_method, reference, installment, notes, CURRENT_TIMESTAMP
+        FROM rows
+        WHERE {with_receipt} AND status = 'completed'
+        ORDER BY idx
+        RETURNING id, payment_id, receipt_number
+    )
+    SELECT rows.idx, rows.payment_id, receipt.id AS receipt_id, receipt.receipt_number
+    FROM rows
+    LEFT JOIN receipt ON receipt.payment_id = rows.payment_id
+    ORDER BY rows.idx
+"""
+
+INSERT_VALUES_TEMPLATE = (
+    "(%(idx)s, %(traveler_id)s::int, %(batch_id)s::int, %(amount)s::numeric, %(payment_date)s::timestamp, "
+    "%(payment_method)s::varchar, %(status)s::varchar, %(reference)s::text, %(notes)s::text, "
+    "%(installment)s::varchar, %(due_date)s::date)"
+)
+
+def payment_row(data):
+    """Map a request payload to payment columns (same defaults as create_payment)"""
+    return {
+        'traveler_id': data.get('traveler_id'),
+        'batch_id': data.get('batch_id'),
+        'amount': data.get('amount'),
+        'payment_date': data.get('payment_date'),
+        'payment_method': data.get('payment_method'),
+        'status': data.get('status', 'completed'),
+        'reference': data.get('transaction_id') or data.get('reference'),
+        'notes': data.get('remarks') or data.get('notes'),
+        'installment': data.get('installment'),
+        'due_date': data.get('due_date')
+    }
+
+def insert_payments(cursor, rows, with_receipt=False):
+    """
+    Insert payments (and the receipts of the completed ones) in one statement
+
+    Receipt numbers come from receipt_number_seq, so concurrent posts never
+    collide, and a failure leaves neither the payment nor its receipt behind.
+
+    Returns:
+        list: dicts with payment_id, receipt_id and receipt_number, in input order
+    """
+    values = [dict(row, idx=idx) for idx, row in enumerate(rows)]
+    query = INSERT_PAYMENTS_SQL.format(
+        columns=', '.join(PAYMENT_COLUMNS),
+        receipt_number=RECEIPT_NUMBER_SQL,
+        with_receipt='TRUE' if with_receipt else 'FALSE'
+    )
+    results = execute_values(cursor, query, values,
+                             template=INSERT_VALUES_TEMPLATE, page_size=max(len(values), 1), fetch=True)
+    return [
+        {'payment_id': r['payment_id'], 'receipt_id': r['receipt_id'], 'receipt_number': r['receipt_number']}
+        for r in results
+    ]
+
+BULK_MAX_ROWS = 10000
+BULK_REQUIRED_FIELDS = ('traveler_id', 'batch_id', 'amount', 'payment_date')
+
+def read_bulk_payments():
+    """
+    Read a bulk payment request from JSON or CSV
+
+    Returns:
+        tuple: (list of payment dicts, options dict with with_receipt and partial)
+    """
+    truthy = ('1', 'true', 'yes', 'on')
+    upload = request.files.get('file')
+    if upload or request.mimetype == 'text/csv':
+        raw = upload.read() if upload else request.get_data()
+        try:
+            text = raw.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise ValueError('CSV must be UTF-8 encoded')
+        reader = csv.DictReader(io.StringIO(text))
+        payments = [
+            {(key or '').strip(): (value.strip() or None) if isinstance(value, str) else value
+             for key, value in line.items()}
+            for line in reader
+        ]
+        def flag(name):
+            return (request.form.get(name) or request.args.get(name) or '').lower() in truthy
+        return payments, {'with_receipt': flag('with_receipt'), 'partial': flag('partial')}
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        raise ValueError('Send JSON with a payments list or a CSV file')
+    payments = data.get('payments') or []
+    if not isinstance(payments, list) or not all(isinstance(p, dict) for p in payments):
+        raise ValueError('payments must be a list of objects')
+    return payments, {'with_receipt': bool(data.get('with_receipt')), 'partial': bool(data.get('partial'))}
+
+def validate_bulk_payments(payments):
+    """
+    Check each bulk row on its own (ids, amount, dates)
+
+    Returns:
+        tuple: (dict of row index -> payment columns for valid rows, outcome list)
+    """
+    rows = {}
+    outcomes = []
+    for index, payment in enumerate(payments):
+        outcomes.append({'row': index, 'status': 'valid'})
+        missing = [field for field in BULK_REQUIRED_FIELDS if not payment.get(field)]
+        if missing:
+            outcomes[index] = {'row': index, 'status': 'error', 'error': f"{', '.join(missing)} required"}
+            continue
+        try:
+            traveler_id = int(payment['traveler_id'])
+            batch_id = int(payment['batch_id'])
+        except (TypeError, ValueError):
+            outcomes[index] = {'row': index, 'status': 'error', 'error': 'Invalid traveler_id or batch_id'}
+            continue
+        try:
+            amount = float(str(payment['amount']).replace(',', ''))
+        except (TypeError, ValueError):
+            outcomes[index] = {'row': index, 'status': 'error', 'error': 'Invalid amount format'}
+            continue
+        if amount <= 0:
+            outcomes[index] = {'row': index, 'status': 'error', 'error': 'Amount must be greater than 0'}
+            continue
+        try:
+            for field in ('payment_date', 'due_date'):
+                if payment.get(field):
+                    date.fromisoformat(str(payment[field])[:10])
+        except ValueError:
+            outcomes[index] = {'row': index, 'status': 'error', 'error': f'Invalid {field} (use YYYY-MM-DD)'}
+            continue
+        rows[index] = dict(payment_row(payment), traveler_id=traveler_id, batch_id=batch_id, amount=amount,
+                           status=payment.get('status') or 'completed')
+    return rows, outcomes
+
+LEDGER_PAGE_SIZE = 100
+LEDGER_MAX_PAGE_SIZE = 500
+
+# Page query columns that are not part of a ledger row
+LEDGER_HIDDEN_COLUMNS = ('position', 'total_count', 'total_amount', 'completed_amount', 'pending_amount')
+
+def ledger_filter_key(filters):
+    """Short digest of the ledger filter values a cursor was issued for"""
+    raw = json.dumps([value for _, value in filters], separators=(',', ':'), default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:16]
+
+def _ledger_serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='payment-ledger')
+
+def encode_ledger_cursor(position, payment_id, running_total, filter_key):
+    """
+    Signed cursor: position after the last row, the running total so far and
+    the filters it belongs to, so neither can be edited or reused elsewhere
+    """
+    return _ledger_serializer().dumps([position, payment_id, running_total, filter_key])
+
+def decode_ledger_cursor(cursor_value, filter_key):
+    """
+    Returns (payment_date timestamp, payment_id, running_total)
+
+    Raises ValueError if the cursor is malformed, not signed by this server
+    or was issued for different filters.
+    """
+    try:
+        position, payment_id, running_total, cursor_filter_key = _ledger_serializer().loads(cursor_value)
+        after = datetime.fromisoformat(position).isoformat(), int(payment_id), float(running_total)
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if cursor_filter_key != filter_key:
+        raise ValueError('Cursor does not match the filters')
+    return after
+
 # ============================================================
 # ROUTES
 # ============================================================
@@ -18,6 +255,9 @@ def get_payments():
     if 'user_id' not in session and 'traveler_id' not in session:
         return jsonify({'success': False, 'error': 'Unauthorized'}), 401
 
+    # Travelers only ever see their own payments
+    own_traveler_id = session['traveler_id'] if 'user_id' not in session else None
+
     conn = None
     cursor = None
     try:
@@ -34,8 +274,9 @@ def get_payments():
             FROM payments p
             LEFT JOIN travelers t ON p.traveler_id = t.id
             LEFT JOIN batches b ON p.batch_id = b.id
+            WHERE %s::int IS NULL OR p.traveler_id = %s
             ORDER BY p.payment_date DESC
-        ''')
+        ''', (own_traveler_id, own_traveler_id))
 
         payments = cursor.fetchall()
         
@@ -67,6 +308,231 @@ def get_payments():
         if conn:
             release_db(conn, cursor)
 
+@bp.route('/installments/generate', methods=['POST'])
+@idempotent
+def generate_installments():
+    """
+    Generate installment schedules for a batch
+    
+    Body: batch_id, plan (list of {percent, due_date} or {percent,
+    days_before_departure}, e.g. 25/50/25), optional amount (defaults to the
+    batch price), traveler_ids (defaults to the whole batch), payment_method,
+    skip_existing (default true) and preview (return the schedule without
+    writing it). Each installment becomes a pending payment with its due date.
+    """
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+
+    data = request.json or {}
+    if not data.get('batch_id'):
+        return jsonify({'success': False, 'error': 'batch_id is required'}), 400
+
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        
+        cursor.execute('SELECT id, batch_name, price, departure_date FROM batches WHERE id = %s', (data['batch_id'],))
+        batch = cursor.fetchone()
+        if not batch:
+            return jsonify({'success': False, 'error': 'Batch not found'}), 404
+        
+        total = data.get('amount') or batch['price']
+        try:
+            if not total or float(total) <= 0:
+                return jsonify({'success': False, 'error': 'Batch has no price; pass amount'}), 400
+            steps = installments.parse_plan(data.get('plan'), batch['departure_date'])
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        schedule = installments.build_schedule(total, steps)
+        
+        serialized = [
+            dict(step, amount=float(step['amount']), due_date=step['due_date'].isoformat())
+            for step in schedule
+        ]
+        if data.get('preview'):
+            return jsonify({'success': True, 'batch_id': batch['id'], 'schedule': serialized})
+        
+        created, skipped = installments.generate(
+            cursor, batch['id'], schedule,
+            traveler_ids=data.get('traveler_ids'),
+            skip_existing=data.get('skip_existing', True),
+            payment_method=data.get('payment_method')
+        )
+        rollups.refresh_aging(cursor, {row['traveler_id'] for row in created})
+        rollups.refresh_daily_payments(cursor, {row['due_date'] for row in created})
+        conn.commit()
+        
+        return jsonify({
+            'success': True,
+            'batch_id': batch['id'],
+            'schedule': serialized,
+            'travelers': len({row['traveler_id'] for row in created}),
+            'created': len(created),
+            'skipped_traveler_ids': skipped
+        })
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        print(f"❌ Installment generation error: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        if conn:
+            release_db(conn, cursor)
+
+@bp.route('/overdue', methods=['GET'])
+def get_overdue_installments():
+    """
+    Daily collection worklist: pending installments past their due date
+    
+    Query: as_of (default today), within_days (also include installments due
+    in the next N days), batch_id, limit.
+    """
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+
+    try:
+        as_of = date.fromisoformat(request.args['as_of']) if request.args.get('as_of') \
+            else datetime.now(ZoneInfo(rollups.BUSINESS_TIMEZONE)).date()
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid as_of (use YYYY-MM-DD)'}), 400
+    within_days = max(request.args.get('within_days', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', installments.WORKLIST_LIMIT, type=int), 1), installments.WORKLIST_MAX_LIMIT)
+
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        rows, summary = installments.overdue_worklist(
+            cursor, as_of, within_days, request.args.get('batch_id', type=int), limit)
+        for row in rows:
+            row['due_date'] = row['due_date'].isoformat()
+        summary['as_of'] = as_of.isoformat()
+        return jsonify({'success': True, 'summary': summary, 'installments': rows})
+    except Exception as e:
+        print(f"❌ Overdue scan error: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        if conn:
+            release_db(conn, cursor)
+
+@bp.route('/ledger', methods=['GET'])
+def get_payment_ledger():
+    """
+    Page through payments oldest first with running totals
+    
+    Query: limit, cursor (from next_cursor, only valid with the same
+    filters), batch_id, traveler_id, status, method, start_date, end_date
+    (YYYY-MM-DD). The first page also returns count and amount totals of the
+    whole filtered set. Traveler sessions only see their own payments.
+    """
+    if 'user_id' not in session and 'traveler_id' not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+
+    traveler_id = request.args.get('traveler_id', type=int)
+    if 'user_id' not in session:
+        traveler_id = session['traveler_id']
+    
+    limit = min(max(request.args.get('limit', LEDGER_PAGE_SIZE, type=int), 1), LEDGER_MAX_PAGE_SIZE)
+    for field in ('start_date', 'end_date'):
+        if request.args.get(field):
+            try:
+                date.fromisoformat(request.args[field])
+            except ValueError:
+                return jsonify({'success': False, 'error': f'Invalid {field} (use YYYY-MM-DD)'}), 400
+    
+    conditions = ['p.payment_date IS NOT NULL']
+    params = []
+    filters = [
+        ('p.batch_id = %s', request.args.get('batch_id', type=int)),
+        ('p.traveler_id = %s', traveler_id),
+        ('p.status = %s', request.args.get('status')),
+        ('p.payment_method = %s', request.args.get('method')),
+        ('p.payment_date >= %s', request.args.get('start_date')),
+        ('p.payment_date < %s::date + 1', request.args.get('end_date'))
+    ]
+    for condition, value in filters:
+        if value:
+            conditions.append(condition)
+            params.append(value)
+    where = ' AND '.join(conditions)
+    filter_key = ledger_filter_key(filters)
+
+    after = None
+    carried_total = 0.0
+    if request.args.get('cursor'):
+        try:
+            after_date, after_id, carried_total = decode_ledger_cursor(request.args['cursor'], filter_key)
+            after = (after_date, after_id)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        
+        # Dates are formatted by PostgreSQL and the running total is a window
+        # over the index order, so later pages stream off idx_payments_date_id.
+        # The first page adds whole-set totals as windows over the same scan,
+        # which reads every filtered row once instead of a second query
+        totals_columns = """,
+                COUNT(*) OVER () AS total_count,
+                COALESCE(SUM(p.amount) OVER (), 0)::float8 AS total_amount,
+                COALESCE(SUM(p.amount) FILTER (WHERE p.status = 'completed') OVER (), 0)::float8 AS completed_amount,
+                COALESCE(SUM(p.amount) FILTER (WHERE p.status = 'pending') OVER (), 0)::float8 AS pending_amount
+        """ if not after else ''
+        page_where = where + (' AND (p.payment_date, p.id) > (%s::timestamp, %s)' if after else '')
+        cursor.execute(f"""
+            SELECT
+                p.id, p.traveler_id, p.batch_id, p.amount::float8 AS amount,
+                to_char(p.payment_date, 'YYYY-MM-DD"T"HH24:MI:SS') AS payment_date,
+                to_char(p.payment_date, 'YYYY-MM-DD"T"HH24:MI:SS.US') AS position,
+                to_char(p.due_date, 'YYYY-MM-DD') AS due_date,
+                p.payment_method, p.status, p.reference, p.installment,
+                t.first_name, t.last_name, t.passport_no, b.batch_name,
+                (%s + SUM(p.amount) OVER (ORDER BY p.payment_date, p.id))::float8 AS running_total
+                {totals_columns}
+            FROM payments p
+            LEFT JOIN travelers t ON p.traveler_id = t.id
+            LEFT JOIN batches b ON p.batch_id = b.id
+            WHERE {page_where}
+            ORDER BY p.payment_date, p.id
+            LIMIT %s
+        """, [carried_total] + params + (list(after) if after else []) + [limit + 1])
+        rows = cursor.fetchall()
+        
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = None
+        if has_more:
+            last = rows[-1]
+            next_cursor = encode_ledger_cursor(last['position'], last['id'], last['running_total'], filter_key)
+        
+        totals = None
+        if not after:
+            first = rows[0] if rows else {}
+            totals = {
+                'count': first.get('total_count', 0),
+                'total_amount': first.get('total_amount', 0.0),
+                'completed_amount': first.get('completed_amount', 0.0),
+                'pending_amount': first.get('pending_amount', 0.0)
+            }
+        
+        return jsonify({
+            'success': True,
+            'payments': [{k: v for k, v in r.items() if k not in LEDGER_HIDDEN_COLUMNS} for r in rows],
+            'next_cursor': next_cursor,
+            'has_more': has_more,
+            'totals': totals
+        })
+    except Exception as e:
+        print(f"❌ Payment ledger error: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        if conn:
+            release_db(conn, cursor)
+
 @bp.route('/<int:payment_id>', methods=['GET'])
 def get_payment(payment_id):
     """Get single payment with complete details"""
@@ -116,6 +582,10 @@ def get_traveler_payments(traveler_id):
     if 'user_id' not in session and 'traveler_id' not in session:
         return jsonify({'success': False, 'error': 'Unauthorized'}), 401
 
+    # If traveler is accessing, ensure they can only access their own data
+    if 'user_id' not in session and session['traveler_id'] != traveler_id:
+        return jsonify({'success': False, 'error': 'Access denied'}), 403
+
     conn = None
     cursor = None
     try:
@@ -222,6 +692,7 @@ def get_batch_payments(batch_id):
             release_db(conn, cursor)
 
 @bp.route('', methods=['POST'])
+@idempotent
 def create_payment():
     """Create new payment"""
     if 'user_id' not in session:
@@ -259,6 +730,22 @@ def create_payment():
         if not cursor.fetchone():
             return jsonify({'success': False, 'error': 'Batch not found'}), 400
 
+        # Payment and receipt in one statement
+        if data.get('with_receipt'):
+            result = insert_payments(cursor, [dict(payment_row(data), amount=amount)], with_receipt=True)[0]
+            rollups.refresh_aging(cursor, [data['traveler_id']])
+            rollups.refresh_daily_payments(cursor, rollups.payment_days(cursor, payment_ids=[result['payment_id']]))
+            conn.commit()
+
+            return jsonify({
+                'success': True,
+                'payment_id': result['payment_id'],
+                'receipt_id': result['receipt_id'],
+                'receipt_number': result['receipt_number'],
+                'message': 'Payment recorded successfully',
+                'amount': amount
+            })
+
         # Insert payment
         cursor.execute('''
             INSERT INTO payments (
@@ -283,6 +770,8 @@ def create_payment():
 
         result = cursor.fetchone()
         payment_id = result['id'] if result else None
+        rollups.refresh_aging(cursor, [data['traveler_id']])
+        rollups.refresh_daily_payments(cursor, rollups.payment_days(cursor, payment_ids=[payment_id]))
 
         conn.commit()
 
@@ -301,6 +790,154 @@ def create_payment():
         if conn:
             release_db(conn, cursor)
 
+@bp.route('/bulk', methods=['POST'])
+@idempotent
+def create_payments_bulk():
+    """
+    Record many payments at once
+    
+    Body: JSON with payments (list of create_payment payloads), with_receipt
+    and partial, or a CSV upload (file field or text/csv body) with one
+    payment per row and the flags as form or query fields. Traveler and batch
+    ids are checked for all rows in one query and the valid rows are written
+    in one statement; completed payments get their receipts in the same
+    statement when with_receipt is set. Unless partial is set, any invalid row
+    rejects the whole request. Every row gets an outcome in results.
+    """
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+
+    try:
+        payments, options = read_bulk_payments()
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    if not payments:
+        return jsonify({'success': False, 'error': 'payments list is required'}), 400
+    if len(payments) > BULK_MAX_ROWS:
+        return jsonify({'success': False, 'error': f'At most {BULK_MAX_ROWS} payments per request'}), 400
+
+    rows, outcomes = validate_bulk_payments(payments)
+
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        
+        # Every traveler and batch id in one round trip
+        cursor.execute('''
+            SELECT v.idx, t.id IS NOT NULL AS traveler_found, b.id IS NOT NULL AS batch_found
+            FROM unnest(%s::int[], %s::int[], %s::int[]) AS v (idx, traveler_id, batch_id)
+            LEFT JOIN travelers t ON t.id = v.traveler_id
+            LEFT JOIN batches b ON b.id = v.batch_id
+        ''', (list(rows), [row['traveler_id'] for row in rows.values()], [row['batch_id'] for row in rows.values()]))
+        for found in cursor.fetchall():
+            if not found['traveler_found'] or not found['batch_found']:
+                outcomes[found['idx']] = {
+                    'row': found['idx'], 'status': 'error',
+                    'error': 'Traveler not found' if not found['traveler_found'] else 'Batch not found'
+                }
+                del rows[found['idx']]
+        
+        failed = len(payments) - len(rows)
+        if failed and not options['partial']:
+            return jsonify({
+                'success': False,
+                'error': 'Invalid payments',
+                'failed': failed,
+                'errors': [o for o in outcomes if o['status'] == 'error'],
+                'results': outcomes
+            }), 400
+        
+        results = []
+        if rows:
+            indexes = list(rows)
+            results = insert_payments(cursor, list(rows.values()), with_receipt=options['with_receipt'])
+            for idx, result in zip(indexes, results):
+                outcomes[idx] = dict(result, row=idx, status='created')
+            # Summaries once for the whole batch
+            rollups.refresh_aging(cursor, [row['traveler_id'] for row in rows.values()])
+            rollups.refresh_daily_payments(cursor, rollups.payment_days(
+                cursor, payment_ids=[result['payment_id'] for result in results]))
+        conn.commit()
+        
+        return jsonify({
+            'success': True,
+            'count': len(results),
+            'failed': failed,
+            'total_amount': sum(row['amount'] for row in rows.values()),
+            'payments': results,
+            'results': outcomes
+        })
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    finally:
+        if conn:
+            release_db(conn, cursor)
+
+@bp.route('/reconcile', methods=['POST'])
+def reconcile_statement():
+    """
+    Reconcile a bank statement against payments
+    
+    Multipart form: file (CSV or XLSX statement), date_window (days, default
+    3), apply (complete the pending payments of matched lines) and
+    include_probable (also complete fuzzy matches when applying). Returns
+    every credit line with its status and the payment it matched.
+    """
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    if 'file' not in request.files:
+        return jsonify({'success': False, 'error': 'No file provided'}), 400
+    
+    file = request.files['file']
+    if not file or file.filename == '':
+        return jsonify({'success': False, 'error': 'No file selected'}), 400
+    
+    truthy = ('1', 'true', 'yes', 'on')
+    apply = request.form.get('apply', '').lower() in truthy
+    include_probable = request.form.get('include_probable', '').lower() in truthy
+    window_days = request.form.get('date_window', reconciliation.DATE_WINDOW_DAYS, type=int)
+    
+    try:
+        lines = reconciliation.read_statement(file.stream, file.filename)
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Could not read statement: {str(e)}'}), 400
+    
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        
+        payments = reconciliation.load_payments(cursor, lines, window_days)
+        result = reconciliation.reconcile(lines, payments, window_days)
+        
+        completed = []
+        if apply:
+            days = rollups.payment_days(cursor, payment_ids=[int(pid) for pid in result['payment_id'].dropna()])
+            completed = reconciliation.complete_matched(cursor, result, payments, include_probable)
+            rollups.refresh_aging(cursor, [row['traveler_id'] for row in completed])
+            rollups.refresh_daily_payments(cursor, days)
+            conn.commit()
+        
+        return jsonify({
+            'success': True,
+            'statement_lines': len(result),
+            'summary': reconciliation.summarize(result),
+            'completed_payment_ids': [row['payment_id'] for row in completed],
+            'lines': [reconciliation.serialize_line(row) for row in result.to_dict('records')]
+        })
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        print(f"❌ Reconciliation error: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        if conn:
+            release_db(conn, cursor)
+
 @bp.route('/<int:payment_id>', methods=['PUT'])
 def update_payment(payment_id):
     """Update payment details"""
@@ -315,8 +952,9 @@ def update_payment(payment_id):
         conn, cursor = get_db()
 
         # Check if payment exists
-        cursor.execute('SELECT id FROM payments WHERE id = %s', (payment_id,))
-        if not cursor.fetchone():
+        cursor.execute('SELECT id, traveler_id FROM payments WHERE id = %s', (payment_id,))
+        payment = cursor.fetchone()
+        if not payment:
             return jsonify({'success': False, 'error': 'Payment not found'}), 404
 
         # Build update query dynamically
@@ -346,8 +984,11 @@ def update_payment(payment_id):
         params.append(datetime.now())
         params.append(payment_id)
 
+        days = rollups.payment_days(cursor, payment_ids=[payment_id])
         query = f"UPDATE payments SET {', '.join(update_fields)} WHERE id = %s"
         cursor.execute(query, params)
+        rollups.refresh_aging(cursor, [payment['traveler_id']])
+        rollups.refresh_daily_payments(cursor, days | rollups.payment_days(cursor, payment_ids=[payment_id]))
 
         conn.commit()
 
@@ -372,11 +1013,15 @@ def delete_payment(payment_id):
     try:
         conn, cursor = get_db()
 
-        cursor.execute('SELECT id FROM payments WHERE id = %s', (payment_id,))
-        if not cursor.fetchone():
+        cursor.execute('SELECT id, traveler_id FROM payments WHERE id = %s', (payment_id,))
+        payment = cursor.fetchone()
+        if not payment:
             return jsonify({'success': False, 'error': 'Payment not found'}), 404
 
+        days = rollups.payment_days(cursor, payment_ids=[payment_id])
         cursor.execute('DELETE FROM payments WHERE id = %s', (payment_id,))
+        rollups.refresh_aging(cursor, [payment['traveler_id']])
+        rollups.refresh_daily_payments(cursor, days)
         conn.commit()
 
         return jsonify({'success': True, 'message': 'Payment deleted successfully'})
@@ -390,6 +1035,7 @@ def delete_payment(payment_id):
             release_db(conn, cursor)
 
 @bp.route('/<int:payment_id>/reverse', methods=['POST'])
+@idempotent
 def reverse_payment(payment_id):
     """Reverse a payment"""
     if 'user_id' not in session:
@@ -403,7 +1049,7 @@ def reverse_payment(payment_id):
         conn, cursor = get_db()
 
         # Check if payment exists
-        cursor.execute('SELECT id, amount, status FROM payments WHERE id = %s', (payment_id,))
+        cursor.execute('SELECT id, traveler_id, amount, status FROM payments WHERE id = %s', (payment_id,))
         payment = cursor.fetchone()
         if not payment:
             return jsonify({'success': False, 'error': 'Payment not found'}), 404
@@ -424,6 +1070,8 @@ def reverse_payment(payment_id):
             datetime.now(),
             payment_id
         ))
+        rollups.refresh_aging(cursor, [payment['traveler_id']])
+        rollups.refresh_daily_payments(cursor, rollups.payment_days(cursor, payment_ids=[payment_id]))
 
         conn.commit()
 
@@ -452,27 +1100,27 @@ def get_payment_stats():
     try:
         conn, cursor = get_db()
 
-        # Overall statistics
+        # All figures come from the daily rollup, one row per day/batch/method/status
         cursor.execute('''
             SELECT
-                COUNT(*) as total_transactions,
-                COALESCE(SUM(CASE WHEN status = 'completed' THEN amount ELSE 0 END), 0) as total_collected,
-                COALESCE(SUM(CASE WHEN status = 'pending' THEN amount ELSE 0 END), 0) as total_pending,
-                COUNT(CASE WHEN status = 'completed' THEN 1 END) as completed_count,
-                COUNT(CASE WHEN status = 'pending' THEN 1 END) as pending_count,
-                COUNT(CASE WHEN status = 'reversed' THEN 1 END) as reversed_count
-            FROM payments
+                COALESCE(SUM(payment_count), 0) as total_transactions,
+                COALESCE(SUM(amount) FILTER (WHERE status = 'completed'), 0) as total_collected,
+                COALESCE(SUM(amount) FILTER (WHERE status = 'pending'), 0) as total_pending,
+                COALESCE(SUM(payment_count) FILTER (WHERE status = 'completed'), 0) as completed_count,
+                COALESCE(SUM(payment_count) FILTER (WHERE status = 'pending'), 0) as pending_count,
+                COALESCE(SUM(payment_count) FILTER (WHERE status = 'reversed'), 0) as reversed_count
+            FROM daily_payment_rollup
         ''')
         overall = cursor.fetchone()
 
         # Payment method breakdown
         cursor.execute('''
             SELECT
-                payment_method,
-                COUNT(*) as count,
+                NULLIF(payment_method, '') as payment_method,
+                SUM(payment_count) as count,
                 COALESCE(SUM(amount), 0) as total
-            FROM payments
-            WHERE status = 'completed'
+            FROM daily_payment_rollup
+            WHERE status = 'completed' AND payment_count > 0
             GROUP BY payment_method
             ORDER BY total DESC
         ''')
@@ -481,13 +1129,13 @@ def get_payment_stats():
         # Monthly summary (last 6 months)
         cursor.execute('''
             SELECT
-                TO_CHAR(payment_date, 'YYYY-MM') as month,
-                COUNT(*) as transactions,
+                TO_CHAR(day, 'YYYY-MM') as month,
+                SUM(payment_count) as transactions,
                 COALESCE(SUM(amount), 0) as total
-            FROM payments
-            WHERE status = 'completed'
-              AND payment_date >= CURRENT_DATE - INTERVAL '6 months'
-            GROUP BY TO_CHAR(payment_date, 'YYYY-MM')
+            FROM daily_payment_rollup
+            WHERE status = 'completed' AND payment_count > 0
+              AND day >= CURRENT_DATE - INTERVAL '6 months'
+            GROUP BY TO_CHAR(day, 'YYYY-MM')
             ORDER BY month DESC
         ''')
         monthly = cursor.fetchall()
@@ -495,10 +1143,11 @@ def get_payment_stats():
         # Status counts
         cursor.execute('''
             SELECT 
-                status, 
-                COUNT(*) as count,
+                NULLIF(status, '') as status, 
+                SUM(payment_count) as count,
                 COALESCE(SUM(amount), 0) as total_amount
-            FROM payments
+            FROM daily_payment_rollup
+            WHERE payment_count > 0
             GROUP BY status
         ''')
         status_counts = cursor.fetchall()
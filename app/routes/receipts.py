@@ -1,10 +1,49 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify, session, current_app, send_file
 from app.database import get_db, release_db
+from app.idempotency import idempotent
+from app import templating, receipt_print, rollups
+from werkzeug.utils import secure_filename
 from datetime import datetime
 import json
 
 bp = Blueprint('receipts', __name__, url_prefix='/api/receipts')
 
+# Receipt numbers come from a sequence: REC-<yyyymmdd>-<6 digit sequence>
+RECEIPT_NUMBER_SQL = "'REC-' || to_char(CURRENT_DATE, 'YYYYMMDD') || '-' || lpad(nextval('receipt_number_seq')::text, 6, '0')"
+
+# ============================================================
+# DATABASE MIGRATION - Add receipt print columns if missing
+# ============================================================
+def migrate_receipts_table():
+    """Make sure receipts carry the columns printed on them"""
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        cursor.execute("""
+            ALTER TABLE receipts
+                ADD COLUMN IF NOT EXISTS payment_method VARCHAR(50),
+                ADD COLUMN IF NOT EXISTS transaction_id VARCHAR(100),
+                ADD COLUMN IF NOT EXISTS installment_info TEXT,
+                ADD COLUMN IF NOT EXISTS remarks TEXT
+        """)
+        cursor.execute("CREATE SEQUENCE IF NOT EXISTS receipt_number_seq")
+        conn.commit()
+        print("✅ receipts table verified!")
+    except Exception as e:
+        print(f"⚠️ Migration error: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn:
+            release_db(conn, cursor)
+
+# Run migration on import
+try:
+    migrate_receipts_table()
+except Exception as e:
+    print(f"⚠️ Migration failed: {e}")
+
 @bp.route('', methods=['GET'])
 def get_receipts():
     """Get all receipts"""
@@ -51,6 +90,7 @@ def get_receipt(receipt_id):
             release_db(conn, cursor)
 
 @bp.route('', methods=['POST'])
+@idempotent
 def create_receipt():
     """Create new receipt"""
     if 'user_id' not in session:
@@ -63,23 +103,18 @@ def create_receipt():
         if not data.get(field):
             return jsonify({'success': False, 'error': f'{field} is required'}), 400
 
-    # Generate receipt number
-    timestamp = int(datetime.now().timestamp())
-    receipt_number = f"REC-{datetime.now().strftime('%Y%m%d')}-{timestamp}"
-
     conn = None
     cursor = None
     try:
         conn, cursor = get_db()
         
         # Based on actual schema: id, traveler_id, payment_id, receipt_number, amount, receipt_date, created_at
-        cursor.execute("""
+        cursor.execute(f"""
             INSERT INTO receipts (
                 receipt_number, traveler_id, payment_id, amount, receipt_date, created_at
-            ) VALUES (%s, %s, %s, %s, %s, %s)
-            RETURNING id
+            ) VALUES ({RECEIPT_NUMBER_SQL}, %s, %s, %s, %s, %s)
+            RETURNING id, receipt_number
         """, (
-            receipt_number,
             data['traveler_id'],
             data.get('payment_id'),
             data['amount'],
@@ -89,6 +124,8 @@ def create_receipt():
 
         result = cursor.fetchone()
         receipt_id = result['id'] if result else None
+        receipt_number = result['receipt_number'] if result else None
+        rollups.refresh_daily_payments(cursor, rollups.payment_days(cursor, receipt_ids=[receipt_id]))
         conn.commit()
 
         return jsonify({
@@ -162,58 +199,80 @@ def print_receipt(receipt_id):
     cursor = None
     try:
         conn, cursor = get_db()
-        cursor.execute("""
-            SELECT r.*, t.first_name, t.last_name, t.passport_no 
-            FROM receipts r
-            JOIN travelers t ON r.traveler_id = t.id
-            WHERE r.id = %s
-        """, (receipt_id,))
-        
-        receipt = cursor.fetchone()
-        
-        if not receipt:
+        receipts = receipt_print.load_receipts(cursor, receipt_id=receipt_id)
+        if not receipts:
             return jsonify({'success': False, 'error': 'Receipt not found'}), 404
         
-        # Generate HTML for printing
-        html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>Receipt {receipt['receipt_number']}</title>
-            <style>
-                body {{ font-family: Arial; padding: 20px; }}
-                .receipt {{ max-width: 800px; margin: 0 auto; }}
-                .header {{ text-align: center; margin-bottom: 30px; }}
-                .details {{ margin-bottom: 20px; }}
-                table {{ width: 100%; border-collapse: collapse; }}
-                th, td {{ padding: 10px; border: 1px solid #ddd; }}
-            </style>
-        </head>
-        <body>
-            <div class="receipt">
-                <div class="header">
-                    <h1>Payment Receipt</h1>
-                    <h3>Receipt #: {receipt['receipt_number']}</h3>
-                </div>
-                <div class="details">
-                    <p><strong>Traveler:</strong> {receipt['first_name']} {receipt['last_name']}</p>
-                    <p><strong>Passport:</strong> {receipt['passport_no']}</p>
-                    <p><strong>Date:</strong> {receipt['receipt_date']}</p>
-                    <p><strong>Amount:</strong> ₹{receipt['amount']}</p>
-                    <p><strong>Payment Method:</strong> {receipt['payment_method']}</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
+        company, _ = receipt_print.load_branding(cursor, current_app.config['UPLOAD_FOLDER'])
+        html = templating.render('receipts.html', title=f"Receipt {receipts[0]['receipt_number']}",
+                                 company=company, receipts=receipts, summary=None)
         
-        return html, 200, {'Content-Type': 'text/html'}
+        return html, 200, {'Content-Type': 'text/html; charset=utf-8'}
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
     finally:
         if conn:
             release_db(conn, cursor)
 
+@bp.route('/print', methods=['GET'])
+def print_receipts():
+    """
+    Print every receipt of a date range and/or batch as one document
+    
+    Query: start_date, end_date, batch_id (at least one) and format=html|pdf
+    """
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    batch_id = request.args.get('batch_id', type=int)
+    output_format = request.args.get('format', 'html').lower()
+    
+    if not (start_date or end_date or batch_id):
+        return jsonify({'success': False, 'error': 'start_date/end_date or batch_id required'}), 400
+    if output_format not in ('html', 'pdf'):
+        return jsonify({'success': False, 'error': 'format must be html or pdf'}), 400
+
+    upload_root = current_app.config['UPLOAD_FOLDER']
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        receipts = receipt_print.load_receipts(cursor, start_date=start_date, end_date=end_date, batch_id=batch_id)
+        company, settings_version = receipt_print.load_branding(cursor, upload_root)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        if conn:
+            release_db(conn, cursor)
+    
+    label_parts = []
+    if batch_id:
+        label_parts.append(f"batch {receipts[0]['batch_name'] if receipts else batch_id}")
+    if start_date or end_date:
+        label_parts.append(f"{start_date or '...'} to {end_date or '...'}")
+    label = ', '.join(label_parts)
+    
+    if output_format == 'html':
+        html = templating.render(
+            'receipts.html', title=f"Receipts - {label}", company=company, receipts=receipts,
+            summary={'total': sum(float(r['amount'] or 0) for r in receipts), 'label': label}
+        )
+        return html, 200, {'Content-Type': 'text/html; charset=utf-8'}
+    
+    # One cached file per filter; it is re-rendered when any receipt or the branding changes
+    name = secure_filename(f"receipts_b{batch_id or 'all'}_{start_date or 'start'}_{end_date or 'end'}")
+    try:
+        key, future = receipt_print.submit_receipts_pdf(upload_root, name, company, settings_version, receipts)
+        path = future.result(timeout=300)
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Failed to render receipts: {str(e)}'}), 500
+    
+    response = send_file(path, mimetype='application/pdf', as_attachment=True, download_name=f"{name}.pdf")
+    response.headers['ETag'] = f'"{key}"'
+    return response
+
 @bp.route('/<int:receipt_id>', methods=['DELETE'])
 def delete_receipt(receipt_id):
     """Delete receipt"""
@@ -224,7 +283,9 @@ def delete_receipt(receipt_id):
     cursor = None
     try:
         conn, cursor = get_db()
+        days = rollups.payment_days(cursor, receipt_ids=[receipt_id])
         cursor.execute('DELETE FROM receipts WHERE id = %s', (receipt_id,))
+        rollups.refresh_daily_payments(cursor, days)
         conn.commit()
         
         return jsonify({'success': True, 'message': 'Receipt deleted successfully'})
@@ -282,29 +343,23 @@ def get_receipt_stats():
     try:
         conn, cursor = get_db()
         
-        # Today's receipts
-        cursor.execute("""
-            SELECT COUNT(*) as count, COALESCE(SUM(amount), 0) as total
-            FROM receipts 
-            WHERE DATE(receipt_date) = CURRENT_DATE
-        """)
-        today = cursor.fetchone()
-        
-        # This month's receipts
-        cursor.execute("""
-            SELECT COUNT(*) as count, COALESCE(SUM(amount), 0) as total
-            FROM receipts 
-            WHERE EXTRACT(MONTH FROM receipt_date) = EXTRACT(MONTH FROM CURRENT_DATE)
-            AND EXTRACT(YEAR FROM receipt_date) = EXTRACT(YEAR FROM CURRENT_DATE)
-        """)
-        month = cursor.fetchone()
-        
-        # Total receipts
-        cursor.execute("""
-            SELECT COUNT(*) as count, COALESCE(SUM(amount), 0) as total
-            FROM receipts
-        """)
-        total = cursor.fetchone()
+        # Today, this month and all time from the daily rollup, in business days
+        cursor.execute(f"""
+            WITH today AS (SELECT {rollups.LOCAL_TODAY_SQL} AS day)
+            SELECT
+                COALESCE(SUM(r.receipt_count) FILTER (WHERE r.day = today.day), 0) as today_count,
+                COALESCE(SUM(r.receipt_amount) FILTER (WHERE r.day = today.day), 0) as today_total,
+                COALESCE(SUM(r.receipt_count) FILTER (WHERE r.day >= date_trunc('month', today.day)), 0) as month_count,
+                COALESCE(SUM(r.receipt_amount) FILTER (WHERE r.day >= date_trunc('month', today.day)), 0) as month_total,
+                COALESCE(SUM(r.receipt_count), 0) as total_count,
+                COALESCE(SUM(r.receipt_amount), 0) as total_total
+            FROM today
+            LEFT JOIN daily_payment_rollup r ON r.receipt_count > 0
+        """, {'tz': rollups.BUSINESS_TIMEZONE})
+        row = cursor.fetchone()
+        today = {'count': row['today_count'], 'total': row['today_total']}
+        month = {'count': row['month_count'], 'total': row['month_total']}
+        total = {'count': row['total_count'], 'total': row['total_total']}
         
         return jsonify({
             'success': True,
@@ -258,23 +258,24 @@ def generate_report():
             results = cursor.fetchall()
 
         elif report_type == 'financial':
+            # Monthly totals from the daily payment rollup
             query = """
                 SELECT 
-                    DATE_TRUNC('month', payment_date) as month,
-                    COUNT(*) as transaction_count,
+                    DATE_TRUNC('month', day) as month,
+                    SUM(payment_count) as transaction_count,
                     COALESCE(SUM(amount), 0) as total_amount,
-                    AVG(amount) as average_amount
-                FROM payments
-                WHERE status = 'completed'
+                    SUM(amount) / NULLIF(SUM(payment_count), 0) as average_amount
+                FROM daily_payment_rollup
+                WHERE status = 'completed' AND payment_count > 0
             """
             params = []
             if start_date:
-                query += ' AND DATE(payment_date) >= %s'
+                query += ' AND day >= %s'
                 params.append(start_date)
             if end_date:
-                query += ' AND DATE(payment_date) <= %s'
+                query += ' AND day <= %s'
                 params.append(end_date)
-            query += ' GROUP BY DATE_TRUNC(\'month\', payment_date) ORDER BY month DESC LIMIT 500'
+            query += ' GROUP BY DATE_TRUNC(\'month\', day) ORDER BY month DESC LIMIT 500'
             cursor.execute(query, params)
             results = cursor.fetchall()
 
@@ -1,5 +1,8 @@
 from flask import Blueprint, request, jsonify, session, send_file, current_app
 from app.database import get_db, release_db
+from app.idempotency import idempotent
+from app import images, storage, upload_stats, dossier, rollups, seats, rooms
+from app.routes.uploads import send_derivative, derivative_url
 from datetime import datetime
 import json
 import os
@@ -22,26 +25,38 @@ def get_upload_folder():
     """Get upload folder path from app config"""
     return os.path.join(current_app.config['UPLOAD_FOLDER'], 'travelers')
 
-def save_uploaded_file(file, traveler_id, doc_type):
-    """Save uploaded file and return filename"""
+def save_uploaded_file(file, traveler_id, doc_type, cursor=None):
+    """Save uploaded file under its content hash and return filename"""
     if not file or not file.filename or not allowed_file(file.filename):
         return None
     
     # Create traveler-specific directory
     upload_folder = get_upload_folder()
     traveler_dir = os.path.join(upload_folder, str(traveler_id))
-    os.makedirs(traveler_dir, exist_ok=True)
     
-    # Secure filename and generate unique name
+    # Identical re-uploads of a scan map to the same file
     original_filename = secure_filename(file.filename)
     ext = original_filename.rsplit('.', 1)[1].lower() if '.' in original_filename else ''
-    filename = f"{doc_type}_{uuid.uuid4().hex[:8]}.{ext}" if ext else f"{doc_type}_{uuid.uuid4().hex[:8]}"
-    filepath = os.path.join(traveler_dir, filename)
+    stored = storage.store_upload(file, traveler_dir, ext)
+    if cursor:
+        storage.register_blob(cursor, traveler_folder(traveler_id), stored['filename'], stored['size'])
+        if stored['created']:
+            upload_stats.record_added(cursor, traveler_folder(traveler_id), stored['filename'], stored['size'])
     
-    # Save file
-    file.save(filepath)
+    # Build thumbnails in the background
+    if stored['created']:
+        images.schedule_derivatives(current_app.config['UPLOAD_FOLDER'], stored['path'])
     
-    return filename
+    return stored['filename']
+
+def traveler_folder(traveler_id):
+    """Get the upload_blobs folder name of a traveler directory"""
+    return f"travelers/{traveler_id}"
+
+def track_document_references(cursor, traveler_id, documents):
+    """Point upload_blob_refs at the document files a traveler now uses"""
+    for doc_field, filename in documents.items():
+        storage.track_reference(cursor, 'travelers', doc_field, traveler_id, filename, traveler_folder(traveler_id))
 
 def log_activity(user_id, action, module, description, ip_address=None):
     """Log user activity with proper connection handling"""
@@ -252,6 +267,7 @@ def get_traveler_by_passport(passport_no):
             release_db(conn, cursor)
 
 @bp.route('', methods=['POST'])
+@idempotent
 def create_traveler():
     """Create new traveler with 36 fields (includes mailing_address, file_reference, expected_return_date)"""
     if 'user_id' not in session:
@@ -312,6 +328,16 @@ def create_traveler():
         if cursor.fetchone():
             return jsonify({'success': False, 'error': 'Passport number already exists'}), 400
         
+        # Refuse a full batch before any files are written; the seat itself is
+        # taken by the conditional update after the inserts
+        hold_id = data.get('hold_id')
+        if not hold_id:
+            inventory = seats.availability(cursor, batch_id)
+            if not inventory:
+                return jsonify({'success': False, 'error': 'Batch not found'}), 404
+            if inventory['available_seats'] < 1:
+                raise seats.SeatsUnavailable(batch_id, 1, 0)
+        
         # Insert traveler with 36 fields
         cursor.execute('''
             INSERT INTO travelers (
@@ -370,28 +396,37 @@ def create_traveler():
         document_fields = ['passport_scan', 'aadhaar_scan', 'pan_scan', 'vaccine_scan', 'photo']
         document_updates = []
         document_values = []
+        documents = {}
         
         for doc_field in document_fields:
             # Case 1: File upload
             if doc_field in files and files[doc_field]:
                 file = files[doc_field]
                 if file and file.filename:
-                    filename = save_uploaded_file(file, traveler_id, doc_field)
+                    filename = save_uploaded_file(file, traveler_id, doc_field, cursor)
                     if filename:
                         document_updates.append(f"{doc_field} = %s")
                         document_values.append(filename)
+                        documents[doc_field] = filename
             # Case 2: JSON data with document content
             elif doc_field in data and data[doc_field] is not None and data[doc_field]:
                 document_updates.append(f"{doc_field} = %s")
                 document_values.append(data[doc_field])
+                documents[doc_field] = data[doc_field]
         
         if document_updates:
             update_query = f"UPDATE travelers SET {', '.join(document_updates)} WHERE id = %s"
             document_values.append(traveler_id)
             cursor.execute(update_query, document_values)
+            track_document_references(cursor, traveler_id, documents)
         
-        # Update batch booked seats
-        cursor.execute('UPDATE batches SET booked_seats = booked_seats + 1 WHERE id = %s', (batch_id,))
+        # Book the seat, from the group's hold when one is given
+        if hold_id:
+            seats.consume_hold(cursor, int(hold_id), batch_id)
+        else:
+            seats.reserve(cursor, batch_id)
+        rooms.place_unassigned(cursor, batch_id)
+        rollups.refresh_daily_registrations(cursor, rollups.registration_days(cursor, [traveler_id]))
         
         # Log activity
         log_activity(session['user_id'], 'create', 'traveler', f'Created traveler: {data["first_name"]} {data["last_name"]}', request.remote_addr)
@@ -404,6 +439,14 @@ def create_traveler():
             'message': 'Traveler created successfully'
         })
         
+    except seats.SeatsUnavailable as e:
+        if conn:
+            conn.rollback()
+        return jsonify({'success': False, 'error': str(e), 'available_seats': e.available}), 409
+    except seats.HoldUnavailable as e:
+        if conn:
+            conn.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 409
     except Exception as e:
         if conn:
             conn.rollback()
@@ -469,22 +512,25 @@ def update_traveler(traveler_id):
         
         # Handle document fields
         document_fields = ['passport_scan', 'aadhaar_scan', 'pan_scan', 'vaccine_scan', 'photo']
+        documents = {}
         
         # Case 1: Document fields as file uploads
         for doc_field in document_fields:
             if doc_field in files and files[doc_field]:
                 file = files[doc_field]
                 if file and file.filename:
-                    filename = save_uploaded_file(file, traveler_id, doc_field)
+                    filename = save_uploaded_file(file, traveler_id, doc_field, cursor)
                     if filename:
                         update_fields.append(f"{doc_field} = %s")
                         values.append(filename)
+                        documents[doc_field] = filename
         
         # Case 2: Document fields as JSON data
         for doc_field in document_fields:
             if doc_field in data and data[doc_field] is not None and data[doc_field]:
                 update_fields.append(f"{doc_field} = %s")
                 values.append(data[doc_field])
+                documents[doc_field] = data[doc_field]
         
         # Add batch_id if changed
         if 'batch_id' in data and data['batch_id']:
@@ -504,11 +550,16 @@ def update_traveler(traveler_id):
             query = f"UPDATE travelers SET {', '.join(update_fields)} WHERE id = %s"
             values.append(traveler_id)
             cursor.execute(query, values)
+            track_document_references(cursor, traveler_id, documents)
         
         # Update batch seats if batch changed
         if old_batch_id != new_batch_id:
-            cursor.execute('UPDATE batches SET booked_seats = booked_seats - 1 WHERE id = %s', (old_batch_id,))
-            cursor.execute('UPDATE batches SET booked_seats = booked_seats + 1 WHERE id = %s', (new_batch_id,))
+            seats.move(cursor, old_batch_id, new_batch_id)
+            rooms.unassign(cursor, [traveler_id])
+            rooms.place_unassigned(cursor, new_batch_id)
+            # Receipts without a payment are counted under the traveler's batch
+            rollups.refresh_daily_payments(cursor, rollups.payment_days(cursor, traveler_ids=[traveler_id]))
+        rollups.refresh_daily_registrations(cursor, rollups.registration_days(cursor, [traveler_id]))
         
         # Log activity
         log_activity(session['user_id'], 'update', 'traveler', f'Updated traveler ID: {traveler_id}', request.remote_addr)
@@ -517,6 +568,14 @@ def update_traveler(traveler_id):
         
         return jsonify({'success': True, 'message': 'Traveler updated successfully'})
         
+    except seats.SeatsUnavailable as e:
+        if conn:
+            conn.rollback()
+        return jsonify({'success': False, 'error': str(e), 'available_seats': e.available}), 409
+    except LookupError as e:
+        if conn:
+            conn.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 404
     except Exception as e:
         if conn:
             conn.rollback()
@@ -547,13 +606,24 @@ def delete_traveler(traveler_id):
         traveler_dir = os.path.join(upload_folder, str(traveler_id))
         if os.path.exists(traveler_dir):
             import shutil
+            file_count, total_bytes = upload_stats.measure_tree(traveler_dir)
             shutil.rmtree(traveler_dir)
+            upload_stats.record_removed_tree(cursor, traveler_folder(traveler_id), file_count, total_bytes)
+        images.remove_derivatives_tree(current_app.config['UPLOAD_FOLDER'], traveler_dir)
+        
+        # Shared scans it pointed at become orphans once the refs are gone
+        storage.release_record_references(cursor, 'travelers', traveler_id)
+        storage.forget_folder(cursor, traveler_folder(traveler_id))
         
-        # Delete traveler record
+        # Delete traveler record (payments and receipts cascade)
+        payment_days = rollups.payment_days(cursor, traveler_ids=[traveler_id])
+        registration_days = rollups.registration_days(cursor, [traveler_id])
         cursor.execute('DELETE FROM travelers WHERE id = %s', (traveler_id,))
+        rollups.refresh_daily_payments(cursor, payment_days)
+        rollups.refresh_daily_registrations(cursor, registration_days)
         
-        # Update batch booked seats
-        cursor.execute('UPDATE batches SET booked_seats = booked_seats - 1 WHERE id = %s', (traveler['batch_id'],))
+        # Give the seat back
+        seats.release(cursor, traveler['batch_id'])
         
         # Log activity
         log_activity(session['user_id'], 'delete', 'traveler', f'Deleted traveler: {traveler["first_name"]} {traveler["last_name"]}', request.remote_addr)
@@ -719,10 +789,12 @@ def get_traveler_documents(traveler_id):
             filename = docs[key]
             if filename:
                 filepath = os.path.join(upload_folder, str(traveler_id), filename)
+                file_url = f'/api/travelers/{traveler_id}/documents/{key}'
                 result[key] = {
                     'uploaded': True,
                     'filename': filename,
-                    'url': f'/api/travelers/{traveler_id}/documents/{key}',
+                    'url': file_url,
+                    'thumb_url': derivative_url(file_url, filename),
                     'exists': os.path.exists(filepath),
                     'size': os.path.getsize(filepath) if os.path.exists(filepath) else 0
                 }
@@ -775,6 +847,11 @@ def download_document(traveler_id, doc_type):
         if not os.path.exists(filepath):
             return jsonify({'success': False, 'error': 'File not found on server'}), 404
         
+        # ?size=thumb|medium serves an inline preview instead of the original
+        preview = send_derivative(filepath)
+        if preview:
+            return preview
+        
         return send_file(filepath, as_attachment=True, download_name=filename)
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -782,6 +859,43 @@ def download_document(traveler_id, doc_type):
         if conn:
             release_db(conn, cursor)
 
+@bp.route('/<int:traveler_id>/dossier.pdf', methods=['GET'])
+def download_dossier(traveler_id):
+    """Download the printable dossier of a traveler (cached until its data changes)"""
+    if 'user_id' not in session and 'traveler_id' not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    # If traveler is accessing, ensure they can only access their own data
+    if 'traveler_id' in session and session['traveler_id'] != traveler_id:
+        return jsonify({'success': False, 'error': 'Access denied'}), 403
+    
+    upload_root = current_app.config['UPLOAD_FOLDER']
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        dossiers = dossier.load_dossiers(cursor, upload_root, [traveler_id])
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        if conn:
+            release_db(conn, cursor)
+    
+    if not dossiers:
+        return jsonify({'success': False, 'error': 'Traveler not found'}), 404
+    
+    _, key, payload = dossiers[0]
+    try:
+        path = dossier.submit_dossier(upload_root, traveler_id, key, payload).result(timeout=120)
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Failed to render dossier: {str(e)}'}), 500
+    
+    passport_no = secure_filename(payload['traveler'].get('passport_no') or '') or str(traveler_id)
+    response = send_file(path, mimetype='application/pdf', as_attachment=True,
+                         download_name=f"dossier_{passport_no}.pdf")
+    response.headers['ETag'] = f'"{key}"'
+    return response
+
 @bp.route('/summary', methods=['GET'])
 def get_travelers_summary():
     """Get summary statistics for all travelers"""
@@ -1009,30 +1123,31 @@ def get_monthly_stats():
     try:
         conn, cursor = get_db()
         
-        # Monthly registrations
+        # Monthly registrations (from the daily rollups, a range on the day key)
         cursor.execute('''
             SELECT 
-                TO_CHAR(created_at, 'MM') as month,
-                COUNT(*) as count
-            FROM travelers
-            WHERE EXTRACT(YEAR FROM created_at) = %s
-            GROUP BY TO_CHAR(created_at, 'MM')
+                TO_CHAR(day, 'MM') as month,
+                SUM(traveler_count) as count
+            FROM daily_registration_rollup
+            WHERE day >= make_date(%s, 1, 1) AND day < make_date(%s + 1, 1, 1)
+            GROUP BY TO_CHAR(day, 'MM')
             ORDER BY month
-        ''', (year,))
+        ''', (year, year))
         
         registrations = cursor.fetchall()
         
         # Monthly payments
         cursor.execute('''
             SELECT 
-                TO_CHAR(payment_date, 'MM') as month,
+                TO_CHAR(day, 'MM') as month,
                 COALESCE(SUM(amount), 0) as total,
-                COUNT(*) as count
-            FROM payments
-            WHERE EXTRACT(YEAR FROM payment_date) = %s AND status = 'completed'
-            GROUP BY TO_CHAR(payment_date, 'MM')
+                SUM(payment_count) as count
+            FROM daily_payment_rollup
+            WHERE day >= make_date(%s, 1, 1) AND day < make_date(%s + 1, 1, 1)
+              AND status = 'completed' AND payment_count > 0
+            GROUP BY TO_CHAR(day, 'MM')
             ORDER BY month
-        ''', (year,))
+        ''', (year, year))
         
         payments = cursor.fetchall()
         
@@ -1,12 +1,23 @@
 from flask import Blueprint, request, jsonify, session, current_app, send_file, abort
 import os
 import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from werkzeug.utils import secure_filename
 from app.database import release_db, get_db
+from app import images, storage, orphans, jobs, upload_stats
 
 bp = Blueprint('uploads', __name__, url_prefix='/api/uploads')
 
+# Run migration on import
+try:
+    storage.migrate_storage_tables()
+    orphans.migrate_orphan_tables()
+    upload_stats.migrate_upload_stats_table()
+except Exception as e:
+    print(f"⚠️ Migration failed: {e}")
+
 # Allowed file extensions for different document types
 ALLOWED_EXTENSIONS = {
     'passport': {'png', 'jpg', 'jpeg', 'pdf'},
@@ -76,6 +87,27 @@ def get_upload_subfolder(doc_type):
     }
     return folders.get(doc_type, 'documents')
 
+def send_derivative(file_path):
+    """Send the ?size=thumb|medium derivative of an upload if one is ready, else None"""
+    size = request.args.get('size')
+    if not size:
+        return None
+    
+    accept_webp = 'image/webp' in request.headers.get('Accept', '')
+    derivative = images.find_derivative(current_app.config['UPLOAD_FOLDER'], file_path, size, accept_webp)
+    if not derivative:
+        return None
+    
+    response = send_file(derivative[0], mimetype=derivative[1])
+    response.headers['Vary'] = 'Accept'
+    return response
+
+def derivative_url(url, filename):
+    """Get the thumbnail URL for an upload URL (None for non-images)"""
+    if not url or not images.is_image(filename):
+        return None
+    return f'{url}?size=thumb'
+
 # ==================== FILE UPLOAD ROUTES ====================
 
 @bp.route('', methods=['POST'])
@@ -97,49 +129,54 @@ def upload_file():
     if not file or file.filename == '':
         return jsonify({'success': False, 'error': 'No file selected'}), 400
     
-    # Check file type
-    if not allowed_file(file.filename, doc_type):
-        allowed_exts = ", ".join(ALLOWED_EXTENSIONS.get(doc_type, ALLOWED_EXTENSIONS['document']))
-        return jsonify({
-            'success': False, 
-            'error': f'File type not allowed for {doc_type}. Allowed: {allowed_exts}'
-        }), 400
-    
-    # Check file size
+    # Check file type and size
     file.seek(0, os.SEEK_END)
     file_size = file.tell()
     file.seek(0)
     
-    max_size = MAX_FILE_SIZES.get(doc_type, 5) * 1024 * 1024  # Convert MB to bytes
-    if file_size > max_size:
-        max_size_mb = MAX_FILE_SIZES.get(doc_type, 5)
-        return jsonify({
-            'success': False,
-            'error': f'File too large. Maximum size for {doc_type} is {max_size_mb}MB'
-        }), 400
+    error = check_upload(file.filename, doc_type, file_size)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
     
-    # Generate unique filename
     original_filename = secure_filename(file.filename)
     ext = original_filename.rsplit('.', 1)[1].lower() if '.' in original_filename else ''
     
-    # Create organized filename
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    if traveler_id:
-        new_filename = f"{doc_type}_{traveler_id}_{timestamp}_{uuid.uuid4().hex[:8]}.{ext}"
-    else:
-        new_filename = f"{doc_type}_{timestamp}_{uuid.uuid4().hex}.{ext}"
+    # Save file under its content hash - identical scans are stored once
+    try:
+        stored = storage.store_upload(file, get_upload_folder(doc_type), ext)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'Failed to save file: {str(e)}'
+        }), 500
+    
+    return finish_upload(stored, doc_type, traveler_id, original_filename)
+
+def check_upload(filename, doc_type, file_size):
+    """Validate file type and size for a document type, returns an error message or None"""
+    if not allowed_file(filename, doc_type):
+        allowed_exts = ", ".join(ALLOWED_EXTENSIONS.get(doc_type, ALLOWED_EXTENSIONS['document']))
+        return f'File type not allowed for {doc_type}. Allowed: {allowed_exts}'
+    
+    max_size = MAX_FILE_SIZES.get(doc_type, 5) * 1024 * 1024  # Convert MB to bytes
+    if file_size > max_size:
+        max_size_mb = MAX_FILE_SIZES.get(doc_type, 5)
+        return f'File too large. Maximum size for {doc_type} is {max_size_mb}MB'
+    
+    return None
+
+def finish_upload(stored, doc_type, traveler_id, original_filename):
+    """Register a stored file, attach it to the traveler and build the upload response"""
+    subfolder = get_upload_subfolder(doc_type)
+    new_filename = stored['filename']
+    file_path = stored['path']
+    file_size = stored['size']
     
-    # Save file in appropriate folder
     try:
-        upload_folder = get_upload_folder(doc_type)
-        file_path = os.path.join(upload_folder, new_filename)
-        file.save(file_path)
-        
-        # Verify file was saved
-        if not os.path.exists(file_path):
-            raise Exception("File was not saved properly")
-            
+        register_stored_file(subfolder, stored)
     except Exception as e:
+        if stored['created']:
+            os.remove(file_path)
         return jsonify({
             'success': False,
             'error': f'Failed to save file: {str(e)}'
@@ -150,16 +187,18 @@ def upload_file():
         try:
             update_traveler_document(traveler_id, doc_type, new_filename)
         except Exception as e:
-            # If database update fails, delete the uploaded file
-            try:
-                os.remove(file_path)
-            except:
-                pass
+            # If database update fails, delete the uploaded file (unless it was already stored)
+            if stored['created']:
+                remove_stored_file(subfolder, file_path)
             return jsonify({
                 'success': False,
                 'error': f'Failed to update traveler record: {str(e)}'
             }), 500
     
+    # Build thumbnails/previews off the request thread
+    if stored['created']:
+        images.schedule_derivatives(current_app.config['UPLOAD_FOLDER'], file_path)
+    
     # Log activity for admin users
     if 'user_id' in session:
         log_activity(
@@ -171,7 +210,6 @@ def upload_file():
         )
     
     # Generate URL for accessing the file
-    subfolder = get_upload_subfolder(doc_type)
     file_url = f'/uploads/{subfolder}/{new_filename}'
     
     return jsonify({
@@ -179,9 +217,12 @@ def upload_file():
         'filename': new_filename,
         'original_name': original_filename,
         'url': file_url,
+        'thumb_url': derivative_url(file_url, new_filename),
         'doc_type': doc_type,
         'file_size': file_size,
         'file_size_mb': round(file_size / (1024 * 1024), 2),
+        'sha256': stored['sha256'],
+        'deduplicated': not stored['created'],
         'message': f'{doc_type.capitalize()} uploaded successfully'
     })
 
@@ -201,44 +242,57 @@ def upload_multiple_files():
     if not files:
         return jsonify({'success': False, 'error': 'No files provided'}), 400
     
-    uploaded_files = []
+    folder_path = get_upload_folder(doc_type)
+    subfolder = get_upload_subfolder(doc_type)
+    
+    # Validate and save every file concurrently; results keep request order
+    executor = get_upload_executor()
+    futures = [
+        (file.filename, executor.submit(validate_and_store, file, doc_type, folder_path))
+        for file in files if file and file.filename
+    ]
+    
+    stored_files = []
     errors = []
+    for filename, future in futures:
+        try:
+            stored_files.append(future.result())
+        except Exception as e:
+            errors.append(f"{filename}: {str(e)}")
     
-    for file in files:
-        if not file or file.filename == '':
-            continue
-        
+    # Record all new blobs in one transaction
+    if stored_files:
+        conn = None
+        cursor = None
         try:
-            # Check file type
-            if not allowed_file(file.filename, doc_type):
-                errors.append(f"{file.filename}: File type not allowed")
-                continue
-            
-            # Generate filename
-            original_filename = secure_filename(file.filename)
-            ext = original_filename.rsplit('.', 1)[1].lower() if '.' in original_filename else ''
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            
-            if traveler_id:
-                new_filename = f"{doc_type}_{traveler_id}_{timestamp}_{uuid.uuid4().hex[:8]}.{ext}"
-            else:
-                new_filename = f"{doc_type}_{timestamp}_{uuid.uuid4().hex}.{ext}"
-            
-            # Save file
-            upload_folder = get_upload_folder(doc_type)
-            file_path = os.path.join(upload_folder, new_filename)
-            file.save(file_path)
-            
-            subfolder = get_upload_subfolder(doc_type)
-            uploaded_files.append({
-                'filename': new_filename,
-                'original_name': original_filename,
-                'url': f'/uploads/{subfolder}/{new_filename}',
-                'size': os.path.getsize(file_path)
-            })
-            
+            conn, cursor = get_db()
+            for stored in stored_files:
+                storage.register_blob(cursor, subfolder, stored['filename'], stored['size'])
+                if stored['created']:
+                    upload_stats.record_added(cursor, subfolder, stored['filename'], stored['size'])
+            conn.commit()
         except Exception as e:
-            errors.append(f"{file.filename}: {str(e)}")
+            if conn:
+                conn.rollback()
+            print(f"⚠️ Could not register uploaded files: {e}")
+        finally:
+            release_db(conn, cursor)
+    
+    uploaded_files = []
+    for stored in stored_files:
+        if stored['created']:
+            images.schedule_derivatives(current_app.config['UPLOAD_FOLDER'], stored['path'])
+        
+        file_url = f'/uploads/{subfolder}/{stored["filename"]}'
+        uploaded_files.append({
+            'filename': stored['filename'],
+            'original_name': stored['original_name'],
+            'url': file_url,
+            'thumb_url': derivative_url(file_url, stored['filename']),
+            'size': stored['size'],
+            'sha256': stored['sha256'],
+            'deduplicated': not stored['created']
+        })
     
     return jsonify({
         'success': len(uploaded_files) > 0,
@@ -249,6 +303,411 @@ def upload_multiple_files():
         'message': f'Successfully uploaded {len(uploaded_files)} files'
     })
 
+_upload_executor = None
+_upload_executor_lock = threading.Lock()
+
+def get_upload_executor():
+    """Get the bounded pool that validates and saves multi-file uploads"""
+    global _upload_executor
+    with _upload_executor_lock:
+        if _upload_executor is None:
+            workers = int(os.getenv('UPLOAD_WORKERS', '4'))
+            _upload_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='uploads')
+        return _upload_executor
+
+def validate_and_store(file, doc_type, folder_path):
+    """
+    Validate one uploaded file against its real bytes and store it
+    
+    Checks extension and size limits, sniffs the leading bytes so the content
+    matches the extension, and fully decodes images with Pillow before the
+    file is written. Raises ValueError with a user-facing message.
+    """
+    file.stream.seek(0, os.SEEK_END)
+    file_size = file.stream.tell()
+    file.stream.seek(0)
+    
+    error = check_upload(file.filename, doc_type, file_size)
+    if error:
+        raise ValueError(error)
+    
+    original_filename = secure_filename(file.filename)
+    ext = original_filename.rsplit('.', 1)[1].lower() if '.' in original_filename else ''
+    
+    head = file.stream.read(64)
+    file.stream.seek(0)
+    if not storage.content_matches_extension(head, ext):
+        raise ValueError(f'File content does not match .{ext} extension')
+    
+    if images.is_image(original_filename):
+        images.verify_image(file.stream)
+    
+    stored = storage.store_upload(file, folder_path, ext)
+    stored['original_name'] = original_filename
+    return stored
+
+# ==================== RESUMABLE UPLOAD SESSIONS ====================
+# Large scans can be sent in chunks: create a session, PUT each chunk at the
+# current offset (resume with GET after a dropped connection), then complete
+# with the SHA-256 of the whole file. Chunks are appended to a temp file under
+# uploads/tmp/sessions and the result goes through the same validation and
+# traveler update as a single-request upload.
+
+SESSION_TTL_HOURS = 24
+SESSION_CHUNK_SIZE = 4 * 1024 * 1024  # Recommended chunk size for clients
+
+def migrate_upload_sessions_table():
+    """Create upload_sessions table if it doesn't exist"""
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS upload_sessions (
+                id VARCHAR(32) PRIMARY KEY,
+                owner VARCHAR(50) NOT NULL,
+                doc_type VARCHAR(20) NOT NULL,
+                traveler_id INTEGER,
+                original_filename TEXT NOT NULL,
+                total_size BIGINT NOT NULL,
+                received_size BIGINT DEFAULT 0,
+                sha256 CHAR(64),
+                status VARCHAR(20) DEFAULT 'open',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.commit()
+        print("✅ upload_sessions table verified!")
+    except Exception as e:
+        print(f"⚠️ Migration error: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn:
+            release_db(conn, cursor)
+
+# Run migration on import
+try:
+    migrate_upload_sessions_table()
+except Exception as e:
+    print(f"⚠️ Migration failed: {e}")
+
+def get_session_folder():
+    """Get the temp folder holding partial chunked uploads"""
+    folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'tmp', 'sessions')
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+def get_session_path(session_id):
+    """Get the temp file path of an upload session"""
+    return os.path.join(get_session_folder(), f"{session_id}.part")
+
+def get_session_owner():
+    """Identify the logged-in staff user or traveler owning upload sessions"""
+    if 'user_id' in session:
+        return f"user:{session['user_id']}"
+    if 'traveler_id' in session:
+        return f"traveler:{session['traveler_id']}"
+    return None
+
+def session_response(upload):
+    """Build the JSON state of an upload session"""
+    return {
+        'session_id': upload['id'],
+        'doc_type': upload['doc_type'],
+        'traveler_id': upload['traveler_id'],
+        'filename': upload['original_filename'],
+        'total_size': upload['total_size'],
+        'offset': upload['received_size'],
+        'complete': upload['received_size'] >= upload['total_size'],
+        'status': upload['status'],
+        'chunk_size': SESSION_CHUNK_SIZE
+    }
+
+def expire_upload_sessions(cursor):
+    """Drop sessions idle for longer than SESSION_TTL_HOURS and their temp files"""
+    cursor.execute("""
+        DELETE FROM upload_sessions
+        WHERE updated_at < CURRENT_TIMESTAMP - make_interval(hours => %s)
+        RETURNING id
+    """, (SESSION_TTL_HOURS,))
+    for row in cursor.fetchall():
+        try:
+            os.remove(get_session_path(row['id']))
+        except FileNotFoundError:
+            pass
+
+def fetch_upload_session(cursor, session_id, for_update=False, include_complete=False):
+    """Load an open (or, with include_complete, completed) session owned by the caller, None if missing"""
+    query = "SELECT * FROM upload_sessions WHERE id = %s AND owner = %s AND status = ANY(%s)"
+    if for_update:
+        query += " FOR UPDATE"
+    statuses = ['open', 'complete'] if include_complete else ['open']
+    cursor.execute(query, (session_id, get_session_owner(), statuses))
+    return cursor.fetchone()
+
+@bp.route('/sessions', methods=['POST'])
+def create_upload_session():
+    """Start a resumable upload"""
+    owner = get_session_owner()
+    if not owner:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    data = request.json or {}
+    doc_type = data.get('doc_type', 'document')
+    traveler_id = data.get('traveler_id')
+    original_filename = secure_filename(data.get('filename') or '')
+    sha256 = (data.get('sha256') or '').lower() or None
+    
+    try:
+        total_size = int(data.get('total_size', 0))
+    except (TypeError, ValueError):
+        total_size = 0
+    
+    if not original_filename:
+        return jsonify({'success': False, 'error': 'filename is required'}), 400
+    if total_size <= 0:
+        return jsonify({'success': False, 'error': 'total_size is required'}), 400
+    if sha256 and not storage.SHA256_RE.match(sha256):
+        return jsonify({'success': False, 'error': 'sha256 must be a hex digest'}), 400
+    
+    # Reject early instead of after the last chunk
+    error = check_upload(original_filename, doc_type, total_size)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        expire_upload_sessions(cursor)
+        
+        session_id = uuid.uuid4().hex
+        open(get_session_path(session_id), 'wb').close()
+        
+        cursor.execute("""
+            INSERT INTO upload_sessions
+                (id, owner, doc_type, traveler_id, original_filename, total_size, sha256, created_at, updated_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            RETURNING *
+        """, (session_id, owner, doc_type, traveler_id or None, original_filename,
+              total_size, sha256, datetime.now(), datetime.now()))
+        upload = cursor.fetchone()
+        conn.commit()
+        
+        return jsonify({'success': True, **session_response(upload)}), 201
+        
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        release_db(conn, cursor)
+
+@bp.route('/sessions/<session_id>', methods=['GET'])
+def get_upload_session(session_id):
+    """Get the current offset of a resumable upload"""
+    if not get_session_owner():
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        upload = fetch_upload_session(cursor, session_id)
+        if not upload:
+            return jsonify({'success': False, 'error': 'Upload session not found'}), 404
+        
+        response = jsonify({'success': True, **session_response(upload)})
+        response.headers['Upload-Offset'] = str(upload['received_size'])
+        return response
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        release_db(conn, cursor)
+
+@bp.route('/sessions/<session_id>', methods=['PUT'])
+def upload_session_chunk(session_id):
+    """
+    Append a chunk to a resumable upload
+    
+    The raw request body is the chunk; its position is given by the
+    Upload-Offset header (or ?offset=) and must equal the bytes received so
+    far. A mismatch returns 409 with the offset to resume from.
+    """
+    if not get_session_owner():
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    offset = request.headers.get('Upload-Offset', request.args.get('offset'))
+    try:
+        offset = int(offset)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'Upload-Offset header is required'}), 400
+    
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        
+        # Row lock serialises chunks for one session across workers
+        upload = fetch_upload_session(cursor, session_id, for_update=True)
+        if not upload:
+            return jsonify({'success': False, 'error': 'Upload session not found'}), 404
+        
+        if offset != upload['received_size']:
+            conn.rollback()
+            return jsonify({
+                'success': False,
+                'error': 'Offset mismatch',
+                'offset': upload['received_size']
+            }), 409
+        
+        # Stream the body to disk - a chunk is never held in memory
+        written = 0
+        remaining = upload['total_size'] - offset
+        with open(get_session_path(session_id), 'r+b') as out:
+            out.seek(offset)
+            while True:
+                chunk = request.stream.read(storage.CHUNK_SIZE)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > remaining:
+                    break
+                out.write(chunk)
+            # Discard bytes left behind by an interrupted earlier attempt, or
+            # everything from a rejected chunk so the file ends at the offset
+            out.truncate(offset if written > remaining else offset + written)
+        
+        if written > remaining:
+            conn.rollback()
+            return jsonify({
+                'success': False,
+                'error': 'Chunk exceeds declared total_size',
+                'offset': upload['received_size']
+            }), 400
+        
+        cursor.execute("""
+            UPDATE upload_sessions SET received_size = %s, updated_at = %s
+            WHERE id = %s
+            RETURNING *
+        """, (offset + written, datetime.now(), session_id))
+        upload = cursor.fetchone()
+        conn.commit()
+        
+        response = jsonify({'success': True, **session_response(upload)})
+        response.headers['Upload-Offset'] = str(upload['received_size'])
+        return response
+        
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        release_db(conn, cursor)
+
+@bp.route('/sessions/<session_id>/complete', methods=['POST'])
+def complete_upload_session(session_id):
+    """Verify the checksum of a fully received upload and store it"""
+    if not get_session_owner():
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    data = request.json or {}
+    
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        upload = fetch_upload_session(cursor, session_id, for_update=True, include_complete=True)
+        if not upload:
+            return jsonify({'success': False, 'error': 'Upload session not found'}), 404
+        
+        if upload['status'] == 'complete':
+            conn.rollback()
+            return jsonify({'success': False, 'error': 'Upload already completed'}), 409
+        
+        if upload['received_size'] != upload['total_size']:
+            conn.rollback()
+            return jsonify({
+                'success': False,
+                'error': 'Upload incomplete',
+                'offset': upload['received_size']
+            }), 409
+        
+        expected = (data.get('sha256') or upload['sha256'] or '').lower()
+        if not expected:
+            conn.rollback()
+            return jsonify({'success': False, 'error': 'sha256 is required'}), 400
+        
+        doc_type = upload['doc_type']
+        original_filename = upload['original_filename']
+        ext = original_filename.rsplit('.', 1)[1].lower() if '.' in original_filename else ''
+        
+        # Same content sniffing as validate_and_store
+        tmp_path = get_session_path(session_id)
+        with open(tmp_path, 'rb') as received:
+            head = received.read(64)
+        if not storage.content_matches_extension(head, ext):
+            conn.rollback()
+            return jsonify({'success': False, 'error': f'File content does not match .{ext} extension'}), 400
+        
+        digest = storage.hash_file(tmp_path)
+        if digest != expected:
+            conn.rollback()
+            return jsonify({
+                'success': False,
+                'error': 'Checksum mismatch - restart the upload',
+                'sha256': digest
+            }), 422
+        
+        stored = storage.finalize_stored_file(tmp_path, get_upload_folder(doc_type), digest, upload['total_size'], ext)
+        
+        cursor.execute("UPDATE upload_sessions SET status = 'complete', updated_at = %s WHERE id = %s",
+                       (datetime.now(), session_id))
+        conn.commit()
+        
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        release_db(conn, cursor)
+    
+    return finish_upload(stored, doc_type, upload['traveler_id'], original_filename)
+
+@bp.route('/sessions/<session_id>', methods=['DELETE'])
+def abort_upload_session(session_id):
+    """Abort a resumable upload and discard its chunks"""
+    if not get_session_owner():
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        upload = fetch_upload_session(cursor, session_id, for_update=True)
+        if not upload:
+            return jsonify({'success': False, 'error': 'Upload session not found'}), 404
+        
+        cursor.execute("DELETE FROM upload_sessions WHERE id = %s", (session_id,))
+        conn.commit()
+        
+        try:
+            os.remove(get_session_path(session_id))
+        except FileNotFoundError:
+            pass
+        
+        return jsonify({'success': True, 'message': 'Upload session aborted'})
+        
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        release_db(conn, cursor)
+
 # ==================== FILE SERVING ROUTES ====================
 
 @bp.route('/files/<path:filename>')
@@ -275,7 +734,7 @@ def serve_file(filename):
         if os.path.exists(file_path) and os.path.isfile(file_path):
             print(f"✅ Found file in {subdir}: {file_path}")
             try:
-                return send_file(file_path)
+                return send_derivative(file_path) or send_file(file_path)
             except Exception as e:
                 print(f"❌ Error sending file: {e}")
                 abort(500)
@@ -306,7 +765,7 @@ def serve_file_with_subdir(subdir, filename):
     if os.path.exists(file_path) and os.path.isfile(file_path):
         print(f"✅ Found file: {file_path}")
         try:
-            return send_file(file_path)
+            return send_derivative(file_path) or send_file(file_path)
         except Exception as e:
             print(f"❌ Error sending file: {e}")
             abort(500)
@@ -362,13 +821,17 @@ def delete_file(filename):
         # Get file info before deleting
         file_size = os.path.getsize(file_path)
         
-        # Delete the file
-        os.remove(file_path)
-        
-        # If this is for a traveler, clear the document field
+        # If this is for a traveler, clear the document field first so the
+        # reference count below no longer includes it
         if traveler_id and doc_type in ['passport', 'aadhaar', 'pan', 'vaccine', 'photo']:
             clear_traveler_document(traveler_id, doc_type)
         
+        # Content-addressed files can be shared - only remove the last copy
+        subfolder = get_upload_subfolder(doc_type)
+        remaining = stored_file_references(subfolder, os.path.basename(file_path))
+        if remaining == 0:
+            remove_stored_file(subfolder, file_path)
+        
         # Log activity
         log_activity(
             session['user_id'],
@@ -380,9 +843,10 @@ def delete_file(filename):
         
         return jsonify({
             'success': True,
-            'message': 'File deleted successfully',
+            'message': 'File deleted successfully' if remaining == 0 else 'File reference removed (file still in use)',
             'filename': filename,
-            'file_size': file_size
+            'file_size': file_size,
+            'remaining_references': remaining
         })
         
     except Exception as e:
@@ -427,9 +891,11 @@ def get_traveler_documents(traveler_id):
                 file_path = os.path.join(get_upload_folder(doc_type), filename)
                 file_exists = os.path.exists(file_path)
                 
+                file_url = f'/uploads/{subfolder}/{filename}' if file_exists else None
                 documents[db_field] = {
                     'filename': filename,
-                    'url': f'/uploads/{subfolder}/{filename}' if file_exists else None,
+                    'url': file_url,
+                    'thumb_url': derivative_url(file_url, filename),
                     'uploaded': True,
                     'exists_on_disk': file_exists,
                     'size': os.path.getsize(file_path) if file_exists else 0
@@ -519,6 +985,8 @@ def update_traveler_document(traveler_id, doc_type, filename):
             ''', (filename, datetime.now(), traveler_id))
             
             result = cursor.fetchone()
+            if result:
+                storage.track_reference(cursor, 'travelers', field, traveler_id, filename, get_upload_subfolder(doc_type))
             conn.commit()
             
             if not result:
@@ -562,6 +1030,7 @@ def clear_traveler_document(traveler_id, doc_type):
             ''', (datetime.now(), traveler_id))
             
             result = cursor.fetchone()
+            storage.release_reference(cursor, 'travelers', field, traveler_id)
             conn.commit()
             
             if not result:
@@ -580,6 +1049,90 @@ def clear_traveler_document(traveler_id, doc_type):
         if conn:
             conn.close()
 
+def register_stored_file(subfolder, stored):
+    """Record a content-addressed upload in upload_blobs"""
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        storage.register_blob(cursor, subfolder, stored['filename'], stored['size'])
+        if stored['created']:
+            upload_stats.record_added(cursor, subfolder, stored['filename'], stored['size'])
+        conn.commit()
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        raise e
+    finally:
+        if conn:
+            release_db(conn, cursor)
+
+def stored_file_references(subfolder, filename):
+    """Count the records still pointing at a stored file"""
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        return storage.reference_count(cursor, subfolder, filename)
+    finally:
+        if conn:
+            release_db(conn, cursor)
+
+def remove_stored_file(subfolder, file_path):
+    """Delete a stored file, its thumbnails, its blob row and its stats entry"""
+    removed_size = None
+    if os.path.exists(file_path):
+        removed_size = os.path.getsize(file_path)
+        os.remove(file_path)
+    images.remove_derivatives(current_app.config['UPLOAD_FOLDER'], file_path)
+    
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        storage.forget_blob(cursor, subfolder, os.path.basename(file_path))
+        if removed_size is not None:
+            upload_stats.record_removed(cursor, subfolder, os.path.basename(file_path), removed_size)
+        conn.commit()
+    except Exception as e:
+        print(f"⚠️ Could not forget blob {file_path}: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn:
+            release_db(conn, cursor)
+
+def remove_orphan_blob(base_folder, blob_id, grace_minutes):
+    """
+    Delete an orphaned blob's file if it is still unreferenced
+
+    The listing is read in an earlier transaction, so each blob is claimed
+    again (see storage.claim_orphan_blob) and the file is only unlinked
+    while that claim is held.
+
+    Returns:
+        dict: the removed blob, None when it was referenced or re-uploaded meanwhile
+    """
+    conn, cursor = get_db()
+    try:
+        blob = storage.claim_orphan_blob(cursor, blob_id, grace_minutes)
+        if not blob:
+            conn.rollback()
+            return None
+        file_path = os.path.join(base_folder, blob['folder'], blob['filename'])
+        if os.path.exists(file_path):
+            size = os.path.getsize(file_path)
+            os.remove(file_path)
+            upload_stats.record_removed(cursor, blob['folder'], blob['filename'], size)
+        images.remove_derivatives(base_folder, file_path)
+        conn.commit()
+        return blob
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        release_db(conn, cursor)
+
 def log_activity(user_id, action, module, description, ip_address=None):
     """Log user activity"""
     conn = None
@@ -604,137 +1157,204 @@ def log_activity(user_id, action, module, description, ip_address=None):
 
 @bp.route('/cleanup', methods=['POST'])
 def cleanup_orphaned_files():
-    """Clean up orphaned files (admin only)"""
+    """Start a background scan for orphaned files (admin only)"""
     if 'user_id' not in session:
         return jsonify({'success': False, 'error': 'Unauthorized'}), 401
     
+    data = request.get_json(silent=True) or {}
+    grace_minutes = int(data.get('grace_minutes', 60))
+    
+    try:
+        scan_id, started = orphans.start_scan(current_app.config['UPLOAD_FOLDER'], session['user_id'], grace_minutes)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    
+    if started:
+        log_activity(
+            session['user_id'],
+            'cleanup_check',
+            'uploads',
+            f'Started orphaned file scan #{scan_id}',
+            request.remote_addr
+        )
+    
+    return jsonify({
+        'success': True,
+        'scan_id': scan_id,
+        'started': started,
+        'status_url': f'/api/uploads/cleanup/{scan_id}',
+        'message': 'Scan started' if started else 'A scan is already running'
+    }), 202
+
+@bp.route('/cleanup/latest', methods=['GET'])
+@bp.route('/cleanup/<int:scan_id>', methods=['GET'])
+def get_cleanup_scan(scan_id=None):
+    """Get progress and results of an orphaned file scan (admin only)"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    offset = request.args.get('offset', 0, type=int)
+    
     conn = None
     cursor = None
     try:
         conn, cursor = get_db()
+        scan = orphans.get_scan(cursor, scan_id)
+        if not scan:
+            return jsonify({'success': False, 'error': 'Scan not found'}), 404
         
-        # Get all referenced files from database
-        cursor.execute('''
-            SELECT passport_scan FROM travelers WHERE passport_scan IS NOT NULL
-            UNION ALL
-            SELECT aadhaar_scan FROM travelers WHERE aadhaar_scan IS NOT NULL
-            UNION ALL
-            SELECT pan_scan FROM travelers WHERE pan_scan IS NOT NULL
-            UNION ALL
-            SELECT vaccine_scan FROM travelers WHERE vaccine_scan IS NOT NULL
-            UNION ALL
-            SELECT photo FROM travelers WHERE photo IS NOT NULL
-        ''')
-        
-        rows = cursor.fetchall()
-        referenced_files = set()
-        for row in rows:
-            for value in row:
-                if value:
-                    referenced_files.add(value)
+        for key in ['started_at', 'updated_at', 'finished_at']:
+            if scan.get(key):
+                scan[key] = scan[key].isoformat()
+        
+        result = {'success': True, 'scan': scan}
+        if scan['status'] == 'complete':
+            by_folder, files = orphans.get_scan_files(cursor, scan['id'], limit, offset)
+            for file in files:
+                if file.get('modified_at'):
+                    file['modified_at'] = file['modified_at'].isoformat()
+            total_size = sum(int(row['size_bytes']) for row in by_folder)
+            result.update({
+                'orphaned_count': sum(row['count'] for row in by_folder),
+                'orphaned_by_folder': {row['folder']: row['count'] for row in by_folder},
+                'orphaned_files': files,
+                'total_size_bytes': total_size,
+                'total_size_mb': round(total_size / (1024 * 1024), 2),
+                'message': 'Use POST /cleanup/delete with this scan_id to remove them.'
+            })
+        
+        return jsonify(result)
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
     finally:
         release_db(conn, cursor)
+
+@bp.route('/cleanup/delete', methods=['POST'])
+def delete_orphaned_files():
+    """Delete orphaned files found by a completed scan (admin only)"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
     
-    # Get all files in upload directories
-    base_folder = current_app.config['UPLOAD_FOLDER']
-    orphaned = []
-    orphaned_by_folder = {}
-    total_size = 0
+    data = request.json or {}
+    confirm = data.get('confirm', False)
+    scan_id = data.get('scan_id')
+    file_ids = data.get('file_ids')
     
-    for doc_type, folder_name in [
-        ('passport', 'passports'),
-        ('aadhaar', 'aadhaar'),
-        ('pan', 'pan'),
-        ('vaccine', 'vaccine'),
-        ('photo', 'photos'),
-        ('document', 'documents'),
-        ('logo', 'company'),
-        ('backup', 'backups')
-    ]:
-        folder = os.path.join(base_folder, folder_name)
-        if os.path.exists(folder):
-            orphaned_by_folder[folder_name] = []
-            for filename in os.listdir(folder):
-                filepath = os.path.join(folder, filename)
-                if os.path.isfile(filepath) and filename not in referenced_files:
-                    file_size = os.path.getsize(filepath)
-                    orphaned.append({
-                        'path': filepath,
-                        'filename': filename,
-                        'size': file_size,
-                        'folder': folder_name
-                    })
-                    orphaned_by_folder[folder_name].append(filename)
-                    total_size += file_size
+    if not confirm:
+        return jsonify({'success': False, 'error': 'Confirmation required. Set confirm: true'}), 400
+    
+    # Only files recorded by a server-side scan can be deleted
+    if not scan_id:
+        return jsonify({'success': False, 'error': 'scan_id is required (file paths are not accepted)'}), 400
+    
+    try:
+        deleted, errors, total_size = orphans.delete_scan_orphans(current_app.config['UPLOAD_FOLDER'], int(scan_id), file_ids)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
     
     # Log activity
     log_activity(
         session['user_id'],
-        'cleanup_check',
+        'cleanup_delete',
         'uploads',
-        f'Found {len(orphaned)} orphaned files ({round(total_size / (1024*1024), 2)} MB)',
+        f'Deleted {len(deleted)} orphaned files ({round(total_size / (1024*1024), 2)} MB)',
         request.remote_addr
     )
     
     return jsonify({
         'success': True,
-        'orphaned_count': len(orphaned),
-        'orphaned_by_folder': orphaned_by_folder,
-        'orphaned_files': orphaned[:50],
+        'deleted_count': len(deleted),
+        'deleted': deleted[:30],
         'total_size_bytes': total_size,
         'total_size_mb': round(total_size / (1024 * 1024), 2),
-        'message': f'Found {len(orphaned)} orphaned files. Use POST /cleanup/delete to remove them.'
+        'errors': errors,
+        'error_count': len(errors),
+        'message': f'Successfully deleted {len(deleted)} files'
     })
 
-@bp.route('/cleanup/delete', methods=['POST'])
-def delete_orphaned_files():
-    """Delete orphaned files (admin only)"""
+@bp.route('/blobs/orphans', methods=['GET'])
+def get_orphan_blobs():
+    """List content-addressed files no record points at (admin only)"""
     if 'user_id' not in session:
         return jsonify({'success': False, 'error': 'Unauthorized'}), 401
     
-    data = request.json or {}
-    confirm = data.get('confirm', False)
-    files_to_delete = data.get('files', [])
+    grace_minutes = request.args.get('grace_minutes', 60, type=int)
+    limit = request.args.get('limit', 200, type=int)
     
-    if not confirm:
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        orphan_blobs = storage.find_orphan_blobs(cursor, grace_minutes, limit)
+        usage = storage.blob_usage(cursor)
+        
+        for blob in orphan_blobs:
+            if blob.get('created_at'):
+                blob['created_at'] = blob['created_at'].isoformat()
+        
+        return jsonify({
+            'success': True,
+            'orphans': orphan_blobs,
+            'orphan_count': len(orphan_blobs),
+            'orphan_bytes': sum(blob['size_bytes'] or 0 for blob in orphan_blobs),
+            'usage': {
+                'blob_count': usage['blob_count'],
+                'orphan_count': usage['orphan_count'],
+                'stored_bytes': int(usage['stored_bytes']),
+                'logical_bytes': int(usage['logical_bytes']),
+                'saved_bytes': int(usage['logical_bytes']) - int(usage['stored_bytes'])
+            }
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        release_db(conn, cursor)
+
+@bp.route('/blobs/orphans/delete', methods=['POST'])
+def delete_orphan_blobs():
+    """Delete unreferenced content-addressed files (admin only)"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    data = request.json or {}
+    if not data.get('confirm', False):
         return jsonify({'success': False, 'error': 'Confirmation required. Set confirm: true'}), 400
     
-    if not files_to_delete:
-        return jsonify({'success': False, 'error': 'No files specified for deletion'}), 400
+    grace_minutes = int(data.get('grace_minutes', 60))
+    base_folder = current_app.config['UPLOAD_FOLDER']
+    
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        orphan_blobs = storage.find_orphan_blobs(cursor, grace_minutes)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        release_db(conn, cursor)
     
     deleted = []
     errors = []
     total_size = 0
-    
-    for file_info in files_to_delete:
+    for blob in orphan_blobs:
         try:
-            filepath = file_info if isinstance(file_info, str) else file_info.get('path')
-            if not filepath:
-                continue
-                
-            if os.path.exists(filepath) and os.path.isfile(filepath):
-                file_size = os.path.getsize(filepath)
-                os.remove(filepath)
-                deleted.append({
-                    'path': filepath,
-                    'filename': os.path.basename(filepath),
-                    'size': file_size
-                })
-                total_size += file_size
-            else:
-                errors.append(f"File not found: {filepath}")
+            removed = remove_orphan_blob(base_folder, blob['id'], grace_minutes)
+            if removed:
+                deleted.append(f"{removed['folder']}/{removed['filename']}")
+                total_size += removed['size_bytes'] or 0
         except Exception as e:
-            errors.append(f"Error deleting {filepath}: {str(e)}")
+            errors.append(f"Error deleting {blob['filename']}: {str(e)}")
     
-    # Log activity
     log_activity(
         session['user_id'],
         'cleanup_delete',
         'uploads',
-        f'Deleted {len(deleted)} orphaned files ({round(total_size / (1024*1024), 2)} MB)',
+        f'Deleted {len(deleted)} orphaned blobs ({round(total_size / (1024*1024), 2)} MB)',
         request.remote_addr
     )
     
@@ -745,8 +1365,7 @@ def delete_orphaned_files():
         'total_size_bytes': total_size,
         'total_size_mb': round(total_size / (1024 * 1024), 2),
         'errors': errors,
-        'error_count': len(errors),
-        'message': f'Successfully deleted {len(deleted)} files'
+        'error_count': len(errors)
     })
 
 @bp.route('/types', methods=['GET'])
@@ -776,45 +1395,43 @@ def get_upload_stats():
     if 'user_id' not in session:
         return jsonify({'success': False, 'error': 'Unauthorized'}), 401
     
-    base_folder = current_app.config['UPLOAD_FOLDER']
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        rows = upload_stats.get_stats(cursor)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        release_db(conn, cursor)
+    
+    # First run (or explicit refresh) - rebuild from disk in the background
+    reconciling = not rows or request.args.get('refresh', 'false').lower() == 'true'
+    if reconciling:
+        jobs.start('upload_stats', jobs.run_locked, 'upload_stats',
+                   upload_stats.reconcile, current_app.config['UPLOAD_FOLDER'])
+    
     stats = {}
     total_files = 0
     total_size = 0
+    reconciled_at = None
     
-    for doc_type, folder_name in [
-        ('passport', 'passports'),
-        ('aadhaar', 'aadhaar'),
-        ('pan', 'pan'),
-        ('vaccine', 'vaccine'),
-        ('photo', 'photos'),
-        ('document', 'documents'),
-        ('logo', 'company'),
-        ('backup', 'backups')
-    ]:
-        folder = os.path.join(base_folder, folder_name)
-        if os.path.exists(folder):
-            files = []
-            folder_size = 0
-            for filename in os.listdir(folder):
-                filepath = os.path.join(folder, filename)
-                if os.path.isfile(filepath):
-                    file_size = os.path.getsize(filepath)
-                    files.append({
-                        'name': filename,
-                        'size': file_size,
-                        'size_mb': round(file_size / (1024 * 1024), 2),
-                        'modified': datetime.fromtimestamp(os.path.getmtime(filepath)).isoformat()
-                    })
-                    folder_size += file_size
-            
-            stats[folder_name] = {
-                'file_count': len(files),
-                'total_size_bytes': folder_size,
-                'total_size_mb': round(folder_size / (1024 * 1024), 2),
-                'files': files[:20]
-            }
-            total_files += len(files)
-            total_size += folder_size
+    for row in rows:
+        files = [
+            {**f, 'size_mb': round(f['size'] / (1024 * 1024), 2)}
+            for f in row['newest_files'] or []
+        ]
+        stats[row['folder']] = {
+            'file_count': row['file_count'],
+            'total_size_bytes': row['total_bytes'],
+            'total_size_mb': round(row['total_bytes'] / (1024 * 1024), 2),
+            'files': files,
+            'updated_at': row['updated_at'].isoformat() if row['updated_at'] else None
+        }
+        total_files += row['file_count']
+        total_size += row['total_bytes']
+        if row['reconciled_at'] and (not reconciled_at or row['reconciled_at'] > reconciled_at):
+            reconciled_at = row['reconciled_at']
     
     return jsonify({
         'success': True,
@@ -824,5 +1441,7 @@ def get_upload_stats():
             'total_size_bytes': total_size,
             'total_size_mb': round(total_size / (1024 * 1024), 2),
             'total_size_gb': round(total_size / (1024 * 1024 * 1024), 2)
-        }
-    })
\ No newline at end of file
+        },
+        'reconciled_at': reconciled_at.isoformat() if reconciled_at else None,
+        'reconciling': reconciling
+    })
@@ -1,5 +1,6 @@
 from flask import Blueprint, request, jsonify, session
 from app.database import get_db, release_db
+from app.idempotency import idempotent
 from datetime import datetime
 from werkzeug.security import generate_password_hash
 import traceback
@@ -58,6 +59,7 @@ def get_users():
 
 
 @bp.route('', methods=['POST'])
+@idempotent
 def create_user():
     """Create a new user with hashed password"""
     if 'user_id' not in session:
@@ -0,0 +1,364 @@
+"""
+Seat inventory
+Every change to a batch's seat counters is a single conditional UPDATE on the
+batch row, so two bookings can never both take the last seat and the row lock
+is held for one statement rather than a whole request.
+
+Seats can also be held for a while (a group booking being keyed in, a
+payment link) without being booked. Holds count against availability until
+they are consumed by travelers, cancelled, or expire; a background job frees
+expired holds.
+
+The counters can still drift from the data (demo seeding, manual SQL, rows
+written before this module existed), so a reconciliation job recounts them
+from travelers and seat_holds and repairs what differs.
+"""
+
+import os
+from app.database import get_db, release_db
+from app import jobs
+
+HOLD_MINUTES = int(os.getenv('SEAT_HOLD_MINUTES', '15'))
+MAX_HOLD_MINUTES = 7 * 24 * 60
+EXPIRY_INTERVAL = int(os.getenv('SEAT_HOLD_EXPIRY_INTERVAL', '60'))
+RECONCILE_INTERVAL = int(os.getenv('SEAT_RECONCILE_INTERVAL', '3600'))
+RECONCILE_REPAIR = os.getenv('SEAT_RECONCILE_REPAIR', 'true').lower() == 'true'
+
+# Batches whose counters differ from their travelers and holds
+SEAT_DRIFT_SQL = """
+    SELECT
+        b.id AS batch_id, b.batch_name, b.total_seats,
+        b.booked_seats, COALESCE(t.travelers, 0) AS actual_booked,
+        b.held_seats, COALESCE(h.seats, 0) AS actual_held
+    FROM batches b
+    LEFT JOIN (
+        SELECT batch_id, COUNT(*) AS travelers FROM travelers
+        WHERE batch_id IS NOT NULL GROUP BY batch_id
+    ) t ON t.batch_id = b.id
+    LEFT JOIN (
+        SELECT batch_id, SUM(seats) AS seats FROM seat_holds GROUP BY batch_id
+    ) h ON h.batch_id = b.id
+    WHERE b.booked_seats IS DISTINCT FROM COALESCE(t.travelers, 0)
+       OR b.held_seats <> COALESCE(h.seats, 0)
+"""
+
+class SeatsUnavailable(Exception):
+    """Not enough free seats in a batch"""
+
+    def __init__(self, batch_id, requested, available):
+        self.batch_id = batch_id
+        self.requested = requested
+        self.available = max(available, 0)
+        super().__init__(
+            f"Only {self.available} seat(s) left in this batch, {requested} requested"
+            if self.available else "Batch is full"
+        )
+
+class HoldUnavailable(Exception):
+    """The seat hold does not exist, has expired or has too few seats left"""
+
+# ============================================================
+# DATABASE MIGRATION - Create seat_holds table if not exists
+# ============================================================
+def migrate_seat_tables():
+    """Add batches.held_seats and create the seat_holds table if they don't exist"""
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        cursor.execute("ALTER TABLE batches ADD COLUMN IF NOT EXISTS held_seats INTEGER NOT NULL DEFAULT 0")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS seat_holds (
+                id SERIAL PRIMARY KEY,
+                batch_id INTEGER NOT NULL REFERENCES batches(id) ON DELETE CASCADE,
+                seats INTEGER NOT NULL CHECK (seats >= 0),
+                reference TEXT,
+                created_by INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                expires_at TIMESTAMP NOT NULL
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_seat_holds_expires ON seat_holds (expires_at)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_seat_holds_batch ON seat_holds (batch_id)")
+        conn.commit()
+        print("✅ seat_holds table verified!")
+    except Exception as e:
+        print(f"⚠️ Migration error: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn:
+            release_db(conn, cursor)
+
+# ============================================================
+# BOOKINGS
+# ============================================================
+
+def _unavailable(cursor, batch_id, requested):
+    """Build the error for a conditional update that matched nothing"""
+    cursor.execute("""
+        SELECT total_seats - booked_seats - held_seats AS available
+        FROM batches WHERE id = %s
+    """, (batch_id,))
+    row = cursor.fetchone()
+    if not row:
+        raise LookupError('Batch not found')
+    return SeatsUnavailable(batch_id, requested, row['available'] or 0)
+
+def reserve(cursor, batch_id, seats=1):
+    """
+    Book seats in a batch, all or nothing
+
+    Raises:
+        SeatsUnavailable: when fewer than seats are free
+        LookupError: when the batch does not exist
+    """
+    cursor.execute("""
+        UPDATE batches
+        SET booked_seats = booked_seats + %(seats)s
+        WHERE id = %(batch_id)s
+          AND (total_seats IS NULL OR booked_seats + held_seats + %(seats)s <= total_seats)
+        RETURNING booked_seats
+    """, {'batch_id': batch_id, 'seats': seats})
+    if not cursor.fetchone():
+        raise _unavailable(cursor, batch_id, seats)
+
+def release(cursor, batch_id, seats=1):
+    """Give booked seats back to a batch"""
+    if not batch_id:
+        return
+    cursor.execute("""
+        UPDATE batches SET booked_seats = GREATEST(booked_seats - %s, 0) WHERE id = %s
+    """, (seats, batch_id))
+
+def move(cursor, old_batch_id, new_batch_id, seats=1):
+    """Move booked seats between batches; the new batch must have room"""
+    if old_batch_id == new_batch_id:
+        return
+    reserve(cursor, new_batch_id, seats)
+    release(cursor, old_batch_id, seats)
+
+def availability(cursor, batch_id):
+    """Seat counters of a batch, None if it does not exist"""
+    cursor.execute("""
+        SELECT id AS batch_id, total_seats, booked_seats, held_seats,
+               GREATEST(total_seats - booked_seats - held_seats, 0) AS available_seats,
+               (SELECT COUNT(*) FROM seat_holds h WHERE h.batch_id = b.id AND h.seats > 0) AS active_holds
+        FROM batches b WHERE id = %s
+    """, (batch_id,))
+    row = cursor.fetchone()
+    return dict(row) if row else None
+
+# ============================================================
+# HOLDS
+# ============================================================
+
+def hold(cursor, batch_id, seats, minutes=HOLD_MINUTES, reference=None, created_by=None):
+    """
+    Hold seats for a while (a group booking), all or nothing
+
+    The counter update and the hold row are written by one statement.
+
+    Returns:
+        dict: id, batch_id, seats, reference, expires_at
+
+    Raises:
+        SeatsUnavailable, LookupError
+    """
+    cursor.execute("""
+        WITH taken AS (
+            UPDATE batches
+            SET held_seats = held_seats + %(seats)s
+            WHERE id = %(batch_id)s
+              AND (total_seats IS NULL OR booked_seats + held_seats + %(seats)s <= total_seats)
+            RETURNING id
+        )
+        INSERT INTO seat_holds (batch_id, seats, reference, created_by, created_at, expires_at)
+        SELECT id, %(seats)s, %(reference)s, %(created_by)s, CURRENT_TIMESTAMP,
+               CURRENT_TIMESTAMP + make_interval(mins => %(minutes)s)
+        FROM taken
+        RETURNING id, batch_id, seats, reference, expires_at
+    """, {'batch_id': batch_id, 'seats': seats, 'reference': reference,
+          'created_by': created_by, 'minutes': minutes})
+    row = cursor.fetchone()
+    if not row:
+        raise _unavailable(cursor, batch_id, seats)
+    return dict(row)
+
+def consume_hold(cursor, hold_id, batch_id, seats=1):
+    """
+    Turn held seats into booked ones (a traveler of the group is created)
+
+    Returns:
+        int: seats still held
+
+    Raises:
+        HoldUnavailable: when the hold is gone, expired, for another batch or too small
+    """
+    cursor.execute("""
+        WITH used AS (
+            UPDATE seat_holds SET seats = seats - %(seats)s
+            WHERE id = %(hold_id)s AND batch_id = %(batch_id)s
+              AND seats >= %(seats)s AND expires_at > CURRENT_TIMESTAMP
+            RETURNING batch_id, seats
+        ),
+        moved AS (
+            UPDATE batches b
+            SET held_seats = GREATEST(b.held_seats - %(seats)s, 0), booked_seats = b.booked_seats + %(seats)s
+            FROM used WHERE b.id = used.batch_id
+            RETURNING b.id
+        )
+        SELECT seats FROM used
+    """, {'hold_id': hold_id, 'batch_id': batch_id, 'seats': seats})
+    row = cursor.fetchone()
+    if not row:
+        raise HoldUnavailable('Seat hold not found, expired or has no seats left')
+    if row['seats'] == 0:
+        cursor.execute("DELETE FROM seat_holds WHERE id = %s AND seats = 0", (hold_id,))
+    return row['seats']
+
+def cancel_hold(cursor, hold_id, batch_id=None):
+    """Release a hold's remaining seats, returns the number freed (None if no such hold)"""
+    cursor.execute("""
+        WITH gone AS (
+            DELETE FROM seat_holds
+            WHERE id = %(hold_id)s AND (%(batch_id)s::int IS NULL OR batch_id = %(batch_id)s::int)
+            RETURNING batch_id, seats
+        ),
+        freed AS (
+            UPDATE batches b SET held_seats = GREATEST(b.held_seats - gone.seats, 0)
+            FROM gone WHERE b.id = gone.batch_id
+            RETURNING b.id
+        )
+        SELECT seats FROM gone
+    """, {'hold_id': hold_id, 'batch_id': batch_id})
+    row = cursor.fetchone()
+    return row['seats'] if row else None
+
+def expire_holds():
+    """Scheduled job: free the seats of expired holds, returns the number of holds removed"""
+    conn, cursor = get_db()
+    if not conn:
+        return 0
+    try:
+        cursor.execute("""
+            WITH expired AS (
+                DELETE FROM seat_holds WHERE expires_at <= CURRENT_TIMESTAMP
+                RETURNING batch_id, seats
+            ),
+            per_batch AS (
+                SELECT batch_id, SUM(seats) AS seats, COUNT(*) AS holds FROM expired GROUP BY batch_id
+            ),
+            freed AS (
+                UPDATE batches b SET held_seats = GREATEST(b.held_seats - per_batch.seats, 0)
+                FROM per_batch WHERE b.id = per_batch.batch_id
+                RETURNING b.id
+            )
+            SELECT COALESCE(SUM(holds), 0) AS holds, COALESCE(SUM(seats), 0) AS seats FROM per_batch
+        """)
+        row = cursor.fetchone()
+        conn.commit()
+        if row['holds']:
+            print(f"✅ Expired {row['holds']} seat holds ({row['seats']} seats freed)")
+        return row['holds']
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        release_db(conn, cursor)
+
+# ============================================================
+# RECONCILIATION
+# ============================================================
+
+def find_drift(cursor):
+    """Batches whose booked_seats or held_seats differ from the data"""
+    cursor.execute(SEAT_DRIFT_SQL + " ORDER BY b.id")
+    return [dict(row) for row in cursor.fetchall()]
+
+def repair_drift(cursor, batch_ids=None):
+    """
+    Set the counters of drifted batches to their recounted values
+
+    The batch rows are locked before the recount, so bookings in flight
+    either finish first (and are counted) or adjust the repaired value after.
+
+    Returns:
+        list: the repaired batches with their old and new counts
+    """
+    cursor.execute("SELECT pg_advisory_xact_lock(%s)", (jobs.lock_key('seat_reconcile_write'),))
+    cursor.execute("""
+        SELECT id FROM batches
+        WHERE %(ids)s::int[] IS NULL OR id = ANY(%(ids)s::int[])
+        ORDER BY id FOR UPDATE
+    """, {'ids': list(batch_ids) if batch_ids is not None else None})
+    cursor.execute(f"""
+        WITH drift AS ({SEAT_DRIFT_SQL})
+        UPDATE batches b
+        SET booked_seats = drift.actual_booked, held_seats = drift.actual_held
+        FROM drift
+        WHERE b.id = drift.batch_id
+          AND (%(ids)s::int[] IS NULL OR b.id = ANY(%(ids)s::int[]))
+        RETURNING drift.*
+    """, {'ids': list(batch_ids) if batch_ids is not None else None})
+    return sorted((dict(row) for row in cursor.fetchall()), key=lambda row: row['batch_id'])
+
+def reconcile(repair=False):
+    """
+    Recount booked and held seats of every batch
+
+    Args:
+        repair: write the recounted values back
+
+    Returns:
+        dict: drifted batches, seats over and under counted, and whether they were repaired
+    """
+    conn, cursor = get_db()
+    if not conn:
+        return None
+    try:
+        drift = find_drift(cursor)
+        if repair and drift:
+            drift = repair_drift(cursor, [row['batch_id'] for row in drift])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        release_db(conn, cursor)
+
+    for row in drift:
+        row['booked_drift'] = (row['booked_seats'] or 0) - row['actual_booked']
+        row['held_drift'] = (row['held_seats'] or 0) - row['actual_held']
+    if drift:
+        action = 'repaired' if repair else 'found'
+        print(f"⚠️ Seat count drift {action} in {len(drift)} batches")
+    else:
+        print("✅ Seat counts match travelers")
+    return {
+        'batches': drift,
+        'drifted': len(drift),
+        'repaired': bool(repair and drift)
+    }
+
+def reconcile_job():
+    """Scheduled job: reconcile seat counts, repairing drift unless SEAT_RECONCILE_REPAIR is off"""
+    reconcile(repair=RECONCILE_REPAIR)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Seat inventory tools')
+    parser.add_argument('command', choices=['reconcile', 'expire-holds'])
+    parser.add_argument('--repair', action='store_true', help='Write recounted seats back (reconcile only)')
+    args = parser.parse_args()
+
+    if args.command == 'reconcile':
+        migrate_seat_tables()
+        result = reconcile(repair=args.repair)
+        for row in result['batches']:
+            print(f"  {row['batch_id']:>6} {row['batch_name'] or '':<30} "
+                  f"booked {row['booked_seats']} -> {row['actual_booked']}, "
+                  f"held {row['held_seats']} -> {row['actual_held']}")
+    else:
+        expire_holds()
@@ -24,7 +24,8 @@ from app.database import get_db, init_db, release_db
 
 # Import route blueprints - USE SIMPLIFIED AUTH
 from app.routes import auth_fixed as auth
-from app.routes import admin, batches, travelers, payments, company, uploads, reports, invoices, receipts, users, backup
+from app.routes import admin, batches, travelers, payments, company, uploads, reports, invoices, receipts, users, backup, frontpage
+from app import jobs, upload_stats, rollups, idempotency, seats, cache, homepage, templating
 
 # ====== FLASK APP INITIALIZATION ======
 app = Flask(__name__)
@@ -151,6 +152,17 @@ app.register_blueprint(invoices.bp)
 app.register_blueprint(receipts.bp)
 app.register_blueprint(users.bp)
 app.register_blueprint(backup.bp)
+app.register_blueprint(frontpage.bp)
+
+# ====== ⏱️ BACKGROUND JOBS ======
+# Each worker schedules these; advisory locks let only one of them run a job
+if jobs.jobs_enabled():
+    jobs.schedule('upload_stats', upload_stats.RECONCILE_INTERVAL, upload_stats.reconcile,
+                  app.config['UPLOAD_FOLDER'], initial_delay=60)
+    jobs.schedule('aging_rollup', rollups.AGING_INTERVAL, rollups.rebuild_aging_if_stale, initial_delay=30)
+    jobs.schedule('idempotency_cleanup', idempotency.CLEANUP_INTERVAL, idempotency.purge_expired)
+    jobs.schedule('seat_hold_expiry', seats.EXPIRY_INTERVAL, seats.expire_holds)
+    jobs.schedule('seat_reconcile', seats.RECONCILE_INTERVAL, seats.reconcile_job, initial_delay=45)
 
 # ====== 📝 SESSION DEBUGGING MIDDLEWARE ======
 @app.after_request
@@ -171,18 +183,14 @@ def log_session_after_request(response):
 
 # ====== 🏠 STATIC FILE ROUTES ======
 @app.route('/')
+@app.route('/index.html')
 def serve_index():
-    """Serve the main index page"""
+    """Serve the homepage, rendered from frontpage settings and open batches and cached per worker"""
     try:
-        index_path = os.path.join(PUBLIC_DIR, 'index.html')
-        if os.path.exists(index_path):
-            print(f"✅ Serving index.html from {index_path}")
-            return send_from_directory(PUBLIC_DIR, 'index.html')
-        else:
-            print(f"❌ index.html not found at {index_path}")
-            return jsonify({'success': False, 'error': 'Index page not found'}), 404
+        entry = cache.get(homepage.cache_key(), homepage.build, tags=homepage.CACHE_TAGS, compress=True)
+        return cache.respond(entry, request)
     except Exception as e:
-        print(f"❌ Error serving index.html: {e}")
+        print(f"❌ Error rendering index.html: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 # ====== 🔐 LOGIN PAGE ROUTES ======
@@ -403,6 +411,11 @@ def send_file_upload(file_path, filename):
     from flask import send_file
     import mimetypes
     
+    # ?size=thumb|medium serves a resized derivative when one is ready
+    preview = uploads.send_derivative(file_path)
+    if preview:
+        return preview
+    
     # Get proper mimetype
     mimetype, encoding = mimetypes.guess_type(filename)
     if not mimetype:
@@ -594,7 +607,7 @@ def debug_paths():
             'files_in_admin': files_in_admin,
             'files_in_admin_js': files_in_admin_js,
             'upload_files': upload_files,
-            'index_exists': os.path.exists(os.path.join(PUBLIC_DIR, 'index.html')),
+            'index_exists': os.path.exists(os.path.join(templating.TEMPLATE_DIR, 'index.html')),
             'login_page_exists': os.path.exists(os.path.join(PUBLIC_DIR, 'admin.login.html')),
             'dashboard_exists': os.path.exists(os.path.join(ADMIN_DIR, 'dashboard.html')),
             'session_manager_exists': os.path.exists(os.path.join(ADMIN_DIR, 'js', 'session-manager.js'))
@@ -692,7 +705,7 @@ def log_admin_action(user_id, action, description):
 def check_required_files():
     """Check if required files exist"""
     required_files = [
-        os.path.join(PUBLIC_DIR, 'index.html'),
+        os.path.join(templating.TEMPLATE_DIR, 'index.html'),
         os.path.join(PUBLIC_DIR, 'admin.login.html'),
         os.path.join(ADMIN_DIR, 'dashboard.html'),
     ]
@@ -721,7 +734,7 @@ if __name__ == '__main__':
     print(f"📁 Session timeout: 30 minutes")
     print(f"📁 Session cookie name: {app.config['SESSION_COOKIE_NAME']}")
     print("=" * 60)
-    print("🌐 ROOT URL: / → serves index.html")
+    print("🌐 ROOT URL: / → renders templates/index.html")
     print("📡 API Health: /api/health")
     print("📡 API Info: /api")
     print("📡 Admin Login: /admin.login.html")
@@ -0,0 +1,332 @@
+"""
+Content-addressed upload storage
+Uploaded files are named by the SHA-256 of their bytes, so re-uploading the
+same passport or Aadhaar scan stores it once. upload_blobs tracks every stored
+file and upload_blob_refs records which traveler columns and company logos
+point at it, which turns orphan detection into a query.
+"""
+
+import os
+import re
+import hashlib
+import tempfile
+from app.database import get_db, release_db
+
+CHUNK_SIZE = 64 * 1024
+SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+# Shared upload folder of each traveler document column
+DOC_FOLDERS = {
+    'passport_scan': 'passports',
+    'aadhaar_scan': 'aadhaar',
+    'pan_scan': 'pan',
+    'vaccine_scan': 'vaccine',
+    'photo': 'photos'
+}
+
+# ============================================================
+# DATABASE MIGRATION - Create blob tracking tables if not exists
+# ============================================================
+def migrate_storage_tables():
+    """Create upload_blobs and upload_blob_refs tables if they don't exist"""
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS upload_blobs (
+                id SERIAL PRIMARY KEY,
+                sha256 CHAR(64) NOT NULL,
+                folder TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                size_bytes BIGINT DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE (folder, filename)
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS upload_blob_refs (
+                id SERIAL PRIMARY KEY,
+                blob_id INTEGER NOT NULL REFERENCES upload_blobs(id) ON DELETE CASCADE,
+                ref_table TEXT NOT NULL,
+                ref_column TEXT NOT NULL,
+                ref_id INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE (ref_table, ref_column, ref_id)
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_upload_blob_refs_blob ON upload_blob_refs (blob_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_upload_blobs_filename ON upload_blobs (filename)")
+        conn.commit()
+        print("✅ upload blob tables verified!")
+
+    except Exception as e:
+        print(f"⚠️ Migration error: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn:
+            release_db(conn, cursor)
+
+# ============================================================
+# FILE STORAGE
+# ============================================================
+
+def store_upload(file, folder_path, ext):
+    """
+    Stream an uploaded file to disk under its content hash
+
+    The bytes are hashed while they are copied to a temp file in the target
+    folder, then renamed to <sha256>.<ext>. If that name already exists the
+    temp file is discarded and the existing copy is reused.
+
+    Returns:
+        dict: filename, path, sha256, size and created (False when deduplicated)
+    """
+    os.makedirs(folder_path, exist_ok=True)
+    stream = getattr(file, 'stream', file)
+    digest = hashlib.sha256()
+    size = 0
+
+    fd, tmp_path = tempfile.mkstemp(dir=folder_path, prefix='.upload_', suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+
+        return finalize_stored_file(tmp_path, folder_path, digest.hexdigest(), size, ext)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def finalize_stored_file(tmp_path, folder_path, sha256, size, ext):
+    """Move a fully written temp file to its content-addressed name"""
+    ext = (ext or '').lower()
+    filename = f"{sha256}.{ext}" if ext else sha256
+    path = os.path.join(folder_path, filename)
+
+    # link() fails if the name exists, so two concurrent uploads of the same
+    # bytes cannot both report created
+    try:
+        os.link(tmp_path, path)
+        created = True
+    except FileExistsError:
+        created = False
+    except OSError:
+        created = not os.path.exists(path)
+        if created:
+            os.replace(tmp_path, path)
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    return {
+        'filename': filename,
+        'path': path,
+        'sha256': sha256,
+        'size': size,
+        'created': created
+    }
+
+def find_document(upload_root, traveler_id, column, filename):
+    """Locate a traveler document on disk (traveler directory first, then the shared folder)"""
+    if not filename:
+        return None
+    name = os.path.basename(filename)
+    for folder in (os.path.join('travelers', str(traveler_id)), DOC_FOLDERS.get(column, 'documents'), 'documents'):
+        path = os.path.join(upload_root, folder, name)
+        if os.path.isfile(path):
+            return path
+    return None
+
+def hash_file(path):
+    """Compute the SHA-256 of a file on disk without loading it into memory"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Leading bytes of each allowed upload type
+MAGIC_BYTES = [
+    (b'%PDF-', 'pdf'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'doc'),
+    (b'PK\x03\x04', 'docx')
+]
+EXTENSION_TYPES = {'jpeg': 'jpg'}
+
+def detect_type(head):
+    """Identify a file type from its first bytes, None if unknown"""
+    for magic, file_type in MAGIC_BYTES:
+        if head.startswith(magic):
+            return file_type
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    text = head.lstrip(b'\xef\xbb\xbf \t\r\n').lower()
+    if text.startswith(b'<svg') or (text.startswith(b'<?xml') and b'<svg' in head.lower()):
+        return 'svg'
+    return None
+
+def content_matches_extension(head, ext):
+    """Check the sniffed type of a file agrees with its extension"""
+    ext = (ext or '').lower()
+    return detect_type(head) == EXTENSION_TYPES.get(ext, ext)
+
+def sha256_from_filename(filename):
+    """Get the content hash embedded in a stored filename (None for legacy names)"""
+    stem = filename.split('.', 1)[0] if filename else ''
+    return stem if SHA256_RE.match(stem) else None
+
+# ============================================================
+# BLOB & REFERENCE TRACKING
+# ============================================================
+
+def register_blob(cursor, folder, filename, size):
+    """
+    Record a stored file, returns its blob id (None for legacy names)
+
+    Registering an existing blob again (a re-upload of the same bytes)
+    restarts its orphan grace period.
+    """
+    sha256 = sha256_from_filename(filename)
+    if not sha256:
+        return None
+
+    cursor.execute("""
+        INSERT INTO upload_blobs (sha256, folder, filename, size_bytes, created_at)
+        VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (folder, filename) DO UPDATE
+        SET size_bytes = EXCLUDED.size_bytes, created_at = CURRENT_TIMESTAMP
+        RETURNING id
+    """, (sha256, folder, filename, size))
+    row = cursor.fetchone()
+    return row['id'] if row else None
+
+def track_reference(cursor, ref_table, ref_column, ref_id, filename, folder=None):
+    """
+    Point a record column at a stored blob
+
+    Looks the blob up by filename (preferring the given folder). Legacy
+    filenames and missing blobs simply drop any previous reference.
+    """
+    blob = None
+    if filename and sha256_from_filename(filename):
+        cursor.execute("""
+            SELECT id FROM upload_blobs
+            WHERE filename = %s
+            ORDER BY (folder = %s) DESC, id
+            LIMIT 1
+        """, (filename, folder))
+        blob = cursor.fetchone()
+
+    if not blob:
+        release_reference(cursor, ref_table, ref_column, ref_id)
+        return None
+
+    cursor.execute("""
+        INSERT INTO upload_blob_refs (blob_id, ref_table, ref_column, ref_id, created_at)
+        VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (ref_table, ref_column, ref_id)
+        DO UPDATE SET blob_id = EXCLUDED.blob_id, created_at = EXCLUDED.created_at
+    """, (blob['id'], ref_table, ref_column, ref_id))
+    return blob['id']
+
+def release_reference(cursor, ref_table, ref_column, ref_id):
+    """Drop the reference from one record column"""
+    cursor.execute("""
+        DELETE FROM upload_blob_refs
+        WHERE ref_table = %s AND ref_column = %s AND ref_id = %s
+    """, (ref_table, ref_column, ref_id))
+
+def release_record_references(cursor, ref_table, ref_id):
+    """Drop every reference held by a deleted record"""
+    cursor.execute("DELETE FROM upload_blob_refs WHERE ref_table = %s AND ref_id = %s", (ref_table, ref_id))
+
+def reference_count(cursor, folder, filename):
+    """Count the references to a stored file"""
+    cursor.execute("""
+        SELECT COUNT(r.id) as count
+        FROM upload_blobs b
+        LEFT JOIN upload_blob_refs r ON r.blob_id = b.id
+        WHERE b.folder = %s AND b.filename = %s
+    """, (folder, filename))
+    row = cursor.fetchone()
+    return row['count'] if row else 0
+
+def forget_blob(cursor, folder, filename):
+    """Remove the tracking row of a deleted file"""
+    cursor.execute("DELETE FROM upload_blobs WHERE folder = %s AND filename = %s", (folder, filename))
+
+def forget_folder(cursor, folder):
+    """Remove the tracking rows of a deleted folder"""
+    cursor.execute("DELETE FROM upload_blobs WHERE folder = %s", (folder,))
+
+def find_orphan_blobs(cursor, grace_minutes=60, limit=None):
+    """
+    List stored files nothing points at
+
+    Files younger than the grace period are skipped because uploads without
+    a traveler_id are referenced by a later traveler save.
+    """
+    query = """
+        SELECT b.id, b.sha256, b.folder, b.filename, b.size_bytes, b.created_at
+        FROM upload_blobs b
+        WHERE NOT EXISTS (SELECT 1 FROM upload_blob_refs r WHERE r.blob_id = b.id)
+          AND b.created_at < CURRENT_TIMESTAMP - make_interval(mins => %s)
+        ORDER BY b.created_at
+    """
+    params = [grace_minutes]
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit)
+    cursor.execute(query, params)
+    return cursor.fetchall()
+
+def claim_orphan_blob(cursor, blob_id, grace_minutes=60):
+    """
+    Delete the tracking row of a blob that is still an orphan
+
+    The row is locked first, which waits for any transaction adding a
+    reference to it, and the orphan conditions are checked again by a fresh
+    statement. The caller unlinks the file only when a row is returned and
+    commits afterwards, so a concurrent re-registration waits for that.
+
+    Returns:
+        dict: folder, filename and size_bytes of the claimed blob, None when it is kept
+    """
+    cursor.execute("SELECT id FROM upload_blobs WHERE id = %s FOR UPDATE", (blob_id,))
+    if not cursor.fetchone():
+        return None
+    cursor.execute("""
+        DELETE FROM upload_blobs b
+        WHERE b.id = %s
+          AND NOT EXISTS (SELECT 1 FROM upload_blob_refs r WHERE r.blob_id = b.id)
+          AND b.created_at < CURRENT_TIMESTAMP - make_interval(mins => %s)
+        RETURNING b.folder, b.filename, b.size_bytes
+    """, (blob_id, grace_minutes))
+    return cursor.fetchone()
+
+def blob_usage(cursor):
+    """Get stored vs referenced byte totals (shows what deduplication saved)"""
+    cursor.execute("""
+        SELECT
+            COUNT(*) as blob_count,
+            COALESCE(SUM(b.size_bytes), 0) as stored_bytes,
+            COALESCE(SUM(b.size_bytes * GREATEST(r.ref_count, 1)), 0) as logical_bytes,
+            COUNT(*) FILTER (WHERE r.ref_count IS NULL) as orphan_count
+        FROM upload_blobs b
+        LEFT JOIN (
+            SELECT blob_id, COUNT(*) as ref_count FROM upload_blob_refs GROUP BY blob_id
+        ) r ON r.blob_id = b.id
+    """)
+    return cursor.fetchone()
@@ -0,0 +1,70 @@
+"""
+Server-side templates
+One Jinja2 environment per worker process: templates under app/templates are
+compiled the first time the environment is built and kept in memory, so a
+render is only the template code running. HTML is autoescaped.
+"""
+
+import os
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), 'templates')
+
+_env = None
+_env_lock = threading.Lock()
+
+def _money(value):
+    """Format an amount with Indian digit grouping (12,34,567.00)"""
+    amount = Decimal(str(value or 0)).quantize(Decimal('0.01'))
+    sign = '-' if amount < 0 else ''
+    whole, fraction = f"{abs(amount):.2f}".split('.')
+    if len(whole) > 3:
+        head, tail = whole[:-3], whole[-3:]
+        groups = []
+        while len(head) > 2:
+            groups.insert(0, head[-2:])
+            head = head[:-2]
+        if head:
+            groups.insert(0, head)
+        whole = ','.join(groups + [tail])
+    return f"{sign}{whole}.{fraction}"
+
+def _date(value, fmt='%d %b %Y'):
+    if not value:
+        return '-'
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return value
+    if isinstance(value, (date, datetime)):
+        return value.strftime(fmt)
+    return str(value)
+
+def get_environment():
+    """Get the worker's template environment, compiling every template on first use"""
+    global _env
+    with _env_lock:
+        if _env is None:
+            env = Environment(
+                loader=FileSystemLoader(TEMPLATE_DIR),
+                autoescape=select_autoescape(['html', 'xml']),
+                auto_reload=False,
+                cache_size=-1,
+                trim_blocks=True,
+                lstrip_blocks=True
+            )
+            env.filters['money'] = _money
+            env.filters['date'] = _date
+            for name in env.list_templates(extensions=['html']):
+                env.get_template(name)
+            _env = env
+        return _env
+
+def render(name, **context):
+    """Render a template to a string"""
+    return get_environment().get_template(name).render(**context)
@@ -0,0 +1,204 @@
+"""
+Upload storage statistics
+Per-folder file counts, byte totals and the newest files are kept in
+upload_folder_stats and adjusted whenever a file is stored or deleted, so the
+stats endpoint never has to walk the upload tree. A periodic scandir
+reconciliation corrects drift (files copied in by hand, crashed requests).
+"""
+
+import os
+import json
+import heapq
+from datetime import datetime
+from app.database import get_db, release_db
+
+NEWEST_LIMIT = 20
+RECONCILE_INTERVAL = int(os.getenv('UPLOAD_STATS_INTERVAL', '3600'))
+
+# Trees that hold generated or temporary files rather than stored uploads
+SKIP_FOLDERS = {'derivatives', 'tmp', 'cache'}
+
+# ============================================================
+# DATABASE MIGRATION - Create upload_folder_stats if not exists
+# ============================================================
+def migrate_upload_stats_table():
+    """Create upload_folder_stats table if it doesn't exist"""
+    conn = None
+    cursor = None
+    try:
+        conn, cursor = get_db()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS upload_folder_stats (
+                folder TEXT PRIMARY KEY,
+                file_count BIGINT DEFAULT 0,
+                total_bytes BIGINT DEFAULT 0,
+                newest_files JSONB DEFAULT '[]'::jsonb,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                reconciled_at TIMESTAMP
+            )
+        """)
+        conn.commit()
+        print("✅ upload_folder_stats table verified!")
+    except Exception as e:
+        print(f"⚠️ Migration error: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn:
+            release_db(conn, cursor)
+
+def split_folder(folder, filename):
+    """Split a storage folder into its top-level stats key and the file name within it"""
+    parts = folder.strip('/').split('/')
+    return parts[0], '/'.join(parts[1:] + [filename])
+
+# ============================================================
+# INCREMENTAL UPDATES
+# ============================================================
+
+def record_added(cursor, folder, filename, size, modified=None):
+    """Count a newly written file and put it at the head of the newest list"""
+    key, name = split_folder(folder, filename)
+    entry = json.dumps({
+        'name': name,
+        'size': size,
+        'modified': (modified or datetime.now()).isoformat()
+    })
+    cursor.execute("""
+        INSERT INTO upload_folder_stats AS s (folder, file_count, total_bytes, newest_files, updated_at)
+        VALUES (%s, 1, %s, jsonb_build_array(%s::jsonb), CURRENT_TIMESTAMP)
+        ON CONFLICT (folder) DO UPDATE SET
+            file_count = s.file_count + 1,
+            total_bytes = s.total_bytes + EXCLUDED.total_bytes,
+            newest_files = (
+                SELECT COALESCE(jsonb_agg(f.value ORDER BY f.ordinality), '[]'::jsonb)
+                FROM jsonb_array_elements(EXCLUDED.newest_files || s.newest_files) WITH ORDINALITY f
+                WHERE f.ordinality <= %s
+            ),
+            updated_at = CURRENT_TIMESTAMP
+    """, (key, size, entry, NEWEST_LIMIT))
+
+def record_removed(cursor, folder, filename, size):
+    """Uncount a deleted file (the newest list refills on the next reconciliation)"""
+    key, name = split_folder(folder, filename)
+    cursor.execute("""
+        UPDATE upload_folder_stats SET
+            file_count = GREATEST(file_count - 1, 0),
+            total_bytes = GREATEST(total_bytes - %s, 0),
+            newest_files = (
+                SELECT COALESCE(jsonb_agg(f.value ORDER BY f.ordinality), '[]'::jsonb)
+                FROM jsonb_array_elements(newest_files) WITH ORDINALITY f
+                WHERE f.value->>'name' <> %s
+            ),
+            updated_at = CURRENT_TIMESTAMP
+        WHERE folder = %s
+    """, (size or 0, name, key))
+
+def record_removed_tree(cursor, folder, file_count, total_bytes):
+    """Uncount a whole deleted directory such as uploads/travelers/<id>"""
+    key, prefix = split_folder(folder, '')
+    cursor.execute("""
+        UPDATE upload_folder_stats SET
+            file_count = GREATEST(file_count - %s, 0),
+            total_bytes = GREATEST(total_bytes - %s, 0),
+            newest_files = (
+                SELECT COALESCE(jsonb_agg(f.value ORDER BY f.ordinality), '[]'::jsonb)
+                FROM jsonb_array_elements(newest_files) WITH ORDINALITY f
+                WHERE NOT starts_with(f.value->>'name', %s)
+            ),
+            updated_at = CURRENT_TIMESTAMP
+        WHERE folder = %s
+    """, (file_count, total_bytes, prefix, key))
+
+def measure_tree(path):
+    """Count files and bytes below a directory with scandir"""
+    file_count = 0
+    total_bytes = 0
+    for _, entry in iter_files(path, ''):
+        file_count += 1
+        total_bytes += entry.stat(follow_symlinks=False).st_size
+    return file_count, total_bytes
+
+# ============================================================
+# RECONCILIATION
+# ============================================================
+
+def iter_files(path, prefix):
+    """Yield (relative name, DirEntry) for every file below a directory"""
+    try:
+        entries = os.scandir(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from iter_files(entry.path, f"{prefix}{entry.name}/")
+            elif entry.is_file(follow_symlinks=False) and not entry.name.startswith('.'):
+                yield f"{prefix}{entry.name}", entry
+
+def scan_folder(path):
+    """Measure one top-level upload folder: (file_count, total_bytes, newest files)"""
+    file_count = 0
+    total_bytes = 0
+    newest = []  # min-heap of (mtime, name, size) capped at NEWEST_LIMIT
+
+    for name, entry in iter_files(path, ''):
+        stat = entry.stat(follow_symlinks=False)
+        file_count += 1
+        total_bytes += stat.st_size
+        item = (stat.st_mtime, name, stat.st_size)
+        if len(newest) < NEWEST_LIMIT:
+            heapq.heappush(newest, item)
+        elif item > newest[0]:
+            heapq.heapreplace(newest, item)
+
+    files = [
+        {'name': name, 'size': size, 'modified': datetime.fromtimestamp(mtime).isoformat()}
+        for mtime, name, size in sorted(newest, reverse=True)
+    ]
+    return file_count, total_bytes, files
+
+def reconcile(upload_root):
+    """Rebuild upload_folder_stats from disk, returns {folder: (count, bytes)}"""
+    results = {}
+    try:
+        with os.scandir(upload_root) as top:
+            folders = [e for e in top if e.is_dir(follow_symlinks=False) and e.name not in SKIP_FOLDERS]
+    except FileNotFoundError:
+        folders = []
+
+    for entry in folders:
+        results[entry.name] = scan_folder(entry.path)
+
+    conn, cursor = get_db()
+    try:
+        for folder, (file_count, total_bytes, files) in results.items():
+            cursor.execute("""
+                INSERT INTO upload_folder_stats (folder, file_count, total_bytes, newest_files, updated_at, reconciled_at)
+                VALUES (%s, %s, %s, %s::jsonb, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+                ON CONFLICT (folder) DO UPDATE SET
+                    file_count = EXCLUDED.file_count,
+                    total_bytes = EXCLUDED.total_bytes,
+                    newest_files = EXCLUDED.newest_files,
+                    updated_at = EXCLUDED.updated_at,
+                    reconciled_at = EXCLUDED.reconciled_at
+            """, (folder, file_count, total_bytes, json.dumps(files)))
+        cursor.execute("DELETE FROM upload_folder_stats WHERE NOT (folder = ANY(%s))", (list(results.keys()),))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        release_db(conn, cursor)
+
+    print(f"✅ Upload stats reconciled for {len(results)} folders")
+    return {folder: result[:2] for folder, result in results.items()}
+
+def get_stats(cursor):
+    """Read every folder's stats row"""
+    cursor.execute("""
+        SELECT folder, file_count, total_bytes, newest_files, updated_at, reconciled_at
+        FROM upload_folder_stats
+        ORDER BY folder
+    """)
+    return cursor.fetchall()
@@ -0,0 +1,79 @@
+"""
+Streaming ZIP writer
+Builds a ZIP archive on the fly and yields it in chunks, so large document
+bundles can be sent as a Flask streaming response without staging the archive
+in memory or on disk. Only one read buffer of a source file is held at a time.
+"""
+
+import os
+import time
+import zipfile
+
+CHUNK_SIZE = 64 * 1024
+
+# Scans and PDFs are already compressed - deflating them only burns CPU
+STORED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'webp', 'pdf', 'zip'}
+
+class _Sink:
+    """Write-only file object that collects bytes until they are drained"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def _compression_for(arcname):
+    ext = arcname.rsplit('.', 1)[-1].lower() if '.' in arcname else ''
+    return zipfile.ZIP_STORED if ext in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+
+def stream_zip(entries):
+    """
+    Yield a ZIP archive chunk by chunk
+
+    Args:
+        entries: iterable of (arcname, source) where source is a file path or
+            bytes, or a callable returning bytes (evaluated when the entry is
+            written, e.g. a manifest built while earlier entries streamed)
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, mode='w', allowZip64=True) as archive:
+        for arcname, source in entries:
+            if callable(source):
+                source = source()
+
+            if isinstance(source, (bytes, bytearray)):
+                info = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+                info.compress_type = _compression_for(arcname)
+                archive.writestr(info, bytes(source))
+            else:
+                info = zipfile.ZipInfo(arcname, date_time=time.localtime(os.path.getmtime(source))[:6])
+                info.compress_type = _compression_for(arcname)
+                info.external_attr = 0o644 << 16
+                with open(source, 'rb') as src, archive.open(info, mode='w', force_zip64=True) as dest:
+                    while True:
+                        chunk = src.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        dest.write(chunk)
+                        data = sink.drain()
+                        if data:
+                            yield data
+
+            data = sink.drain()
+            if data:
+                yield data
+
+    # Central directory is written when the archive closes
+    data = sink.drain()
+    if data:
+        yield data
@@ -0,0 +1,477 @@
+#!/usr/bin/env python
+"""
+Unit tests for the pure helpers behind rooms, installments, reconciliation,
+manifests, ZIP streaming, PDF text and frontpage links. None of them need a
+server; the seat inventory checks run only when DATABASE_URL is set, inside
+a transaction that is rolled back.
+
+Run from the project root: python run_unit_tests.py
+"""
+
+import io
+import os
+import sys
+import zipfile
+import tempfile
+from datetime import date, datetime
+from decimal import Decimal
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+class Colors:
+    HEADER = '\033[95m'
+    BLUE = '\033[94m'
+    GREEN = '\033[92m'
+    YELLOW = '\033[93m'
+    RED = '\033[91m'
+    END = '\033[0m'
+
+def print_header(text):
+    print(f"\n{Colors.HEADER}{'='*80}{Colors.END}")
+    print(f"{Colors.BLUE}{text:^80}{Colors.END}")
+    print(f"{Colors.HEADER}{'='*80}{Colors.END}")
+
+def print_test_result(test_name, passed, message=""):
+    status = f"{Colors.GREEN}✓ PASSED{Colors.END}" if passed else f"{Colors.RED}✗ FAILED{Colors.END}"
+    print(f"{status} - {test_name}")
+    if message and not passed:
+        print(f"  {Colors.YELLOW}→ {message}{Colors.END}")
+
+class UnitTests:
+    """Collects (name, passed[, message]) for every check a subclass runs"""
+
+    title = ''
+
+    def __init__(self):
+        self.results = []
+
+    def check(self, name, test):
+        try:
+            outcome = test()
+            passed, message = (outcome, '') if isinstance(outcome, bool) else outcome
+        except Exception as e:
+            passed, message = False, f"{type(e).__name__}: {e}"
+        self.results.append((name, passed, message) if message else (name, passed))
+        print_test_result(name, passed, message)
+
+    def run_tests(self):
+        print_header(self.title)
+        for name in sorted(n for n in dir(self) if n.startswith('test_')):
+            self.check(name[5:], getattr(self, name))
+        return self.results
+
+def raises(exception, func, *args, **kwargs):
+    try:
+        func(*args, **kwargs)
+    except exception:
+        return True
+    return False, f"{exception.__name__} not raised"
+
+# ============================================================================
+# 1. Room allocation
+# ============================================================================
+
+def traveler(id, first, last, gender='Male', spouse=None, father=None, wheelchair=None):
+    return {'id': id, 'first_name': first, 'last_name': last, 'passport_name': f"{first} {last}",
+            'spouse_name': spouse, 'father_name': father, 'gender': gender, 'wheelchair': wheelchair}
+
+def rooms_by_traveler(placements):
+    return {traveler_id: room['room_no'] for traveler_id, room in placements}
+
+class TestRooms(UnitTests):
+    title = "🛏️ 1. ROOM ALLOCATION (rooms.plan)"
+
+    def test_married_couple_shares_family_room(self):
+        from app import rooms
+        plan, placements = rooms.plan([
+            traveler(1, 'Ahmed', 'Khan', spouse='Fatima Khan'),
+            traveler(2, 'Fatima', 'Khan', gender='Female', spouse='Ahmed Khan'),
+            traveler(3, 'Bilal', 'Shaikh')
+        ])
+        where = rooms_by_traveler(placements)
+        family = [r for r in plan if r['room_type'] == rooms.FAMILY]
+        return where[1] == where[2] != where[3] and len(family) == 1 and family[0]['room_no'] == 1
+
+    def test_siblings_grouped_by_father_and_surname(self):
+        from app import rooms
+        where = rooms_by_traveler(rooms.plan([
+            traveler(1, 'Imran', 'Patel', father='Yusuf Patel'),
+            traveler(2, 'Salim', 'Patel', father='Yusuf Patel'),
+            traveler(3, 'Omar', 'Sayed'),
+            traveler(4, 'Tariq', 'Sayed'),
+            traveler(5, 'Zaid', 'Qureshi')
+        ], capacity=2)[1])
+        return where[1] == where[2]
+
+    def test_capacity_respected(self):
+        from app import rooms
+        plan, placements = rooms.plan([traveler(i, f'M{i}', f'S{i}') for i in range(1, 10)], capacity=4)
+        return len(plan) == 3 and all(r['occupied'] <= 4 for r in plan) and len(placements) == 9
+
+    def test_wheelchair_users_get_accessible_rooms_first(self):
+        from app import rooms
+        plan, placements = rooms.plan([
+            traveler(1, 'A', 'One'), traveler(2, 'B', 'Two', wheelchair='Yes'), traveler(3, 'C', 'Three')
+        ], capacity=2, accessible_capacity=1)
+        room = dict(rooms_by_traveler(placements))[2]
+        accessible = [r for r in plan if r['accessible']]
+        return len(accessible) == 1 and accessible[0]['room_no'] == room == 1
+
+    def test_ambiguous_name_links_nobody(self):
+        from app import rooms
+        family_of, married = rooms.find_families([
+            traveler(1, 'Ali', 'Khan'), traveler(2, 'Ali', 'Khan'),
+            traveler(3, 'Sara', 'Khan', gender='Female', spouse='Ali Khan')
+        ])
+        return len(set(family_of.values())) == 3 and not married
+
+# ============================================================================
+# 2. Installments
+# ============================================================================
+
+class TestInstallments(UnitTests):
+    title = "📅 2. INSTALLMENTS (split_amount, parse_plan)"
+
+    def test_split_adds_up_to_total(self):
+        from app import installments
+        steps = [(Decimal('33.33'), date(2026, 1, 1)), (Decimal('33.33'), date(2026, 2, 1)),
+                 (Decimal('33.34'), date(2026, 3, 1))]
+        amounts = installments.split_amount('100000.01', steps)
+        return sum(amounts) == Decimal('100000.01') and amounts[0] == Decimal('33330.00')
+
+    def test_last_installment_takes_remainder(self):
+        from app import installments
+        steps = [(Decimal('50'), None), (Decimal('50'), None)]
+        return installments.split_amount('0.03', steps) == [Decimal('0.02'), Decimal('0.01')]
+
+    def test_plan_sorted_by_due_date(self):
+        from app import installments
+        steps = installments.parse_plan([
+            {'percent': 50, 'due_date': '2026-12-01'},
+            {'percent': 25, 'days_before_departure': 90},
+            {'percent': 25, 'due_date': '2026-06-01'}
+        ], departure_date=date(2027, 1, 30))
+        return [due for _, due in steps] == [date(2026, 6, 1), date(2026, 11, 1), date(2026, 12, 1)]
+
+    def test_percents_must_add_up_to_100(self):
+        from app import installments
+        return raises(ValueError, installments.parse_plan, [{'percent': 60, 'due_date': '2026-01-01'},
+                                                            {'percent': 30, 'due_date': '2026-02-01'}])
+
+    def test_relative_due_date_needs_departure(self):
+        from app import installments
+        return raises(ValueError, installments.parse_plan, [{'percent': 100, 'days_before_departure': 30}])
+
+    def test_invalid_due_date_rejected(self):
+        from app import installments
+        return raises(ValueError, installments.parse_plan, [{'percent': 100, 'due_date': '2026-13-01'}])
+
+    def test_schedule_labels(self):
+        from app import installments
+        schedule = installments.build_schedule(1000, [(Decimal('25'), date(2026, 1, 1)), (Decimal('75'), date(2026, 2, 1))])
+        return [s['label'] for s in schedule] == ['Installment 1 of 2 (25%)', 'Installment 2 of 2 (75%)']
+
+# ============================================================================
+# 3. Bank statement reconciliation
+# ============================================================================
+
+def statement(*lines):
+    import pandas as pd
+    from app.reconciliation import normalize_references
+    frame = pd.DataFrame([
+        {'line': number, 'date': date.fromisoformat(day), 'reference': reference,
+         'narration': narration, 'amount': float(amount)}
+        for number, (day, reference, narration, amount) in enumerate(lines, start=2)
+    ])
+    frame['ref_key'] = normalize_references(frame['reference'])
+    return frame
+
+def payments(*rows):
+    import pandas as pd
+    return pd.DataFrame([
+        {'payment_id': pid, 'traveler_id': pid, 'batch_id': 1, 'payment_amount': float(amount),
+         'payment_date': date.fromisoformat(day), 'status': 'pending', 'payment_reference': reference,
+         'first_name': 'A', 'last_name': 'B'}
+        for pid, day, amount, reference in rows
+    ])
+
+def statuses(result):
+    return dict(zip(result['line'], result['status']))
+
+class TestReconciliation(UnitTests):
+    title = "🏦 3. RECONCILIATION (reconcile)"
+
+    def test_exact_reference_match(self):
+        from app import reconciliation
+        result = reconciliation.reconcile(
+            statement(('2026-01-05', 'UTR000123456', '', 5000)),
+            payments((1, '2026-01-01', 5000, '123456')))
+        return statuses(result) == {2: 'matched'} and result.loc[0, 'payment_id'] == 1
+
+    def test_reference_in_narration(self):
+        from app import reconciliation
+        result = reconciliation.reconcile(
+            statement(('2026-01-05', '', 'NEFT-HDFC0001-AB12345678-HAJ FEE', 5000)),
+            payments((7, '2025-12-01', 5000, 'AB12345678')))
+        return statuses(result) == {2: 'matched'}
+
+    def test_amount_mismatch(self):
+        from app import reconciliation
+        result = reconciliation.reconcile(
+            statement(('2026-01-05', 'REF998877', '', 4000)),
+            payments((1, '2026-01-05', 5000, '998877')))
+        return statuses(result) == {2: 'amount_mismatch'}
+
+    def test_repeated_line_is_duplicate(self):
+        from app import reconciliation
+        result = reconciliation.reconcile(
+            statement(('2026-01-05', 'UTR555666', '', 100), ('2026-01-05', 'UTR555666', '', 100)),
+            payments((1, '2026-01-05', 100, '555666')))
+        return statuses(result) == {2: 'matched', 3: 'duplicate'}
+
+    def test_probable_within_window(self):
+        from app import reconciliation
+        result = reconciliation.reconcile(
+            statement(('2026-01-05', '', 'cash deposit', 2500), ('2026-01-05', '', 'cash deposit', 900)),
+            payments((1, '2026-01-03', 2500, None), (2, '2025-12-01', 900, None)), window_days=3)
+        return statuses(result) == {2: 'probable', 3: 'unmatched'}
+
+    def test_same_amount_twice_is_ambiguous(self):
+        from app import reconciliation
+        result = reconciliation.reconcile(
+            statement(('2026-01-05', '', 'deposit', 2500)),
+            payments((1, '2026-01-04', 2500, None), (2, '2026-01-06', 2500, None)))
+        return statuses(result) == {2: 'ambiguous'} and sorted(result.loc[0, 'candidates']) == [1, 2]
+
+# ============================================================================
+# 4. Manifests
+# ============================================================================
+
+def manifest_row(**values):
+    from app import manifests
+    row = {column: None for column in manifests.SOURCE_COLUMNS + list(manifests.ROOM_COLUMNS)}
+    row.update(values)
+    return row
+
+class TestManifests(UnitTests):
+    title = "📋 4. MANIFESTS (format_chunk, formula escaping)"
+
+    def test_titles_and_pnr_names(self):
+        from app import manifests
+        frame = manifests.format_chunk([
+            manifest_row(id=1, first_name='Ahmed Ali', last_name='Khan', gender='Male', dob=date(1970, 5, 1)),
+            manifest_row(id=2, first_name='Fatima', last_name='Khan', gender='Female', spouse_name='Ahmed',
+                         dob=date(1975, 1, 1)),
+            manifest_row(id=3, first_name='Zara', last_name='Khan', gender='F', dob=date(2026, 3, 1))
+        ], ['serial', 'pnr_name', 'title', 'age'], '%d%b%Y', date(2026, 12, 1), first_serial=5)
+        return (list(frame['serial']) == ['5', '6', '7'] and
+                list(frame['pnr_name']) == ['KHAN/AHMEDALI MR', 'KHAN/FATIMA MRS', 'KHAN/ZARA INF'] and
+                list(frame['age']) == ['56', '51', '0'])
+
+    def test_dates_formatted_and_blanks_empty(self):
+        from app import manifests
+        frame = manifests.format_chunk([
+            manifest_row(id=1, dob=date(1980, 2, 29), wheelchair='Yes'),
+            manifest_row(id=2)
+        ], ['dob', 'passport_expiry_date', 'wheelchair_code', 'room_no'], '%d/%m/%Y', date(2026, 1, 1), 1)
+        return (list(frame['dob']) == ['29/02/1980', ''] and list(frame['wheelchair_code']) == ['WCHR', ''] and
+                list(frame['passport_expiry_date']) == ['', ''] and list(frame['room_no']) == ['', ''])
+
+    def test_uppercase_template(self):
+        from app import manifests
+        frame = manifests.format_chunk([manifest_row(id=1, father_name='Yusuf Patel')], ['father_name'],
+                                       '%d/%m/%Y', date(2026, 1, 1), 1, uppercase=True)
+        return list(frame['father_name']) == ['YUSUF PATEL']
+
+    def test_formula_cells_escaped_in_csv(self):
+        from app import manifests
+        frame = manifests.format_chunk([manifest_row(id=1, first_name='=HYPERLINK("x")', mobile='+919876')],
+                                       ['first_name', 'mobile'], '%d/%m/%Y', date(2026, 1, 1), 1)
+        data = b''.join(manifests.stream_csv([frame], ['Name', '@Mobile'])).decode('utf-8-sig')
+        return data.splitlines() == ["Name,'@Mobile", '"\'=HYPERLINK(""x"")",\'+919876'], repr(data)
+
+    def test_formula_cells_are_strings_in_xlsx(self):
+        from app import manifests
+        from openpyxl import load_workbook
+        frame = manifests.format_chunk([manifest_row(id=1, first_name='=1+1')], ['first_name'],
+                                       '%d/%m/%Y', date(2026, 1, 1), 1)
+        sheet = load_workbook(io.BytesIO(b''.join(manifests.stream_xlsx([frame], ['Name'], 'T')))).active
+        cell = sheet.cell(row=2, column=1)
+        return cell.value == '=1+1' and cell.data_type == 's'
+
+# ============================================================================
+# 5. Streaming ZIP
+# ============================================================================
+
+class TestZipStream(UnitTests):
+    title = "🗜️ 5. ZIP STREAMING (stream_zip)"
+
+    def test_bytes_files_and_callables(self):
+        from app import zipstream
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'scan.jpg')
+            with open(path, 'wb') as f:
+                f.write(os.urandom(zipstream.CHUNK_SIZE * 2 + 10))
+            with open(path, 'rb') as f:
+                scan = f.read()
+            chunks = list(zipstream.stream_zip([
+                ('notes.txt', b'hello ' * 1000),
+                ('passport/scan.jpg', path),
+                ('manifest.csv', lambda: b'a,b\r\n1,2\r\n')
+            ]))
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+        return (len(chunks) > 2 and archive.testzip() is None and
+                archive.read('notes.txt') == b'hello ' * 1000 and
+                archive.read('passport/scan.jpg') == scan and
+                archive.read('manifest.csv') == b'a,b\r\n1,2\r\n')
+
+    def test_compressed_formats_are_stored(self):
+        from app import zipstream
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(zipstream.stream_zip([
+            ('a.PDF', b'%PDF-1.4'), ('b.txt', b'text'), ('noext', b'x')
+        ]))))
+        types = {info.filename: info.compress_type for info in archive.infolist()}
+        return types == {'a.PDF': zipfile.ZIP_STORED, 'b.txt': zipfile.ZIP_DEFLATED, 'noext': zipfile.ZIP_DEFLATED}
+
+    def test_empty_archive(self):
+        from app import zipstream
+        return zipfile.ZipFile(io.BytesIO(b''.join(zipstream.stream_zip([])))).namelist() == []
+
+# ============================================================================
+# 6. PDF text and frontpage links
+# ============================================================================
+
+class TestTextHelpers(UnitTests):
+    title = "🔤 6. PDF TEXT & FRONTPAGE LINKS"
+
+    def test_plain_value(self):
+        from app.pdf_text import plain_value
+        value = plain_value({'a': Decimal('1.50'), 'b': [date(2026, 1, 2), datetime(2026, 1, 2, 3, 4)], 'c': None})
+        return value == {'a': '1.50', 'b': ['2026-01-02', '2026-01-02T03:04:00'], 'c': None}
+
+    def test_cell_text(self):
+        from app.pdf_text import cell_text
+        return ([cell_text(v) for v in (None, '', '2026-01-02', '2026-01-02T03:04:00', '2026-99-99', 'PP123')] ==
+                ['-', '-', '02 Jan 2026', '02 Jan 2026', '2026-99-99', 'PP123'])
+
+    def test_safe_links(self):
+        from app.homepage import is_safe_link
+        good = ['#packages', '/book', 'book.html', 'https://example.com', 'mailto:a@b.com', 'tel:+919876543210']
+        bad = ['javascript:alert(1)', ' JavaScript:alert(1)', 'java\tscript:alert(1)', 'data:text/html,x',
+               'vbscript:x', None]
+        return all(is_safe_link(v) for v in good) and not any(is_safe_link(v) for v in bad)
+
+# ============================================================================
+# 7. Seat inventory (needs DATABASE_URL, rolled back)
+# ============================================================================
+
+class TestSeats(UnitTests):
+    title = "💺 7. SEAT INVENTORY (reserve, hold, release)"
+
+    def run_tests(self):
+        if not os.getenv('DATABASE_URL'):
+            print_header(self.title)
+            print(f"{Colors.YELLOW}Skipped: DATABASE_URL is not set{Colors.END}")
+            return self.results
+        from app.database import get_db, release_db
+        self.conn, self.cursor = get_db()
+        try:
+            return super().run_tests()
+        finally:
+            self.conn.rollback()
+            release_db(self.conn, self.cursor)
+
+    def batch(self, seats):
+        self.conn.rollback()
+        self.cursor.execute("""
+            INSERT INTO batches (batch_name, total_seats, booked_seats, held_seats, price)
+            VALUES ('Unit test batch', %s, 0, 0, 1) RETURNING id
+        """, (seats,))
+        return self.cursor.fetchone()['id']
+
+    def test_last_seat_taken_once(self):
+        from app import seats
+        batch_id = self.batch(2)
+        seats.reserve(self.cursor, batch_id, 2)
+        return raises(seats.SeatsUnavailable, seats.reserve, self.cursor, batch_id, 1)
+
+    def test_unavailable_reports_free_seats(self):
+        from app import seats
+        batch_id = self.batch(3)
+        seats.reserve(self.cursor, batch_id, 2)
+        try:
+            seats.reserve(self.cursor, batch_id, 2)
+        except seats.SeatsUnavailable as e:
+            return e.available == 1 and e.requested == 2
+        return False, 'SeatsUnavailable not raised'
+
+    def test_holds_count_against_availability(self):
+        from app import seats
+        batch_id = self.batch(3)
+        seats.hold(self.cursor, batch_id, 2)
+        return raises(seats.SeatsUnavailable, seats.reserve, self.cursor, batch_id, 2)
+
+    def test_release_never_goes_negative(self):
+        from app import seats
+        batch_id = self.batch(3)
+        seats.reserve(self.cursor, batch_id, 1)
+        seats.release(self.cursor, batch_id, 5)
+        self.cursor.execute("SELECT booked_seats FROM batches WHERE id = %s", (batch_id,))
+        return self.cursor.fetchone()['booked_seats'] == 0
+
+    def test_missing_batch(self):
+        from app import seats
+        self.conn.rollback()
+        return raises(LookupError, seats.reserve, self.cursor, -1, 1)
+
+def run_all_tests():
+    print_header("🧪 HAJ TRAVEL SYSTEM - UNIT TESTS")
+    all_results = []
+
+    test_classes = [
+        ('Rooms', TestRooms()),
+        ('Installments', TestInstallments()),
+        ('Reconciliation', TestReconciliation()),
+        ('Manifests', TestManifests()),
+        ('ZipStream', TestZipStream()),
+        ('TextHelpers', TestTextHelpers()),
+        ('Seats', TestSeats()),
+    ]
+
+    for name, test_class in test_classes:
+        try:
+            results = test_class.run_tests()
+            for result in results:
+                test_name, passed, msg = result if len(result) == 3 else result + (None,)
+                all_results.append((f"{name}.{test_name}", passed, msg))
+        except Exception as e:
+            print(f"{Colors.RED}Error running {name} tests: {e}{Colors.END}")
+            all_results.append((name, False, str(e)))
+
+    print_header("📊 TEST SUMMARY")
+    total = len(all_results)
+    passed = sum(1 for _, p, _ in all_results if p)
+    failed = total - passed
+    print(f"\n{Colors.BLUE}Total Tests: {total}{Colors.END}")
+    print(f"{Colors.GREEN}Passed: {passed}{Colors.END}")
+    print(f"{Colors.RED}Failed: {failed}{Colors.END}")
+
+    if failed > 0:
+        print(f"\n{Colors.YELLOW}Failed Tests:{Colors.END}")
+        for test_name, passed, msg in all_results:
+            if not passed:
+                print(f"  {Colors.RED}✗ {test_name}{Colors.END}")
+                if msg:
+                    print(f"    {msg}")
+    return passed, failed, total
+
+def main():
+    if not os.path.exists('app/server.py'):
+        print(f"{Colors.RED}Error: Not in project root directory!{Colors.END}")
+        sys.exit(1)
+    passed, failed, total = run_all_tests()
+    sys.exit(0 if failed == 0 else 1)
+
+if __name__ == "__main__":
+    main()
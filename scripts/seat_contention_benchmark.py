@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Seat contention benchmark
+Runs many concurrent bookings against one batch through app.seats and checks
+that the batch is never oversold.
+
+A scratch batch is created with --seats seats and removed afterwards. Each
+worker thread keeps its own connection and books --group seats per attempt
+until the batch is full; with --hold-ratio some of the attempts hold seats
+instead and consume them one at a time, like a group being keyed in.
+
+    DATABASE_URL=... python scripts/seat_contention_benchmark.py --workers 32 --seats 500
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.database import get_db, release_db
+from app import seats
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+def worker(batch_id, args, stats, lock, stop):
+    conn, cursor = get_db()
+    if not conn:
+        raise SystemExit('Could not connect, is DATABASE_URL set?')
+    rng = random.Random()
+    latencies = []
+    booked = refused = 0
+    try:
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                if rng.random() < args.hold_ratio:
+                    group = seats.hold(cursor, batch_id, args.group, minutes=1, reference='benchmark')
+                    conn.commit()
+                    for _ in range(args.group):
+                        seats.consume_hold(cursor, group['id'], batch_id)
+                        conn.commit()
+                else:
+                    seats.reserve(cursor, batch_id, args.group)
+                    conn.commit()
+                booked += args.group
+            except seats.SeatsUnavailable:
+                conn.rollback()
+                refused += 1
+                cursor.execute("SELECT total_seats - booked_seats - held_seats AS free FROM batches WHERE id = %s",
+                               (batch_id,))
+                if cursor.fetchone()['free'] < args.group:
+                    stop.set()
+            latencies.append(time.perf_counter() - started)
+    finally:
+        release_db(conn, cursor)
+        with lock:
+            stats['booked'] += booked
+            stats['refused'] += refused
+            stats['latencies'].extend(latencies)
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent seat booking benchmark')
+    parser.add_argument('--workers', type=int, default=32, help='concurrent connections')
+    parser.add_argument('--seats', type=int, default=500, help='capacity of the scratch batch')
+    parser.add_argument('--group', type=int, default=1, help='seats booked per attempt')
+    parser.add_argument('--hold-ratio', type=float, default=0.0,
+                        help='share of attempts that hold then consume seats (0-1)')
+    args = parser.parse_args()
+
+    if not os.getenv('DATABASE_URL'):
+        raise SystemExit('DATABASE_URL is not set')
+
+    seats.migrate_seat_tables()
+    conn, cursor = get_db()
+    cursor.execute("""
+        INSERT INTO batches (batch_name, total_seats, booked_seats, status)
+        VALUES (%s, %s, 0, 'Closed') RETURNING id
+    """, (f'seat-benchmark-{os.getpid()}', args.seats))
+    batch_id = cursor.fetchone()['id']
+    conn.commit()
+
+    stats = {'booked': 0, 'refused': 0, 'latencies': []}
+    lock = threading.Lock()
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=worker, args=(batch_id, args, stats, lock, stop))
+        for _ in range(args.workers)
+    ]
+    started = time.perf_counter()
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        cursor.execute("SELECT total_seats, booked_seats, held_seats FROM batches WHERE id = %s", (batch_id,))
+        final = cursor.fetchone()
+    finally:
+        cursor.execute("DELETE FROM batches WHERE id = %s", (batch_id,))
+        conn.commit()
+        release_db(conn, cursor)
+
+    latencies = stats['latencies']
+    print(f"Workers:         {args.workers}")
+    print(f"Capacity:        {final['total_seats']} seats, {args.group} per attempt")
+    print(f"Booked:          {final['booked_seats']} seats ({stats['booked']} reported by workers)")
+    print(f"Still held:      {final['held_seats']}")
+    print(f"Refused:         {stats['refused']} attempts")
+    print(f"Elapsed:         {elapsed:.2f}s ({stats['booked'] / elapsed:.0f} seats/s)")
+    print(f"Latency p50/p99: {percentile(latencies, 0.5) * 1000:.1f}ms / {percentile(latencies, 0.99) * 1000:.1f}ms")
+
+    oversold = final['booked_seats'] + final['held_seats'] > final['total_seats']
+    if oversold or final['booked_seats'] != stats['booked']:
+        print("❌ Seat counts are inconsistent")
+        sys.exit(1)
+    print("✅ No overselling")
+
+if __name__ == '__main__':
+    main()